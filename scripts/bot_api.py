@@ -21,7 +21,13 @@ app = FastAPI()
 
 # 加载 tts_bot 包
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
-from tts_bot.redis_queue import rq
+from tts_bot.redis_queue import (
+    close_async_queue,
+    get_async_queue,
+    get_client,
+    require_shared_backend,
+)
+from tts_bot.reply_store import ReplyStore
 
 # 允许跨域
 app.add_middleware(
@@ -47,8 +53,20 @@ if not BOT_TOKEN:
 
 bot = Bot(token=BOT_TOKEN)
 
-# 存储完整消息
-full_messages = {}
+# 完整消息存在 Redis（分页 + TTL），bot 的按钮回调直接读取；启动时创建
+reply_store = None
+
+@app.on_event('startup')
+async def startup():
+    """事件循环启动后创建 Redis 连接（异步队列共享一个连接池）"""
+    global reply_store
+    require_shared_backend("bot_api")
+    get_async_queue()
+    reply_store = ReplyStore(get_client())
+
+@app.on_event('shutdown')
+async def shutdown():
+    await close_async_queue()
 
 class Reply(BaseModel):
     message_id: str
@@ -56,19 +74,39 @@ class Reply(BaseModel):
     chat_id: int
     full_text: str = None
 
+class Edit(BaseModel):
+    chat_id: int
+    telegram_message_id: int
+    text: str
+    full_text: str = None
+
+def detail_markup(chat_id: int, full_text: str):
+    """保存完整文本，返回"查看详情"按钮"""
+    if not full_text:
+        return None
+    reply_id = reply_store.save(full_text)
+    if reply_id is None:
+        return None
+    keyboard = [[InlineKeyboardButton("查看详情", callback_data=f"detail_{reply_id}")]]
+    return InlineKeyboardMarkup(keyboard)
+
 @app.get('/health')
-def health():
+async def health():
     """健康检查"""
-    return {'status': 'ok', 'redis': rq.ping()}
+    try:
+        return {'status': 'ok', 'redis': await get_async_queue().ping()}
+    except RuntimeError:
+        return {'status': 'ok', 'redis': False}
 
 @app.get('/messages')
-def get_messages():
+async def get_messages():
     """获取待处理的消息（从 Redis）"""
     try:
-        pending = rq.client.lrange("tts:queue:pending", 0, -1)
+        # 只读最近 24 小时的时间索引，不遍历全部消息
+        queue = get_async_queue()
+        msg_ids = await queue.recent(hours=24, limit=200)
         messages = []
-        for msg_id in pending:
-            data = rq.get(msg_id)
+        for msg_id, data in zip(msg_ids, await queue.get_many(msg_ids)):
             if data and data.get('status') == 'pending':
                 messages.append({
                     'id': msg_id,
@@ -79,6 +117,14 @@ def get_messages():
     except Exception as e:
         return {'messages': [], 'error': str(e)}
 
+@app.get('/queue/stats')
+async def queue_stats():
+    """各优先级通道的深度和等待时间"""
+    try:
+        return {'lanes': await get_async_queue().stats()}
+    except Exception as e:
+        return {'lanes': {}, 'error': str(e)}
+
 @app.post('/open_window')
 async def open_window(data: dict):
     """打开浏览器窗口"""
@@ -167,34 +213,42 @@ async def post_reply(reply: Reply):
     
     try:
         # 如果有完整文本，添加"查看详情"按钮
-        if reply.full_text:
-            msg_id = f"{reply.chat_id}_{int(asyncio.get_event_loop().time())}"
-            full_messages[msg_id] = reply.full_text
-            
-            keyboard = [[InlineKeyboardButton("查看详情", callback_data=f"detail_{msg_id}")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await bot.send_message(
-                chat_id=reply.chat_id,
-                text=reply.reply,
-                reply_markup=reply_markup
-            )
-        else:
-            await bot.send_message(
-                chat_id=reply.chat_id,
-                text=reply.reply
-            )
-        return {'success': True, 'message': 'Message sent'}
+        message = await bot.send_message(
+            chat_id=reply.chat_id,
+            text=reply.reply,
+            reply_markup=detail_markup(reply.chat_id, reply.full_text)
+        )
+        return {
+            'success': True,
+            'message': 'Message sent',
+            'telegram_message_id': message.message_id,
+        }
     except Exception as e:
         print(f"发送失败: {e}", flush=True)
         return {'success': False, 'error': str(e)}
 
+@app.post('/edit')
+async def edit_reply(edit: Edit):
+    """更新已发送的回复（流式输出时逐步替换内容）"""
+    try:
+        await bot.edit_message_text(
+            chat_id=edit.chat_id,
+            message_id=edit.telegram_message_id,
+            text=edit.text,
+            reply_markup=detail_markup(edit.chat_id, edit.full_text)
+        )
+        return {'success': True, 'message': 'Message edited'}
+    except Exception as e:
+        # 内容未变化时 Telegram 也会报错，不影响后续编辑
+        print(f"编辑失败: {e}", flush=True)
+        return {'success': False, 'error': str(e)}
+
 @app.get('/callback/{callback_data}')
 async def handle_callback(callback_data: str):
     """处理回调查询"""
     if callback_data.startswith('detail_'):
-        msg_id = callback_data.replace('detail_', '')
-        full_text = full_messages.get(msg_id, '详情已过期')
+        reply_id = callback_data.replace('detail_', '')
+        full_text = reply_store.text(reply_id) or '详情已过期'
         return {'text': full_text}
     return {'text': '未知操作'}
 
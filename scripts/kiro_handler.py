@@ -1,154 +1,316 @@
 #!/usr/bin/env python3
 """
 Kiro-CLI 回复捕获器
-轮询 tmux，检测回复完成后调 /reply API 发回用户
+订阅 tmux pane 输出驱动内存屏幕模型（控制模式）或轮询 capture-pane，检测回复完成后调 /reply API 发回用户
 """
 
 import asyncio
 import logging
 import os
 import sys
+import time
 import aiohttp
 from pathlib import Path
+from typing import List, Optional, Tuple
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from tts_bot.config import config
-from tts_bot.kiro_tmux_backend import KiroTmuxBackend
+from tts_bot.kiro_tmux_backend import AsyncKiroTmuxBackend
+from tts_bot.chat_sessions import lookup_owner
+from tts_bot.pane_stream import PaneMirror
+from tts_bot.reply_ledger import ReplyLedger
+from tts_bot.reply_parser import PROMPT_PREFIX, ReplyEvent, ReplyParser
+from tts_bot.redis_queue import (
+    close_async_queue,
+    get_async_queue,
+    require_shared_backend,
+)
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 )
 logger = logging.getLogger(__name__)
 
-DATA_DIR = os.getenv("DATA_DIR", os.path.expanduser("~/data/tts-tg-bot"))
 API_URL = f"http://localhost:{os.getenv('API_PORT', '15001')}"
 
-tmux = KiroTmuxBackend()
-last_snapshot = ""
-
-
-def get_active_chat_id() -> int:
-    try:
-        return int(open(os.path.join(DATA_DIR, "active_chat_id")).read().strip())
-    except Exception:
-        return 0
-
-
-def snapshot() -> str:
-    return tmux.capture_pane(config.win_id, max_rows=80)
-
-
-def extract_new_reply(old: str, new: str) -> str:
-    """提取最新的 kiro-cli 回复（最后一个 > 块）"""
-    new_lines = [l for l in new.strip().split("\n") if l.strip()]
-    old_lines = [l for l in old.strip().split("\n") if l.strip()]
-
-    # 找最后一个 > 开头的回复块
-    reply_lines = []
-    found = False
-    for line in reversed(new_lines):
-        s = line.strip()
-        if s.startswith("λ >") or s.startswith("▸ Credits:"):
-            if found:
-                break
-            continue
-        if s.startswith("> "):
-            reply_lines.insert(0, s[2:])
-            found = True
-        elif found:
-            # 多行回复的续行
-            reply_lines.insert(0, line.rstrip())
-
-    if not reply_lines:
-        return ""
-
-    reply = "\n".join(reply_lines).strip()
-
-    # 检查这个回复是否已经在旧内容中（避免重复发送）
-    if reply in old:
-        return ""
+# 轮询间隔（秒），仅在无法订阅输出时使用
+POLL_INTERVAL = 2
+# 收到输出后等待后续输出的合并窗口（秒）
+STREAM_SETTLE = 0.03
+# Telegram 单条消息长度上限
+TELEGRAM_LIMIT = 4096
+# 回复生成中的消息末尾标记
+STREAMING_MARK = " ⏳"
 
-    return reply
+tmux = AsyncKiroTmuxBackend()
+# redis.asyncio 客户端（共用异步队列的连接池）和回复账本，main() 在事件循环里创建
+redis_client = None
+ledger = ReplyLedger()
 
 
-def is_idle(content: str) -> bool:
-    """kiro-cli 是否空闲（最后非空行是 λ >）"""
-    for line in reversed(content.strip().split("\n")):
-        s = line.strip()
-        if not s:
-            continue
-        return s.startswith("λ >")
-    return False
+def fit_message(text: str, limit: int = TELEGRAM_LIMIT) -> str:
+    """截断到 Telegram 单条消息长度"""
+    return text if len(text) <= limit else text[:limit - 1] + "…"
 
 
-def content_changed(old: str, new: str) -> bool:
-    """比较有效内容是否变化"""
-    old_clean = [l for l in old.strip().split("\n") if l.strip()]
-    new_clean = [l for l in new.strip().split("\n") if l.strip()]
-    return old_clean != new_clean
-
-
-async def send_reply(chat_id: int, text: str):
-    """调 /reply API 发回用户"""
+async def send_reply(chat_id: int, text: str, full_text: str = None) -> Optional[int]:
+    """调 /reply API 发回用户，返回 Telegram 消息 ID"""
     try:
         async with aiohttp.ClientSession() as session:
             async with session.post(f"{API_URL}/reply", json={
                 "message_id": "",
                 "reply": text,
                 "chat_id": chat_id,
+                "full_text": full_text,
             }) as resp:
                 result = await resp.json()
                 logger.info(f"回复已发送: {result}")
+                return result.get("telegram_message_id")
     except Exception as e:
         logger.error(f"调 /reply 失败: {e}")
+        return None
 
 
-async def main():
-    global last_snapshot
+async def edit_reply(chat_id: int, message_id: int, text: str, full_text: str = None):
+    """调 /edit API 更新已发送的回复"""
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.post(f"{API_URL}/edit", json={
+                "chat_id": chat_id,
+                "telegram_message_id": message_id,
+                "text": text,
+                "full_text": full_text,
+            }) as resp:
+                result = await resp.json()
+                if not result.get("success"):
+                    logger.warning(f"编辑回复失败: {result}")
+    except Exception as e:
+        logger.error(f"调 /edit 失败: {e}")
+
+
+class ReplyStream:
+    """正在生成的回复对应的 Telegram 消息
+
+    第一次出现回复内容时发出占位消息，之后的更新合并成最多每
+    reply_edit_interval 秒一次的编辑，回复结束时做最后一次编辑。
+    """
+
+    def __init__(self, chat_id: int):
+        self.chat_id = chat_id
+        self.message_id: Optional[int] = None
+        self.latest = ""
+        self.shown = ""
+        self.last_edit = 0.0
+        # 节流定时器，刷新完成前一直保留引用；sleeping 表示还没开始刷新，可以取消
+        self._timer: Optional[asyncio.Task] = None
+        self._sleeping = False
+        # 占位消息、编辑和最终替换串行进行，回复结束后不再有中间编辑
+        self._lock = asyncio.Lock()
+        self._finished = False
+
+    async def update(self, text: str):
+        """记录最新内容，按节流间隔刷新到 Telegram"""
+        self.latest = text
+        if self._timer is not None or self._finished:
+            return
+        delay = self.last_edit + config.reply_edit_interval - time.monotonic()
+        if delay > 0:
+            self._sleeping = True
+            self._timer = asyncio.create_task(self._flush_later(delay))
+        else:
+            await self._flush()
+
+    async def _flush_later(self, delay: float):
+        try:
+            await asyncio.sleep(delay)
+            self._sleeping = False
+            await self._flush()
+        finally:
+            self._timer = None
+
+    async def _flush(self):
+        async with self._lock:
+            if self._finished or self.latest == self.shown:
+                return
+            self.last_edit = time.monotonic()
+            self.shown = self.latest
+            text = fit_message(self.latest + STREAMING_MARK)
+            if self.message_id is None:
+                self.message_id = await send_reply(self.chat_id, text)
+            else:
+                await edit_reply(self.chat_id, self.message_id, text)
+
+    async def finish(self, text: str):
+        """回复结束：替换为完整内容"""
+        self._finished = True
+        timer = self._timer
+        if timer is not None:
+            if self._sleeping:
+                timer.cancel()
+            # 已经在刷新的要等它完成，否则占位消息可能发两次、⏳ 编辑落在最终内容之后
+            await asyncio.gather(timer, return_exceptions=True)
+        async with self._lock:
+            # 超长回复截断显示，完整内容放到"查看详情"
+            full_text = text if len(text) > TELEGRAM_LIMIT else None
+            if self.message_id is None:
+                await send_reply(self.chat_id, fit_message(text), full_text)
+            else:
+                await edit_reply(
+                    self.chat_id, self.message_id, fit_message(text), full_text
+                )
+
+
+class PaneWatcher:
+    """单个 kiro-cli pane 的回复检测状态"""
+
+    def __init__(self, win_id: str):
+        self.win_id = win_id
+        self.parser = ReplyParser()
+        self.last_tail = []
+        # 最后一个已提交的非空行
+        self.last_line = ""
+        # 当前回复块的流式消息
+        self.stream: Optional[ReplyStream] = None
+
+    def is_idle(self, tail: List[str]) -> bool:
+        """kiro-cli 是否空闲（最后非空行是 λ >）"""
+        for line in reversed(tail):
+            if line.strip():
+                return line.strip().startswith(PROMPT_PREFIX)
+        return self.last_line.startswith(PROMPT_PREFIX)
+
+    def feed(self, new_lines: List[str], first_line: int) -> List[ReplyEvent]:
+        """新提交的行送入解析器，返回结束的回复块"""
+        for line in reversed(new_lines):
+            if line.strip():
+                self.last_line = line.strip()
+                break
+        return self.parser.feed(new_lines, first_line)
+
+    async def capture(self) -> Tuple[List[str], int, List[str]]:
+        """capture-pane 增量读取，返回 (新提交的行, 第一行的绝对行号, 光标行)"""
+        new_lines = await tmux.capture_delta(self.win_id)
+        history = tmux.pane_history(self.win_id)
+        # 新提交的行紧挨在光标行之前，用 pane 的绝对行号作为回复位置，重启后不变
+        first_line = (history.next_line or 0) - len(new_lines)
+        return new_lines, first_line, history.tail
+
+    async def prime(self) -> None:
+        """读入当前内容作为基线：已结束的回复只登记不发送，进行中的回复继续跟踪"""
+        new_lines, first_line, _ = await self.capture()
+        for event in self.feed(new_lines, first_line):
+            await ledger.claim(self.win_id, event.line, event.text)
+
+    async def open_stream(self) -> Optional[ReplyStream]:
+        """为新的回复块找到提问者"""
+        chat_id = await lookup_owner(redis_client, self.win_id)
+        return ReplyStream(chat_id) if chat_id else None
+
+    async def check_reply(self):
+        """capture-pane 增量读取并处理"""
+        await self.process(*await self.capture())
+
+    async def process(
+        self, new_lines: List[str], first_line: int, tail: List[str]
+    ) -> bool:
+        """回复生成中逐步更新消息，结束后发出完整回复；返回是否有回复结束
+
+        Args:
+            new_lines: 新提交的行
+            first_line: 第一行的绝对行号
+            tail: 尚未提交的行（光标所在行）
+        """
+        if not new_lines and tail == self.last_tail:
+            return False
+        self.last_tail = tail
+
+        events = self.feed(new_lines, first_line)
+        if self.is_idle(tail):
+            # 没有 Credits 行时，回复块在提示符出现时结束
+            events += self.parser.flush()
+        for event in events:
+            stream, self.stream = self.stream, None
+            if not await ledger.claim(self.win_id, event.line, event.text):
+                # 重绘或重启后重复读到的回复；已发出占位消息的仍补上最终内容
+                logger.info(f"[{self.win_id}] 跳过已发送的回复")
+                if stream is None:
+                    continue
+            elif stream is None:
+                stream = await self.open_stream()
+            if stream is None:
+                logger.warning(f"[{self.win_id}] 无归属 chat_id")
+                continue
+            logger.info(f"[{self.win_id}] 回复: {event.text[:80]}...")
+            await stream.finish(event.text)
 
-    print("=" * 50)
-    print("🔄 Kiro 回复捕获器（API 模式）")
-    print(f"🎯 win_id: {config.win_id}")
-    print(f"📡 API: {API_URL}/reply")
-    print("=" * 50)
+        if config.stream_replies:
+            partial = self.parser.preview(tail)
+            if partial:
+                if self.stream is None:
+                    self.stream = await self.open_stream()
+                if self.stream is not None:
+                    await self.stream.update(partial)
+        return bool(events)
 
-    last_snapshot = snapshot()
-    was_busy = False
 
+async def poll_loop(watchers: List[PaneWatcher]):
+    """定时轮询所有 pane"""
     while True:
         try:
-            await asyncio.sleep(2)
-
-            current = snapshot()
-            if not content_changed(last_snapshot, current):
-                continue
-
-            idle = is_idle(current)
+            await asyncio.sleep(POLL_INTERVAL)
+            for watcher in watchers:
+                await watcher.check_reply()
+        except Exception as e:
+            logger.error(f"错误: {e}")
+            await asyncio.sleep(5)
 
-            if not idle:
-                was_busy = True
-                last_snapshot = current
-                continue
 
-            if was_busy:
-                reply = extract_new_reply(last_snapshot, current)
-                if reply:
-                    chat_id = get_active_chat_id()
-                    if chat_id:
-                        logger.info(f"回复: {reply[:80]}...")
-                        await send_reply(chat_id, reply)
-                    else:
-                        logger.warning("无 active_chat_id")
-                was_busy = False
-
-            last_snapshot = current
-
-        except KeyboardInterrupt:
-            break
+async def mirror_loop(watcher: PaneWatcher, mirror: PaneMirror):
+    """屏幕内容有变化时才检测，空闲和 spinner 重绘时阻塞等待不占 CPU"""
+    while await mirror.update(STREAM_SETTLE):
+        try:
+            lines, first_line = mirror.screen.take_committed()
+            if await watcher.process(lines, first_line, mirror.screen.tail()):
+                # 回复结束：从 tmux 重建一次屏幕，纠正模型偏差
+                await mirror.sync()
         except Exception as e:
             logger.error(f"错误: {e}")
-            await asyncio.sleep(5)
+    logger.warning(f"[{watcher.win_id}] pane 输出订阅已断开")
+
+
+async def watch_pane(watcher: PaneWatcher):
+    """优先订阅输出，不可用或断开后改为轮询"""
+    if config.tmux_control_mode:
+        mirror = PaneMirror(watcher.win_id)
+        if await mirror.start():
+            try:
+                await mirror_loop(watcher, mirror)
+            finally:
+                mirror.close()
+        logger.warning(f"[{watcher.win_id}] 输出订阅不可用，改为轮询")
+
+    await poll_loop([watcher])
+
+
+async def main():
+    global redis_client, ledger
+    require_shared_backend("kiro_handler")
+    redis_client = get_async_queue().client
+    ledger = ReplyLedger(redis_client)
+    print("=" * 50)
+    print("🔄 Kiro 回复捕获器（API 模式）")
+    print(f"🎯 worker panes: {', '.join(config.worker_panes)}")
+    print(f"📡 API: {API_URL}/reply")
+    print("=" * 50)
+
+    watchers = [PaneWatcher(win_id) for win_id in config.worker_panes]
+    try:
+        for watcher in watchers:
+            await watcher.prime()
+        await asyncio.gather(*(watch_pane(w) for w in watchers))
+    finally:
+        await close_async_queue()
 
 
 if __name__ == "__main__":
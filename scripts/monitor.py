@@ -4,12 +4,16 @@ import subprocess
 import time
 import asyncio
 import aiohttp
-import json
 import os
 import re
+import sys
 
-QUEUE_DIR = os.path.expanduser("~/data/tts-tg-bot/queue")
-os.makedirs(QUEUE_DIR, exist_ok=True)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from tts_bot.coalescer import Coalescer, merge_text
+from tts_bot.redis_queue import get_async_queue
+
+# 一次最多取出的剩余消息数
+BATCH_MAX = 20
 
 # 已发送的回复记录（用索引标记位置）
 last_reply_index = -1
@@ -73,27 +77,41 @@ async def send_reply(chat_id, text, full_text=None):
         }) as resp:
             return await resp.json()
 
+async def submit_batch(queue, chat_id, items):
+    """合并后的一批消息作为一条 prompt 发送"""
+    combined = merge_text(items)
+    for _, d in items:
+        sent_requests.append(d.get('text', ''))
+    subprocess.run(['tmux', 'send-keys', '-t', '6:master.0', combined])
+    await asyncio.sleep(1)
+    subprocess.run(['tmux', 'send-keys', '-t', '6:master.0', 'Enter'])
+    for msg_id, _ in items:
+        await queue.done(msg_id)
+    print(f"批量发送: {len(items)} 条")
+
 async def process_queue():
     """处理队列"""
     global last_reply_index, sent_requests
     last_capture = ""
+    # 队列后端由 QUEUE_BACKEND 决定，空队列时等待 push 唤醒，不轮询目录
+    queue = get_async_queue()
+    # 剩余消息按 chat 合并，超过条数 / 字数上限时分批
+    # 发送失败时批内每条消息标记为 error
+    coalescer = Coalescer(
+        lambda chat_id, items: submit_batch(queue, chat_id, items), fail=queue.error
+    )
     
     while True:
+        msg_id = None
         try:
-            files = sorted([f for f in os.listdir(QUEUE_DIR) if f.endswith('.json')])
-            
-            if not files:
-                await asyncio.sleep(0.5)
+            item = await queue.pop(timeout=5)
+            if item is None:
                 continue
             
             # 处理第一条消息
-            first_file = files[0]
-            filepath = os.path.join(QUEUE_DIR, first_file)
-            with open(filepath, 'r') as f:
-                data = json.load(f)
-            
+            msg_id, data = item
             chat_id = data['chat_id']
-            user_text = data['text']
+            user_text = data.get('text', '')
             sent_requests.append(user_text)
             
             print(f"处理请求: {user_text[:30]}")
@@ -146,32 +164,21 @@ async def process_queue():
                     
                     last_reply_index = reply_obj['index']
             
-            os.remove(filepath)
+            await queue.done(msg_id)
+            msg_id = None
             
             # 处理剩余消息
-            remaining_files = sorted([f for f in os.listdir(QUEUE_DIR) if f.endswith('.json')])
-            if remaining_files:
-                texts = []
-                for f in remaining_files:
-                    fp = os.path.join(QUEUE_DIR, f)
-                    with open(fp, 'r') as file:
-                        d = json.load(file)
-                        texts.append(d['text'])
-                        sent_requests.append(d['text'])
-                    os.remove(fp)
-                
-                combined = '\n'.join(texts)
-                subprocess.run(['tmux', 'send-keys', '-t', '6:master.0', combined])
-                await asyncio.sleep(1)
-                subprocess.run(['tmux', 'send-keys', '-t', '6:master.0', 'Enter'])
-                print(f"批量发送: {len(texts)} 条")
+            for rest_id, d in await queue.pop_many(BATCH_MAX, timeout=0):
+                await coalescer.add(d.get('chat_id'), rest_id, d)
+            await coalescer.drain()
         
         except Exception as e:
             print(f"错误: {e}")
+            if msg_id:
+                await queue.error(msg_id)
             import traceback
             traceback.print_exc()
-        
-        await asyncio.sleep(0.5)
+            await asyncio.sleep(0.5)
 
 if __name__ == '__main__':
     print("🔍 监控启动")
@@ -0,0 +1,78 @@
+"""测试消息合并"""
+import asyncio
+import logging
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from tts_bot.coalescer import Coalescer, merge_text
+
+
+class TestCoalescer(unittest.TestCase):
+    """按 chat 合并片段测试"""
+
+    def run_fragments(self, fragments, **kwargs):
+        """依次加入 (chat, 文本, 间隔秒数)，返回提交的 (chat, 合并文本)"""
+        flushed = []
+
+        async def flush(key, items):
+            flushed.append((key, merge_text(items)))
+
+        async def main():
+            coalescer = Coalescer(flush, **kwargs)
+            for i, (key, text, gap) in enumerate(fragments):
+                await coalescer.add(key, f"m{i}", {"text": text})
+                await asyncio.sleep(gap)
+            await asyncio.sleep(kwargs.get("quiet", 0) * 2)
+
+        asyncio.run(main())
+        return flushed
+
+    def test_quiet_window(self):
+        """测试窗口内的片段合并，窗口外的另起一批"""
+        flushed = self.run_fragments(
+            [(1, "a", 0.01), (1, "b", 0.01), (2, "c", 0.1), (1, "d", 0)], quiet=0.05
+        )
+        self.assertEqual(flushed, [(1, "a\nb"), (2, "c"), (1, "d")])
+
+    def test_limits(self):
+        """测试达到条数或字数上限时立即提交"""
+        flushed = self.run_fragments(
+            [(1, "a", 0), (1, "b", 0), (1, "c", 0), (1, "x" * 10, 0), (1, "d", 0)],
+            quiet=0.05,
+            max_parts=2,
+            max_chars=5,
+        )
+        self.assertEqual(flushed, [(1, "a\nb"), (1, "c"), (1, "x" * 10), (1, "d")])
+
+    def test_fail(self):
+        """测试提交出错和关闭时批内每个片段都交给 fail"""
+        failed = []
+
+        async def flush(key, items):
+            raise RuntimeError("tmux 不可用")
+
+        async def fail(msg_id):
+            failed.append(msg_id)
+
+        async def main():
+            coalescer = Coalescer(flush, quiet=0.01, fail=fail)
+            await coalescer.add(1, "a", {"text": "a"})
+            await coalescer.add(1, "b", {"text": "b"})
+            await asyncio.sleep(0.05)
+            await coalescer.add(2, "c", {"text": "c"})
+            await coalescer.close()
+            await asyncio.sleep(0.05)
+
+        logging.disable(logging.ERROR)
+        try:
+            asyncio.run(main())
+        finally:
+            logging.disable(logging.NOTSET)
+        self.assertEqual(failed, ["a", "b", "c"])
+
+
+if __name__ == "__main__":
+    unittest.main()
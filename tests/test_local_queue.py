@@ -0,0 +1,131 @@
+"""测试进程内队列后端"""
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+import asyncio
+from unittest.mock import Mock, patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from tts_bot import local_queue, redis_queue
+from tts_bot.local_queue import LocalQueue
+from tts_bot.redis_queue import LANE_INTERACTIVE, dedup_key
+
+
+class TestLocalQueue(unittest.TestCase):
+    """分段日志队列测试"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.queue = LocalQueue(self.directory)
+
+    def tearDown(self):
+        self.queue.close()
+        shutil.rmtree(self.directory)
+
+    def reopen(self):
+        self.queue.close()
+        self.queue = LocalQueue(self.directory)
+
+    def test_lanes_and_dedup(self):
+        """测试 interactive 先出队，重复的 (chat_id, message_id) 不入队"""
+        self.queue.push_many([("a", {"chat_id": 1}), ("b", {"chat_id": 1})])
+        key = dedup_key(1, 9)
+        self.assertTrue(self.queue.push_once(key, "t", {}, LANE_INTERACTIVE))
+        self.assertFalse(self.queue.push_once(key, "t", {}, LANE_INTERACTIVE))
+        self.assertEqual([m for m, _ in self.queue.pop_many(3, 0)], ["t", "a", "b"])
+
+    def test_recover(self):
+        """测试重启后记录、排队顺序和处理中的消息恢复"""
+        self.queue.push_many([("a", {"text": "1"}), ("b", {"text": "2"})])
+        self.queue.push("v", {"text": ""}, lane=None)
+        self.queue.update_fields("v", text="语音", status="ready")
+        self.queue.schedule("v")
+        msg_id, _ = self.queue.pop(0)
+        self.queue.done(msg_id)
+        self.queue.pop(0)
+        self.reopen()
+        self.assertEqual(self.queue.get("a")["status"], "done")
+        self.assertEqual(self.queue.get("v")["text"], "语音")
+        # 处理中的 b 重新排在前面
+        self.assertEqual([m for m, _ in self.queue.pop_many(5, 0)], ["b", "v"])
+
+    def test_compact(self):
+        """测试旧分段中的记录被搬走后删除，数据不丢"""
+        old = local_queue.SEGMENT_BYTES
+        local_queue.SEGMENT_BYTES = 2048
+        try:
+            shutil.rmtree(self.directory)
+            self.reopen()
+            self.queue.push("keep", {"text": "k"}, lane=None)
+            for i in range(100):
+                self.queue.push(f"m{i}", {"text": "x" * 40})
+                self.queue.done(self.queue.pop(0)[0])
+        finally:
+            local_queue.SEGMENT_BYTES = old
+        segments = [n for n in os.listdir(self.directory) if n.endswith(".log")]
+        self.assertNotIn("00000000000000000000.log", segments)
+        self.reopen()
+        self.assertEqual(self.queue.get("keep")["text"], "k")
+        self.assertEqual(self.queue.get("m99")["status"], "done")
+
+
+    def test_expired_not_revived(self):
+        """测试已完成的记录过期、分段压缩后重启，旧的排队版本不会重新出队"""
+        old_bytes, old_ttl = local_queue.SEGMENT_BYTES, local_queue.MSG_TTL
+        local_queue.SEGMENT_BYTES, local_queue.MSG_TTL = 2048, 0
+        try:
+            shutil.rmtree(self.directory)
+            self.reopen()
+            self.queue.push("old", {"text": "o"})
+            self.queue.pop(0)
+            # 第一个分段里其余都是存活记录，不会被压缩
+            i = 0
+            while self.queue._active.number == 0:
+                self.queue.push(f"keep{i}", {"text": "k"}, lane=None)
+                i += 1
+            self.queue.done("old")
+            self.queue.push("scratch", {"text": ""}, lane=None)
+            while self.queue._active.number < 3:
+                self.queue.update_fields("scratch", text="s" * 40)
+        finally:
+            local_queue.SEGMENT_BYTES, local_queue.MSG_TTL = old_bytes, old_ttl
+        self.reopen()
+        self.assertIsNone(self.queue.get("old"))
+        self.assertEqual(self.queue.pop_many(5, 0), [])
+        self.assertEqual(self.queue.get("keep0")["text"], "k")
+
+
+class TestDeployment(unittest.TestCase):
+    """bot_api / bot 分进程部署时 local 后端直接拒绝启动"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_refuse_local_backend(self):
+        """测试 bot_api 和 bot 对同一日志目录启动时都给出明确错误，不占用目录"""
+        try:
+            sys.path.insert(
+                0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "scripts")
+            )
+            import bot_api
+            from tts_bot import bot
+        except ImportError as e:
+            self.skipTest(f"缺少依赖: {e}")
+        with patch.object(redis_queue, "QUEUE_BACKEND", "local"), patch.object(
+            local_queue, "LOCAL_QUEUE_DIR", self.directory
+        ):
+            for startup in (bot_api.startup(), bot.on_startup(Mock())):
+                with self.assertRaisesRegex(RuntimeError, "QUEUE_BACKEND=local"):
+                    asyncio.run(startup)
+            self.assertIsNone(redis_queue._async_queue)
+            LocalQueue(self.directory).close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+"""测试 pane 工作池分配"""
+import asyncio
+import unittest
+import sys
+import os
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from tts_bot.chat_sessions import ChatSessionMap
+from tts_bot.pane_pool import PanePool
+
+
+class IdleTmux:
+    """所有 pane 都已答完的 tmux"""
+
+    async def is_idle(self, win_id):
+        return True
+
+
+class TestPanePool(unittest.TestCase):
+    """粘性分配与会话接管测试"""
+
+    def test_no_takeover_within_session(self):
+        """测试 pane 都有未过期的会话时新 chat 等待，会话过期后才拿到 pane"""
+
+        async def main():
+            sessions = ChatSessionMap(idle_timeout=60)
+            pool = PanePool(IdleTmux(), ["%1", "%2"], sessions)
+            with patch("tts_bot.pane_pool.BUSY_GRACE", 0):
+                self.assertEqual(await pool.try_acquire(1), "%1")
+                self.assertEqual(await pool.try_acquire(2), "%2")
+                self.assertIsNone(await pool.try_acquire(3))
+                self.assertEqual(sessions.pane_of(1), "%1")
+                self.assertEqual(sessions.pane_of(2), "%2")
+                # chat 1 的会话过期，pane 被释放给新 chat
+                sessions._last_seen[1] -= 120
+                self.assertEqual(await pool.try_acquire(3), "%1")
+                self.assertIsNone(sessions.pane_of(1))
+                self.assertEqual(await pool.try_acquire(2), "%2")
+
+        asyncio.run(main())
+
+
+if __name__ == "__main__":
+    unittest.main()
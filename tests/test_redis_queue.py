@@ -0,0 +1,191 @@
+"""测试 Redis 队列记录编码"""
+import json
+import re
+import unittest
+import sys
+import os
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from tts_bot import redis_queue
+from tts_bot.redis_queue import (
+    ARCHIVE_KEY,
+    LANE_INTERACTIVE,
+    LANE_NORMAL,
+    MSG_TTL,
+    PENDING_TTL,
+    Q_PROCESSING,
+    LaneScheduler,
+    RedisQueue,
+    claim_args,
+    decode_fields,
+    dedup_key,
+    encode_fields,
+    enqueue_once_args,
+    lane_key,
+)
+
+try:
+    # 脚本行为测试需要 fakeredis[lua]，没有时跳过
+    import fakeredis
+    import lupa  # noqa: F401
+except ImportError:
+    fakeredis = None
+
+SCRIPTS = [
+    value
+    for name, value in vars(redis_queue).items()
+    if name.endswith("_SCRIPT") and isinstance(value, str)
+]
+
+
+class TestRecordFields(unittest.TestCase):
+    """hash 记录字段测试"""
+
+    def test_round_trip(self):
+        """测试编码后按字段类型还原"""
+        data = {
+            "chat_id": -1001234567890123,
+            "message_id": 5,
+            "is_text": False,
+            "text": "你好",
+            "ack_message_id": None,
+        }
+        fields = encode_fields(data)
+        self.assertNotIn("ack_message_id", fields)
+        self.assertEqual(fields["is_text"], "0")
+        del data["ack_message_id"]
+        self.assertEqual(decode_fields(fields), data)
+
+    def test_unknown_field_is_str(self):
+        """测试未声明类型的字段保持字符串"""
+        self.assertEqual(decode_fields({"status": "1"}), {"status": "1"})
+
+
+class TestLaneScheduler(unittest.TestCase):
+    """通道调度测试"""
+
+    def test_strict(self):
+        """测试 strict 总是先取 interactive"""
+        scheduler = LaneScheduler("strict")
+        for _ in range(5):
+            self.assertEqual(scheduler.order(), [LANE_INTERACTIVE, LANE_NORMAL])
+
+    def test_weighted(self):
+        """测试 weighted 按权重轮转首选通道"""
+        scheduler = LaneScheduler("weighted", {LANE_INTERACTIVE: 3, LANE_NORMAL: 1})
+        firsts = [scheduler.order()[0] for _ in range(8)]
+        self.assertEqual(firsts.count(LANE_INTERACTIVE), 6)
+        self.assertEqual(firsts.count(LANE_NORMAL), 2)
+
+
+class TestEnqueueOnce(unittest.TestCase):
+    """幂等入队参数测试"""
+
+    def test_list_target(self):
+        """测试排队到通道时带上门铃，记录字段跟在固定参数之后"""
+        data = {"chat_id": 1, "lane": LANE_NORMAL}
+        keys, args = enqueue_once_args(
+            dedup_key(1, 2), "msg_1_2", data, ("q", "list", 64)
+        )
+        self.assertEqual(keys[0], "tts:queue:seen:1:2")
+        self.assertEqual(keys[3:], ["q", "tts:queue:doorbell"])
+        self.assertEqual(args[3], "msg_1_2")
+        self.assertEqual(args[5:7], ["list", 64])
+        fields = dict(zip(args[7::2], args[8::2]))
+        self.assertEqual(fields["status"], "pending")
+        self.assertEqual(fields["chat_id"], "1")
+
+    def test_no_target(self):
+        """测试不排队时只有记录和索引"""
+        keys, args = enqueue_once_args(dedup_key(1, 2), "m", {}, None)
+        self.assertEqual(len(keys), 3)
+        self.assertEqual(args[5:7], ["", 0])
+
+
+class TestScriptKeys(unittest.TestCase):
+    """脚本 key 声明测试"""
+
+    def test_keys_declared(self):
+        """测试脚本不拼接 key，访问的 key 都经 KEYS 传入（Redis Cluster 要求）"""
+        for script in SCRIPTS:
+            self.assertIsNone(re.search(r"ARGV\[\d+\]\s*\.\.", script), script)
+
+
+@unittest.skipIf(fakeredis is None, "需要 fakeredis[lua]")
+class TestQueueScripts(unittest.TestCase):
+    """队列脚本行为测试（fakeredis）"""
+
+    def setUp(self):
+        server = fakeredis.FakeServer()
+
+        def connect(*args, **kwargs):
+            return fakeredis.FakeRedis(server=server, decode_responses=True)
+
+        with mock.patch.object(redis_queue.redis, "from_url", connect):
+            self.queue = RedisQueue(schedule="strict")
+        self.client = self.queue.client
+
+    def test_claim(self):
+        """测试按通道顺序取出、标记 processing 并累计等待统计，过期记录不留在 processing"""
+        self.queue.push_many([("a", {"text": "1"}), ("b", {"text": "2"})])
+        self.queue.push("t", {"text": "t"}, LANE_INTERACTIVE)
+        self.client.lpush(lane_key(LANE_NORMAL), "gone")
+        claimed = self.queue.pop_many(5, 0)
+        self.assertEqual([msg_id for msg_id, _ in claimed], ["t", "a", "b"])
+        self.assertTrue(all(data["status"] == "processing" for _, data in claimed))
+        self.assertEqual(self.client.lrange(Q_PROCESSING, 0, -1), ["b", "a", "t"])
+        stats = self.queue.stats()
+        self.assertEqual(stats[LANE_NORMAL]["claimed"], 2)
+        self.assertEqual(stats[LANE_NORMAL]["depth"], 0)
+        self.assertEqual(self.client.llen(lane_key(LANE_NORMAL)), 0)
+
+    def test_claim_unread_tail(self):
+        """测试队尾不是读出的候选（已被其他 worker 取走）时不取出、不标记"""
+        self.queue.push("a", {"text": "1"})
+        keys, args = claim_args([LANE_NORMAL], 1, [["other"]])
+        self.assertEqual(self.queue._claim(keys=keys, args=args), [])
+        self.assertEqual(self.client.lrange(lane_key(LANE_NORMAL), 0, -1), ["a"])
+        self.assertEqual(self.client.llen(Q_PROCESSING), 0)
+        self.assertEqual(self.queue.get("a")["status"], "pending")
+
+    def test_finish(self):
+        """测试完成时移出 processing、更新状态"""
+        self.queue.push_many([("a", {"text": "1"}), ("b", {"text": "2"})])
+        self.queue.pop_many(2, 0)
+        self.queue.done("a")
+        self.queue.error("b")
+        self.assertEqual(self.client.llen(Q_PROCESSING), 0)
+        self.assertEqual(self.queue.get("a")["status"], "done")
+        self.assertEqual(self.queue.get("b")["status"], "error")
+
+    def test_retention(self):
+        """测试新记录带 TTL 并进入时间索引，完成后缩短 TTL、精简信息写入归档"""
+        self.queue.push("a", {"text": "1", "chat_id": 7})
+        self.assertGreater(self.client.ttl("tts:msg:a"), MSG_TTL)
+        self.assertLessEqual(self.client.ttl("tts:msg:a"), PENDING_TTL)
+        self.assertEqual(self.queue.recent(1), ["a"])
+        self.queue.pop(0)
+        self.queue.done("a")
+        self.assertLessEqual(self.client.ttl("tts:msg:a"), MSG_TTL)
+        entry = json.loads(self.client.lindex(ARCHIVE_KEY, 0))
+        self.assertEqual((entry["id"], entry["status"]), ("a", "done"))
+        self.assertEqual(entry["chat_id"], "7")
+        self.assertNotIn("text", entry)
+
+    def test_enqueue_once(self):
+        """测试同一 (chat_id, message_id) 只写入和排队一次，不排队时只写记录"""
+        key = dedup_key(1, 2)
+        self.assertTrue(self.queue.push_once(key, "m", {"text": "1"}))
+        self.assertFalse(self.queue.push_once(key, "m", {"text": "改"}))
+        self.assertEqual(self.client.llen(lane_key(LANE_NORMAL)), 1)
+        self.assertEqual(self.queue.get("m")["text"], "1")
+        self.assertTrue(self.queue.push_once(dedup_key(1, 3), "v", {}, None))
+        self.assertEqual(self.client.llen(lane_key(LANE_NORMAL)), 1)
+        self.assertEqual(self.queue.get("v")["status"], "pending")
+        self.assertEqual([msg_id for msg_id, _ in self.queue.pop_many(5, 0)], ["m"])
+
+
+if __name__ == "__main__":
+    unittest.main()
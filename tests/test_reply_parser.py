@@ -0,0 +1,66 @@
+"""测试 kiro-cli 回复解析"""
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from tts_bot.reply_parser import ReplyParser
+
+TRANSCRIPT = [
+    "λ > 你好",
+    "",
+    "> 你好！有什么可以帮你？",
+    "  第二行",
+    "",
+    "▸ Credits: 0.01 • Time: 1s",
+    "",
+]
+
+
+class TestReplyParser(unittest.TestCase):
+    """回复解析测试"""
+
+    def test_reply_block(self):
+        """测试回复块在 Credits 行结束"""
+        parser = ReplyParser()
+        events = parser.feed(TRANSCRIPT)
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0].text, "你好！有什么可以帮你？\n  第二行")
+        self.assertEqual(events[0].line, 3)
+        self.assertFalse(parser.in_reply)
+
+    def test_incremental_feed(self):
+        """测试分批喂入与一次喂入结果相同，已产出的回复不会重复"""
+        parser = ReplyParser()
+        events = []
+        for line in TRANSCRIPT:
+            events += parser.feed([line])
+        self.assertEqual(events, ReplyParser().feed(TRANSCRIPT))
+        self.assertEqual(parser.feed([]), [])
+        self.assertEqual(parser.flush(), [])
+
+    def test_flush_on_prompt(self):
+        """测试没有 Credits 行时由 flush 结束回复块"""
+        parser = ReplyParser()
+        self.assertEqual(parser.feed(["λ > hi", "> hello"]), [])
+        self.assertTrue(parser.in_reply)
+        self.assertEqual(parser.partial(), "hello")
+        self.assertEqual([e.text for e in parser.flush()], ["hello"])
+
+    def test_same_text_twice(self):
+        """测试内容相同的两次回复都会产出"""
+        parser = ReplyParser()
+        events = parser.feed(TRANSCRIPT + TRANSCRIPT)
+        self.assertEqual(len(events), 2)
+        self.assertNotEqual(events[0].line, events[1].line)
+
+    def test_ignore_outside_reply(self):
+        """测试回复块之外的行被忽略"""
+        parser = ReplyParser()
+        self.assertEqual(parser.feed(["Thinking...", "λ > q", "tool output"]), [])
+        self.assertFalse(parser.in_reply)
+
+
+if __name__ == "__main__":
+    unittest.main()
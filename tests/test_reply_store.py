@@ -0,0 +1,24 @@
+"""测试长回复分页"""
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from tts_bot.reply_store import paginate
+
+
+class TestPaginate(unittest.TestCase):
+    """分页测试"""
+
+    def test_round_trip(self):
+        """测试换行处断开和硬切分的页直接拼接都能还原原文"""
+        text = "第一行文字\n" + "x" * 25 + "\n\n末尾"
+        pages = paginate(text, 10)
+        self.assertTrue(all(len(page) <= 10 for page in pages))
+        self.assertEqual(pages[0], "第一行文字\n")
+        self.assertEqual("".join(pages), text)
+
+
+if __name__ == "__main__":
+    unittest.main()
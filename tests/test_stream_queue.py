@@ -0,0 +1,88 @@
+"""测试 Redis Streams 队列后端"""
+import re
+import time
+import unittest
+import sys
+import os
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from tts_bot import redis_queue, stream_queue
+from tts_bot.redis_queue import LANE_INTERACTIVE, LANE_NORMAL
+from tts_bot.stream_queue import STREAM_GROUP, StreamQueue, stream_key
+
+try:
+    # 脚本行为测试需要 fakeredis[lua]，没有时跳过
+    import fakeredis
+    import lupa  # noqa: F401
+except ImportError:
+    fakeredis = None
+
+
+class TestScriptKeys(unittest.TestCase):
+    """脚本 key 声明测试"""
+
+    def test_keys_declared(self):
+        """测试 stream 脚本不拼接 key、不访问记录里读出的 key"""
+        scripts = [stream_queue.STREAM_CLAIM_SCRIPT, stream_queue.STREAM_FINISH_SCRIPT]
+        for script in scripts:
+            self.assertIsNone(re.search(r"ARGV\[\d+\]\s*\.\.", script))
+            self.assertNotIn("entry[1]", script)
+
+
+@unittest.skipIf(fakeredis is None, "需要 fakeredis[lua]")
+class TestStreamQueue(unittest.TestCase):
+    """消费组取出、确认和接管测试（fakeredis）"""
+
+    def setUp(self):
+        self.server = fakeredis.FakeServer()
+
+    def connect(self, consumer, claim_idle=60000):
+        def client(*args, **kwargs):
+            return fakeredis.FakeRedis(server=self.server, decode_responses=True)
+
+        with mock.patch.object(redis_queue.redis, "from_url", client):
+            return StreamQueue(
+                consumer=consumer, claim_idle=claim_idle, schedule="strict"
+            )
+
+    def pending(self, queue, lane):
+        return queue.client.xpending(stream_key(lane), STREAM_GROUP)["pending"]
+
+    def test_claim_and_finish(self):
+        """测试按通道取出并标记 processing，确认时 ack 条目所在的 stream"""
+        queue = self.connect("a")
+        queue.push("n", {"text": "1"})
+        queue.push("t", {"text": "y"}, LANE_INTERACTIVE)
+        claimed = queue.pop_many(5, 0)
+        self.assertEqual([msg_id for msg_id, _ in claimed], ["t", "n"])
+        self.assertEqual(claimed[0][1]["stream"], stream_key(LANE_INTERACTIVE))
+        self.assertEqual(queue.get("t")["status"], "processing")
+        self.assertEqual(self.pending(queue, LANE_INTERACTIVE), 1)
+        # 另一个进程确认：从记录查到条目所在的 stream
+        other = self.connect("b")
+        other.done("t")
+        queue.error("n")
+        self.assertEqual(self.pending(queue, LANE_INTERACTIVE), 0)
+        self.assertEqual(self.pending(queue, LANE_NORMAL), 0)
+        self.assertEqual(queue.get("t")["status"], "done")
+        self.assertEqual(queue.get("n")["status"], "error")
+
+    def test_reclaim(self):
+        """测试空闲超时的条目由其他 worker 接管，自己仍持有的条目不会被重复取出"""
+        crashed = self.connect("a", claim_idle=20)
+        crashed.push("m", {"text": "1"})
+        crashed.pop_many(1, 0)
+        worker = self.connect("b", claim_idle=20)
+        time.sleep(0.05)
+        self.assertEqual([msg_id for msg_id, _ in worker.pop_many(5, 0)], ["m"])
+        self.assertEqual(worker.get("m")["consumer"], "b")
+        time.sleep(0.05)
+        self.assertEqual(worker.pop_many(5, 0), [])
+        worker.done("m")
+        self.assertEqual(self.pending(worker, LANE_NORMAL), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
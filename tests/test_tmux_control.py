@@ -0,0 +1,89 @@
+"""测试 tmux 命令构造"""
+import unittest
+import sys
+import os
+import shutil
+import subprocess
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from tts_bot.kiro_tmux_backend import _submit_args
+from tts_bot.tmux_control import (
+    COMMAND_SEPARATOR,
+    TmuxControlClient,
+    build_command_line,
+    cli_args,
+)
+
+
+class TestTmuxCommand(unittest.TestCase):
+    """分隔符与用户文本区分测试"""
+
+    def test_control_line(self):
+        """测试控制模式下用户文本 ";" 被引用，只有真正的分隔符不加引号"""
+        line = build_command_line(_submit_args(";", "%1"))
+        self.assertEqual(
+            line, '"send-keys" "-t" "%1" "-l" ";" ; "send-keys" "-t" "%1" "Enter"'
+        )
+
+    def test_trailing_semicolon(self):
+        """测试子进程参数中以 ";" 结尾的文本被转义，分隔符原样保留"""
+        cases = [(";", "\\;"), ("echo a;", "echo a\\;"), ("a\\;", "a\\\\;")]
+        for text, escaped in cases:
+            args = cli_args(_submit_args(text, "%1"))
+            self.assertEqual(args[4], escaped)
+            self.assertEqual(args[5], ";")
+        self.assertEqual(cli_args(["b ; c"]), ["b ; c"])
+
+    @unittest.skipUnless(shutil.which("tmux"), "需要 tmux")
+    def test_control_round_trip(self):
+        """测试控制模式下以 "~" 开头的文本原样到达 tmux，不被展开成 home 目录"""
+        socket = os.path.join(tempfile.mkdtemp(), "sock")
+        tmux = ["tmux", "-S", socket]
+        subprocess.run(tmux + ["new-session", "-d", "-s", "t"], check=True)
+        try:
+            for text in ["~", "~/foo", "~root", "a ~b", '"~$HOME\\;']:
+                line = build_command_line(["set-buffer", "-b", "t", text])
+                subprocess.run(
+                    tmux + ["-C", "attach", "-t", "t"],
+                    input=line + "\n",
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                )
+                shown = subprocess.run(
+                    tmux + ["show-buffer", "-b", "t"],
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                )
+                self.assertEqual(shown.stdout, text)
+        finally:
+            subprocess.run(tmux + ["kill-server"], capture_output=True)
+            shutil.rmtree(os.path.dirname(socket))
+
+    @unittest.skipUnless(shutil.which("tmux"), "需要 tmux")
+    def test_failed_chain(self):
+        """测试一行命令中途出错时请求立即返回，后续请求的响应不错位"""
+        socket = os.path.join(tempfile.mkdtemp(), "sock")
+        subprocess.run(["tmux", "-S", socket, "new-session", "-d"], check=True)
+        client = TmuxControlClient(socket)
+        try:
+            self.assertTrue(client.start())
+            output, code = client.command(
+                ["capture-pane", "-p", "-t", "nope", COMMAND_SEPARATOR,
+                 "display", "-p", "b"],
+                timeout=5,
+            )
+            self.assertEqual(code, 1)
+            self.assertIn("nope", output)
+            self.assertEqual(client.command(["display", "-p", "c"]), ("c\n", 0))
+        finally:
+            client.close()
+            subprocess.run(["tmux", "-S", socket, "kill-server"], capture_output=True)
+            shutil.rmtree(os.path.dirname(socket))
+
+
+if __name__ == "__main__":
+    unittest.main()
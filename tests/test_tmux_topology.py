@@ -0,0 +1,97 @@
+"""测试 tmux 拓扑缓存"""
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from tts_bot.tmux_topology import TmuxTopology, parse_panes
+
+LIST_OUTPUT = "\n".join([
+    "$0\tkiro\t@0\t0\tmaster\t1\t%0\t0\t1\tkiro-cli",
+    "$0\tkiro\t@0\t0\tmaster\t1\t%1\t1\t0\tbash",
+    "$1\t6\t@2\t3\tmaster\t1\t%4\t0\t1\tbash",
+    "",
+])
+
+
+class TestTmuxTopology(unittest.TestCase):
+    """tmux 拓扑测试"""
+
+    def setUp(self):
+        self.calls = 0
+        # 交给 tmux 解析的目标 → tmux 返回的 pane ID
+        self.tmux = {}
+        self.asked = []
+
+        def run(args):
+            if args[0] == "capture-pane":
+                self.asked.append(args[3])
+                if args[3] in self.tmux:
+                    return "\n\n" + self.tmux[args[3]] + "\n", 0
+                return "can't find pane", 1
+            self.calls += 1
+            return LIST_OUTPUT, 0
+
+        self.topology = TmuxTopology(run)
+
+    def test_parse_panes(self):
+        """测试解析 list-panes 输出"""
+        panes = parse_panes(LIST_OUTPUT)
+        self.assertEqual(len(panes), 3)
+        self.assertEqual(panes[0].target, "kiro:0.0")
+        self.assertTrue(panes[0].pane_active)
+        self.assertFalse(panes[1].pane_active)
+
+    def test_resolve(self):
+        """测试目标解析"""
+        self.assertEqual(self.topology.resolve("kiro:master.1").pane_id, "%1")
+        self.assertEqual(self.topology.resolve("kiro:0").pane_id, "%0")
+        self.assertEqual(self.topology.resolve("6:master.0").pane_id, "%4")
+        self.assertEqual(self.topology.resolve("%4").target, "6:3.0")
+        self.assertIsNone(self.topology.resolve("nope"))
+
+    def test_resolve_passthrough(self):
+        """测试前缀、"=name"、含 "." 的名字和找不到的目标原样交给 tmux 解析"""
+        self.tmux = {"6:mas": "%4", "=kiro": "%0", "my.sess:0": "%1", "kiro": "%1"}
+        for target, pane_id in self.tmux.items():
+            self.assertEqual(self.topology.resolve(target).pane_id, pane_id)
+        self.assertIsNone(self.topology.resolve("=ki"))
+        self.assertIsNone(self.topology.resolve("kiro:master.5"))
+        self.assertEqual(
+            self.asked,
+            ["6:mas", "=kiro", "my.sess:0", "kiro", "=ki", "kiro:master.5"],
+        )
+        # 精确的 session:window.pane 和 ID 直接查缓存
+        self.assertEqual(self.topology.resolve("@2").pane_id, "%4")
+        self.assertEqual(self.topology.resolve("$0:master.1").pane_id, "%1")
+        self.assertEqual(len(self.asked), 6)
+
+    def test_resolve_new_pane(self):
+        """测试 tmux 解析出缓存里还没有的 pane 时重新加载"""
+        self.tmux = {"new": "%9"}
+        self.assertIsNone(self.topology.resolve("new"))
+        self.assertEqual(self.calls, 2)
+
+    def test_cache_and_invalidate(self):
+        """测试缓存命中与通知失效"""
+        self.topology.render_tree()
+        self.topology.resolve("kiro")
+        self.assertEqual(self.calls, 1)
+        self.topology.on_notification("%output %0 abc")
+        self.topology.resolve("kiro")
+        self.assertEqual(self.calls, 1)
+        self.topology.on_notification("%window-add @5")
+        self.topology.resolve("kiro")
+        self.assertEqual(self.calls, 2)
+
+    def test_render_tree(self):
+        """测试树状输出"""
+        tree = self.topology.render_tree()
+        self.assertIn("├── kiro", tree)
+        self.assertIn("kiro:0.1 bash", tree)
+        self.assertIn("└── 6", tree)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+"""测试 VT100 屏幕模型"""
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from tts_bot.vt_screen import VTScreen
+
+
+class TestVTScreen(unittest.TestCase):
+    """屏幕模型测试"""
+
+    def test_wrap_joined(self):
+        """测试自动折行的行提交为一个逻辑行"""
+        screen = VTScreen(10, 5)
+        screen.feed("0123456789abc\r\nnext")
+        self.assertEqual(screen.text(), "0123456789\nabc\nnext")
+        lines, first = screen.take_committed()
+        self.assertEqual(lines, ["0123456789abc"])
+        self.assertEqual(first, 0)
+        self.assertEqual(screen.tail(), ["next"])
+
+    def test_wide_chars(self):
+        """测试宽字符占两列"""
+        screen = VTScreen(5, 3)
+        screen.feed("中文字")
+        self.assertEqual(screen.text(), "中文\n字")
+
+    def test_redraw_and_erase(self):
+        """测试回车覆盖和擦除"""
+        screen = VTScreen(20, 3)
+        screen.feed("hello world\r\x1b[KXY\x1b[1;5Hz")
+        self.assertEqual(screen.text(), "XY  z")
+
+    def test_scroll_history(self):
+        """测试滚出屏幕的行进入历史，绝对行号递增"""
+        screen = VTScreen(10, 3)
+        screen.feed("a\r\nb\r\nc\r\nd\r\ne")
+        self.assertEqual(screen.text(), "c\nd\ne")
+        self.assertEqual(screen.scrolled, 2)
+        lines, first = screen.take_committed()
+        self.assertEqual((lines, first), (["a", "b", "c", "d"], 0))
+
+    def test_split_escape(self):
+        """测试跨两段输出的转义序列"""
+        screen = VTScreen(10, 3)
+        screen.feed("ab\x1b[")
+        screen.feed("2Dc")
+        self.assertEqual(screen.text(), "cb")
+
+    def test_spinner_not_changed(self):
+        """测试 spinner 原地重绘不算内容变化"""
+        screen = VTScreen(20, 3)
+        screen.feed("⠋ Thinking")
+        self.assertTrue(screen.changed())
+        screen.feed("\r⠙ Thinking")
+        self.assertFalse(screen.changed())
+        screen.feed("\r\n> reply")
+        self.assertTrue(screen.changed())
+
+    def test_restore(self):
+        """测试从 capture-pane 结果重建，光标之前的行视为已提交"""
+        screen = VTScreen(10, 3)
+        screen.restore(["old", "λ > "], 4, 1, 100)
+        self.assertEqual(screen.take_committed(), ([], 101))
+        screen.feed("hi\r\n")
+        self.assertEqual(screen.take_committed(), (["λ > hi"], 101))
+
+
+if __name__ == "__main__":
+    unittest.main()
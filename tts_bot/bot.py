@@ -13,10 +13,9 @@ import time
 import asyncio
 import subprocess
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional
 
 import edge_tts
-import aiohttp
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application,
@@ -28,8 +27,16 @@ from telegram.ext import (
 )
 
 from .config import config
-from .tmux_backend import TmuxBackend
-from .kiro_tmux_backend import KiroTmuxBackend
+from .tmux_backend import AsyncTmuxBackend
+from .kiro_tmux_backend import AsyncKiroTmuxBackend
+from .chat_sessions import ChatSessionMap
+from .dispatcher import QueueDispatcher
+from .pane_pool import PanePool
+from .pane_stream import PaneMirror
+from .reply_parser import PROMPT_PREFIX
+from .redis_queue import LANE_INTERACTIVE, LANE_NORMAL
+from .reply_ledger import advance_turn
+from .reply_store import ReplyStore
 from .stt_backend import STTBackend
 from .default_stt import DefaultSTTBackend
 
@@ -66,18 +73,127 @@ VOICES = {
 user_voices = {}
 
 # 全局实例
-tmux_backend: Optional[TmuxBackend] = None
+tmux_backend: Optional[AsyncTmuxBackend] = None
 stt_backend: Optional[STTBackend] = None
+pane_pool: Optional[PanePool] = None
+chat_sessions: Optional[ChatSessionMap] = None
+reply_store: Optional[ReplyStore] = None
+pane_mirrors: Dict[str, PaneMirror] = {}
+mirror_tasks: Dict[str, asyncio.Task] = {}
+dispatcher: Optional[QueueDispatcher] = None
+dispatch_task: Optional[asyncio.Task] = None
+
+# 方向键命令 → (tmux 按键, 说明)
+ARROW_KEYS = {
+    "left": ("LEFT", "左箭头"),
+    "right": ("RIGHT", "右箭头"),
+    "up": ("UP", "上箭头"),
+    "down": ("DOWN", "下箭头"),
+}
 
 
-def get_tmux_backend() -> TmuxBackend:
-    """获取 tmux 后端"""
+def get_tmux_backend() -> AsyncTmuxBackend:
+    """获取 tmux 后端（异步，避免阻塞事件循环）"""
     global tmux_backend
     if tmux_backend is None:
-        tmux_backend = KiroTmuxBackend()
+        tmux_backend = AsyncKiroTmuxBackend()
     return tmux_backend
 
 
+def get_chat_sessions() -> ChatSessionMap:
+    """获取 chat ↔ pane 会话映射（共用异步队列的连接池，on_startup 时从 Redis 恢复）"""
+    global chat_sessions
+    if chat_sessions is None:
+        from .redis_queue import get_async_queue
+
+        chat_sessions = ChatSessionMap(
+            get_async_queue().client, config.session_idle_timeout
+        )
+    return chat_sessions
+
+
+def get_pane_pool() -> PanePool:
+    """获取 kiro-cli pane 工作池（配置变化时重建）"""
+    global pane_pool
+    if pane_pool is None or list(pane_pool.workers) != config.worker_panes:
+        pane_pool = PanePool(
+            get_tmux_backend(), config.worker_panes, get_chat_sessions()
+        )
+    return pane_pool
+
+
+def current_pane(chat_id: int) -> str:
+    """chat 正在对话的 pane，没有时用 win_id"""
+    return get_pane_pool().pane_of(chat_id) or config.win_id
+
+
+def get_reply_store() -> ReplyStore:
+    """获取长回复详情存储"""
+    global reply_store
+    if reply_store is None:
+        from .redis_queue import get_client
+
+        reply_store = ReplyStore(get_client())
+    return reply_store
+
+
+async def detail_page(reply_id: str, index: int):
+    """详情的一页及翻页按钮，已过期返回 None"""
+    # ReplyStore 与 bot_api 共用同步客户端，放到线程里读，不阻塞事件循环
+    loop = asyncio.get_running_loop()
+    page = await loop.run_in_executor(None, get_reply_store().page, reply_id, index)
+    if page is None:
+        return None
+    text, total = page
+    if total <= 1:
+        return text, None
+    buttons = []
+    if index > 0:
+        buttons.append(
+            InlineKeyboardButton(
+                "⬅️ 上一页", callback_data=f"page_{reply_id}_{index - 1}"
+            )
+        )
+    if index < total - 1:
+        buttons.append(
+            InlineKeyboardButton(
+                "下一页 ➡️", callback_data=f"page_{reply_id}_{index + 1}"
+            )
+        )
+    return f"📄 {index + 1}/{total}\n{text}", InlineKeyboardMarkup([buttons])
+
+
+async def get_pane_mirror(win_id: str) -> Optional[PaneMirror]:
+    """pane 的内存屏幕（控制模式下首次使用时订阅输出），不可用时返回 None"""
+    if not config.tmux_control_mode:
+        return None
+    mirror = pane_mirrors.get(win_id)
+    if mirror is None:
+        mirror = PaneMirror(win_id)
+        pane_mirrors[win_id] = mirror
+        if not await mirror.start():
+            pane_mirrors.pop(win_id, None)
+            return None
+        mirror_tasks[win_id] = asyncio.create_task(follow_pane(mirror))
+    return mirror if mirror.screen is not None else None
+
+
+async def follow_pane(mirror: PaneMirror):
+    """持续更新内存屏幕，kiro-cli 回到提示符时从 tmux 重建一次"""
+    synced = True
+    try:
+        while await mirror.update():
+            lines = [l.strip() for l in mirror.screen.tail() if l.strip()]
+            idle = bool(lines) and lines[-1].startswith(PROMPT_PREFIX)
+            if idle and not synced:
+                await mirror.sync()
+            synced = idle
+    finally:
+        pane_mirrors.pop(mirror.win_id, None)
+        mirror_tasks.pop(mirror.win_id, None)
+        mirror.close()
+
+
 def get_stt_backend() -> STTBackend:
     """获取 STT 后端"""
     global stt_backend
@@ -123,6 +239,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
   /capture - 捕获 tmux 内容
   /left /right /up /down - 发送方向键
   /resize_pane <高度> - 设置窗格高度
+  /workers - 查看 kiro 工作窗格状态
 
 ⚙️ 配置管理
   /win_id - 查看当前 win_id
@@ -174,37 +291,116 @@ async def voice_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
 
-def create_a_queue_file(
-    text: str, user_id: int, chat_id: int, message_id: int, is_text: bool = False
-) -> str:
-    """创建队列消息（Redis）"""
-    from .redis_queue import rq
-    import time as _time
+async def create_a_queue_file(
+    text: str,
+    user_id: int,
+    chat_id: int,
+    message_id: int,
+    is_text: bool = False,
+    action: str = "submit",
+    lane: Optional[str] = LANE_NORMAL,
+) -> Optional[str]:
+    """创建队列消息（Redis），按 (chat_id, message_id) 幂等
 
-    msg_id = f"msg_{int(_time.time())}_{message_id}"
+    Telegram 重投的更新或重复触发的 handler 不会再入队，返回 None
+
+    Args:
+        action: 投递方式，submit 提交文本，keys 发送按键
+        lane: 优先级通道，None 表示先不排队（语音识别完成后再排队）
+    """
+    from .redis_queue import dedup_key, get_async_queue
+
+    msg_id = f"msg_{chat_id}_{message_id}"
     data = {
         "message_id": message_id,
         "chat_id": chat_id,
         "user_id": user_id,
         "text": text,
         "is_text": is_text,
+        "action": action,
+    }
+    queued = await get_async_queue().push_once(
+        dedup_key(chat_id, message_id), msg_id, data, lane
+    )
+    return msg_id if queued else None
+
+
+async def deliver_input(bot, msg_id: Optional[str], data: dict) -> bool:
+    """把队列消息投递到 kiro-cli pane，并回复发送结果"""
+    from .redis_queue import get_async_queue
+
+    chat_id = data["chat_id"]
+    text = data.get("text", "")
+    tmux = get_tmux_backend()
+    if data.get("action") == "keys":
+        success = await tmux.send_keys(text, current_pane(chat_id))
+        name = next((n for k, n in ARROW_KEYS.values() if k == text), None)
+        notice = f"✅ 已发送{name}" if name else f"✅ 已发送: {text}"
+    else:
+        # 分配 kiro-cli pane（会话映射同步到 Redis，供回复捕获器路由）
+        win_id = await get_pane_pool().acquire(chat_id, config.worker_wait_timeout)
+        if win_id is None:
+            await bot.send_message(
+                chat_id,
+                "❌ 所有 kiro 窗格都在忙，请稍后再试",
+                reply_to_message_id=data.get("message_id"),
+            )
+            return False
+        success = await tmux.submit(text, win_id)
+        if success:
+            # 新的提交轮次：回复捕获器据此区分两次内容相同的回复
+            await advance_turn(get_async_queue().client, win_id)
+        notice = "✅ 已发送"
+    await bot.send_message(
+        chat_id,
+        notice if success else "❌ 发送失败",
+        reply_to_message_id=data.get("message_id"),
+    )
+    return success
+
+
+async def enqueue_input(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    text: str,
+    action: str,
+    lane: str,
+) -> None:
+    """用户输入进入队列，由派发循环按通道优先级投递；Redis 不可用时直接投递"""
+    message = update.message
+    data = {
+        "message_id": message.message_id,
+        "chat_id": message.chat_id,
+        "text": text,
+        "action": action,
     }
-    rq.push(msg_id, data)
-    return msg_id
+    try:
+        queue_id = await create_a_queue_file(
+            text=text,
+            user_id=update.effective_user.id,
+            chat_id=message.chat_id,
+            message_id=message.message_id,
+            is_text=True,
+            action=action,
+            lane=lane,
+        )
+    except Exception as e:
+        logger.warning(f"队列不可用，直接发送: {e}")
+        await deliver_input(context.bot, None, data)
+        return
+    if queue_id is None:
+        logger.info(f"重复消息已忽略: {message.chat_id}/{message.message_id}")
 
 
 async def update_a_queue_status(
     queue_id: str, status: str, ack_message_id: int = None
 ):
     """更新队列状态（Redis）"""
-    from .redis_queue import rq
+    from .redis_queue import get_async_queue
 
-    data = rq.get(queue_id)
-    if data:
-        data["status"] = status
-        if ack_message_id:
-            data["ack_message_id"] = ack_message_id
-        rq.update(queue_id, data)
+    await get_async_queue().update_fields(
+        queue_id, status=status, ack_message_id=ack_message_id
+    )
 
 
 async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -215,15 +411,10 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
     if not text:
         return
 
-    # 检查是否为 t/n/y 决策字符
+    # 检查是否为 t/n/y 决策字符：kiro-cli 正在等待，走 interactive 通道
     if len(text) == 1 and config.is_tny_char(text):
         logger.info(f"收到 t/n/y 决策: user_id={user_id}, char={text}")
-        tmux = get_tmux_backend()
-        success = tmux.send_keys(text, config.win_id)
-        if success:
-            await update.message.reply_text(f"✅ 已发送: {text}")
-        else:
-            await update.message.reply_text(f"❌ 发送失败")
+        await enqueue_input(update, context, text, "keys", LANE_INTERACTIVE)
         return
 
     # 检查是否为特殊命令
@@ -233,19 +424,8 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     logger.info(f"收到文字消息: user_id={user_id}, text='{text[:100]}...'")
 
-    # 直接发送到 tmux（kiro 模式，不检查 thinking）
-    tmux = get_tmux_backend()
-    tmux.send_text(text, config.win_id)
-    import asyncio as _asyncio
-    await _asyncio.sleep(config.tmux_send_delay)
-    tmux.send_keys("ENTER", config.win_id)
-
-    # 记录活跃 chat_id，供回复捕获器使用
-    chat_id_file = os.path.join(DATA_DIR, "active_chat_id")
-    with open(chat_id_file, "w") as f:
-        f.write(str(update.message.chat_id))
-
-    await update.message.reply_text(f"✅ 已发送")
+    # 入队后立即返回：等待 pane 空闲不会挡住后面的 t/n/y 和方向键
+    await enqueue_input(update, context, text, "submit", LANE_NORMAL)
 
 
 async def handle_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -275,48 +455,37 @@ async def handle_special_command(
     parts = text.split()
     cmd = parts[0][1:].lower()
     args = parts[1:] if len(parts) > 1 else []
+    chat_pane = current_pane(update.message.chat_id)
 
     try:
-        if cmd == "left":
-            success = tmux.send_keys("LEFT", config.win_id)
-            await update.message.reply_text(
-                f"✅ 已发送左箭头" if success else "❌ 发送失败"
-            )
-
-        elif cmd == "right":
-            success = tmux.send_keys("RIGHT", config.win_id)
-            await update.message.reply_text(
-                f"✅ 已发送右箭头" if success else "❌ 发送失败"
-            )
-
-        elif cmd == "up":
-            success = tmux.send_keys("UP", config.win_id)
-            await update.message.reply_text(
-                f"✅ 已发送上箭头" if success else "❌ 发送失败"
-            )
-
-        elif cmd == "down":
-            success = tmux.send_keys("DOWN", config.win_id)
-            await update.message.reply_text(
-                f"✅ 已发送下箭头" if success else "❌ 发送失败"
-            )
+        if cmd in ARROW_KEYS:
+            key, _ = ARROW_KEYS[cmd]
+            await enqueue_input(update, context, key, "keys", LANE_INTERACTIVE)
 
         elif cmd == "capture":
-            content = tmux.capture_pane(config.win_id, max_rows=30)
+            mirror = await get_pane_mirror(chat_pane)
+            if mirror is not None:
+                content = mirror.screen.text(max_rows=30)
+            else:
+                content = await tmux.capture_pane(chat_pane, max_rows=30)
             escaped = content.replace("`", "\\`")
             await update.message.reply_text(f"```{escaped}```")
 
         elif cmd == "tree":
-            tree = tmux.tree_sessions()
+            tree = await tmux.tree_sessions()
             escaped = tree.replace("`", "\\`")
             await update.message.reply_text(f"```\n{escaped}\n```")
 
+        elif cmd == "workers":
+            status = get_pane_pool().status().replace("`", "\\`")
+            await update.message.reply_text(f"```\n{status}\n```")
+
         elif cmd == "resize_pane":
             if len(args) < 1:
                 await update.message.reply_text("❌ 请指定高度，例如: /resize_pane 100")
             else:
                 height = int(args[0])
-                success = tmux.resize_pane(config.win_id, height)
+                success = await tmux.resize_pane(config.win_id, height)
                 await update.message.reply_text(
                     f"✅ 窗格高度已设置为 {height}" if success else "❌ 设置失败"
                 )
@@ -332,13 +501,18 @@ async def handle_special_command(
                 )
             else:
                 new_win_id = args[0]
-                config.set_win_id(new_win_id)
-                await update.message.reply_text(
-                    f"✅ win_id 已设置为: ```{new_win_id}```"
-                )
+                if not await tmux.pane_exists(new_win_id):
+                    await update.message.reply_text(
+                        f"❌ 找不到 pane: ```{new_win_id}```，可用 /tree 查看"
+                    )
+                else:
+                    config.set_win_id(new_win_id)
+                    await update.message.reply_text(
+                        f"✅ win_id 已设置为: ```{new_win_id}```"
+                    )
 
         elif cmd == "pane_height":
-            height = tmux.get_pane_height(config.win_id)
+            height = await tmux.get_pane_height(config.win_id)
             await update.message.reply_text(f"当前窗格高度: ```{height}```")
 
         elif cmd == "cut_max_rows":
@@ -366,7 +540,7 @@ async def handle_special_command(
                 session = args[0]
                 window = args[1]
                 command = args[2] if len(args) > 2 else config.init_code
-                success = tmux.new_window(session, window, command, config.win_id)
+                success = await tmux.new_window(session, window, command, config.win_id)
                 if success:
                     new_win_id = f"{session}:{window}.0"
                     config.set_win_id(new_win_id)
@@ -383,7 +557,7 @@ async def handle_special_command(
                 )
             else:
                 win_id = args[0]
-                success = tmux.del_window(win_id)
+                success = await tmux.del_window(win_id)
                 if success:
                     await update.message.reply_text(f"✅ 已删除窗口: {win_id}")
                 else:
@@ -408,9 +582,17 @@ async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
     # 创建队列消息（识别前）
-    queue_id = create_a_queue_file(
-        text="", user_id=user_id, chat_id=chat_id, message_id=message_id, is_text=False
+    queue_id = await create_a_queue_file(
+        text="",
+        user_id=user_id,
+        chat_id=chat_id,
+        message_id=message_id,
+        is_text=False,
+        lane=None,
     )
+    if queue_id is None:
+        logger.info(f"重复语音消息已忽略: {chat_id}/{message_id}")
+        return
     logger.debug(f"创建队列消息: {queue_id}")
 
     # 发送 ACK 消息
@@ -439,12 +621,12 @@ async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.info(f"语音识别成功: text='{text}'")
 
         # 更新队列，填入识别结果
-        from .redis_queue import rq
-        data = rq.get(queue_id)
-        if data:
-            data["text"] = text
-            data["status"] = "ready"
-            rq.update(queue_id, data)
+        from .redis_queue import get_async_queue
+
+        queue = get_async_queue()
+        await queue.update_fields(queue_id, text=text, status="ready")
+        # 识别完成后排队，由派发循环发送到 kiro-cli
+        await queue.schedule(queue_id, LANE_NORMAL)
 
         # 编辑 ACK 消息为处理中
         await ack_msg.edit_text("⚙️ 处理中...")
@@ -468,16 +650,61 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     elif query.data.startswith("detail_"):
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    f"http://localhost:15001/callback/{query.data}"
-                ) as resp:
-                    result = await resp.json()
-                    full_text = result["text"]
-            await query.message.reply_text(full_text)
+            page = await detail_page(query.data[len("detail_"):], 0)
+            if page is None:
+                await query.message.reply_text("详情已过期")
+                return
+            text, markup = page
+            await query.message.reply_text(text, reply_markup=markup)
         except Exception as e:
             logger.error(f"获取详情失败: {e}")
 
+    elif query.data.startswith("page_"):
+        # page_<reply_id>_<index>：在原消息上翻页
+        try:
+            reply_id, _, index = query.data[len("page_"):].rpartition("_")
+            page = await detail_page(reply_id, int(index))
+            if page is None:
+                await query.edit_message_text("详情已过期")
+                return
+            text, markup = page
+            await query.edit_message_text(text, reply_markup=markup)
+        except Exception as e:
+            logger.error(f"翻页失败: {e}")
+
+
+async def on_startup(app: Application) -> None:
+    """事件循环启动后创建异步 Redis 队列（共享连接池）并启动派发循环"""
+    global dispatcher, dispatch_task
+    from functools import partial
+    from .redis_queue import get_async_queue, require_shared_backend
+
+    require_shared_backend("bot")
+    queue = get_async_queue()
+    if not await queue.ping():
+        logger.warning("Redis 暂不可用，队列操作将在连接恢复后生效")
+    await get_chat_sessions().load()
+    dispatcher = QueueDispatcher(
+        queue,
+        partial(deliver_input, app.bot),
+        len(config.worker_panes),
+        config.coalesce_quiet,
+        config.coalesce_max_parts,
+        config.coalesce_max_chars,
+    )
+    dispatch_task = asyncio.create_task(dispatcher.run())
+
+
+async def on_shutdown(app: Application) -> None:
+    from .redis_queue import close_async_queue
+
+    if dispatch_task is not None:
+        dispatch_task.cancel()
+        # 等派发循环把已取出的消息标记完，再关闭连接
+        await asyncio.gather(dispatch_task, return_exceptions=True)
+        await dispatcher.close()
+    await close_async_queue()
+
 
 def main():
     """启动 bot"""
@@ -522,7 +749,13 @@ def main():
     logger.info(f"📁 队列目录: {QUEUE_DIR}")
     logger.info("=" * 60)
 
-    app = Application.builder().token(TOKEN).build()
+    app = (
+        Application.builder()
+        .token(TOKEN)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
 
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("voice", voice_command))
@@ -539,6 +772,7 @@ def main():
                 "up",
                 "down",
                 "resize_pane",
+                "workers",
                 "win_id",
                 "win_id_set",
                 "pane_height",
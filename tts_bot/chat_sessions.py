@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+chat ↔ pane 会话映射
+内存中维护粘性分配，变化时镜像到 Redis，供回复捕获器按 pane 查找提问者
+"""
+
+import logging
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Redis hash：chat_id → win_id，win_id → chat_id
+SESSION_CHAT_KEY = "tts:session:chat"
+SESSION_PANE_KEY = "tts:session:pane"
+
+
+async def lookup_owner(client, win_id: str) -> int:
+    """从 Redis 查询 pane 当前归属的 chat_id，没有时返回 0（client 为 redis.asyncio 客户端）"""
+    if client is None:
+        return 0
+    try:
+        value = await client.hget(SESSION_PANE_KEY, win_id)
+        return int(value) if value else 0
+    except Exception as e:
+        logger.error(f"查询 pane 归属失败: {e}")
+        return 0
+
+
+class ChatSessionMap:
+    """chat 与 pane 的粘性映射
+
+    一个 chat 一旦分配到 pane，在空闲超过 idle_timeout 之前都留在该 pane，
+    保留 kiro-cli 的对话上下文。只有分配变化时才写 Redis，每条消息只更新内存。
+    Redis 读写用 redis.asyncio 客户端，不阻塞事件循环。
+    """
+
+    def __init__(self, client=None, idle_timeout: float = 1800.0):
+        """
+        Args:
+            client: redis.asyncio 客户端，None 表示只在内存中维护
+            idle_timeout: 会话空闲多久后释放 pane（秒）
+        """
+        self.client = client
+        self.idle_timeout = idle_timeout
+        self._chat_to_pane: Dict[int, str] = {}
+        self._pane_to_chat: Dict[str, int] = {}
+        self._last_seen: Dict[int, float] = {}
+
+    async def load(self) -> None:
+        """启动时从 Redis 恢复映射"""
+        if self.client is None:
+            return
+        try:
+            mapping = await self.client.hgetall(SESSION_CHAT_KEY)
+        except Exception as e:
+            logger.warning(f"加载会话映射失败: {e}")
+            return
+        now = time.monotonic()
+        for chat_id, win_id in mapping.items():
+            self._chat_to_pane[int(chat_id)] = win_id
+            self._pane_to_chat[win_id] = int(chat_id)
+            self._last_seen[int(chat_id)] = now
+
+    def pane_of(self, chat_id: int) -> Optional[str]:
+        """chat 当前的 pane"""
+        return self._chat_to_pane.get(chat_id)
+
+    def owner(self, win_id: str) -> int:
+        """pane 当前归属的 chat_id，没有时返回 0"""
+        return self._pane_to_chat.get(win_id, 0)
+
+    def last_seen(self, chat_id: int) -> float:
+        return self._last_seen.get(chat_id, 0.0)
+
+    def touch(self, chat_id: int) -> None:
+        """记录 chat 的活跃时间"""
+        self._last_seen[chat_id] = time.monotonic()
+
+    async def assign(self, chat_id: int, win_id: str) -> None:
+        """把 pane 分配给 chat（原归属者和 chat 原来的 pane 都被释放）"""
+        self.touch(chat_id)
+        if self._chat_to_pane.get(chat_id) == win_id:
+            return
+        previous_owner = self._pane_to_chat.get(win_id)
+        previous_pane = self._chat_to_pane.get(chat_id)
+        if previous_owner is not None:
+            self._chat_to_pane.pop(previous_owner, None)
+        if previous_pane is not None:
+            self._pane_to_chat.pop(previous_pane, None)
+        self._chat_to_pane[chat_id] = win_id
+        self._pane_to_chat[win_id] = chat_id
+        await self._mirror(
+            removed_chats=[previous_owner] if previous_owner is not None else [],
+            removed_panes=[previous_pane] if previous_pane is not None else [],
+            chat_id=chat_id,
+            win_id=win_id,
+        )
+
+    async def evict_idle(self) -> List[int]:
+        """释放空闲超时的会话，返回被释放的 chat_id"""
+        deadline = time.monotonic() - self.idle_timeout
+        expired = [c for c in self._chat_to_pane if self.last_seen(c) < deadline]
+        panes = [self._chat_to_pane.pop(c) for c in expired]
+        for win_id in panes:
+            self._pane_to_chat.pop(win_id, None)
+        if expired:
+            logger.info(f"释放空闲会话: {expired}")
+            await self._mirror(removed_chats=expired, removed_panes=panes)
+        return expired
+
+    async def _mirror(
+        self,
+        removed_chats: List[int],
+        removed_panes: List[str],
+        chat_id: Optional[int] = None,
+        win_id: Optional[str] = None,
+    ) -> None:
+        """把变化同步到 Redis（一次 pipeline）"""
+        if self.client is None:
+            return
+        try:
+            pipe = self.client.pipeline()
+            if removed_chats:
+                pipe.hdel(SESSION_CHAT_KEY, *removed_chats)
+            if removed_panes:
+                pipe.hdel(SESSION_PANE_KEY, *removed_panes)
+            if chat_id is not None:
+                pipe.hset(SESSION_CHAT_KEY, chat_id, win_id)
+                pipe.hset(SESSION_PANE_KEY, win_id, chat_id)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"同步会话映射到 Redis 失败: {e}")
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+消息合并
+用户常常连发几条短消息，逐条提交会让 kiro-cli 每条开一轮。按 chat 收集片段，
+quiet 秒内没有新片段、或条数 / 字数达到上限时，合并成一条 prompt 交给 flush
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 合并窗口（秒）：最后一个片段之后这么久没有新片段就提交
+COALESCE_QUIET = 0.25
+# 一次最多合并的片段数和字符数
+COALESCE_MAX_PARTS = 8
+COALESCE_MAX_CHARS = 4000
+
+# 片段：(msg_id, 消息数据)
+Item = Tuple[str, dict]
+# 提交函数：(chat, 按顺序的片段) → None
+Flush = Callable[[Hashable, List[Item]], Awaitable[None]]
+# 失败处理：msg_id → None（通常是 queue.error）
+Fail = Callable[[str], Awaitable[None]]
+
+
+def merge_text(items: List[Item]) -> str:
+    """片段文本按顺序以换行连接，空片段跳过"""
+    return "\n".join(
+        data.get("text", "") for _, data in items if data.get("text", "")
+    )
+
+
+class _Batch:
+    """一个 chat 正在等待合并的片段"""
+
+    def __init__(self):
+        self.items: List[Item] = []
+        self.chars = 0
+        self.timer: asyncio.Task = None
+
+
+class Coalescer:
+    """按 chat 合并连续片段
+
+    片段按到达顺序合并；上一批已满时先提交上一批，再开始新的一批。
+    """
+
+    def __init__(
+        self,
+        flush: Flush,
+        quiet: float = COALESCE_QUIET,
+        max_parts: int = COALESCE_MAX_PARTS,
+        max_chars: int = COALESCE_MAX_CHARS,
+        fail: Optional[Fail] = None,
+    ):
+        """
+        Args:
+            flush: 提交函数
+            quiet: 合并窗口（秒）
+            max_parts: 一批最多片段数
+            max_chars: 一批最多字符数（单个片段超过时单独成批）
+            fail: 提交失败或关闭时对批内每个片段调用，None 表示只记日志
+        """
+        self.flush = flush
+        self.quiet = quiet
+        self.max_parts = max_parts
+        self.max_chars = max_chars
+        self.fail = fail
+        self._batches: Dict[Hashable, _Batch] = {}
+
+    def pending(self, key: Hashable) -> int:
+        """chat 正在等待合并的片段数"""
+        batch = self._batches.get(key)
+        return len(batch.items) if batch else 0
+
+    async def add(self, key: Hashable, msg_id: str, data: dict) -> None:
+        """加入一个片段；达到上限时立即提交"""
+        size = len(data.get("text", ""))
+        batch = self._batches.get(key)
+        if batch is not None and batch.chars + size > self.max_chars:
+            await self._submit(key)
+            batch = None
+        if batch is None:
+            batch = self._batches[key] = _Batch()
+        else:
+            batch.timer.cancel()
+        batch.items.append((msg_id, data))
+        batch.chars += size
+        if len(batch.items) >= self.max_parts or batch.chars >= self.max_chars:
+            await self._submit(key)
+        else:
+            batch.timer = asyncio.create_task(self._expire(key, batch))
+
+    async def _expire(self, key: Hashable, batch: _Batch) -> None:
+        await asyncio.sleep(self.quiet)
+        # 醒来后同步取走，之后的 add 不会再取消这个任务
+        if self._batches.get(key) is batch:
+            await self._submit(key)
+
+    async def _submit(self, key: Hashable) -> None:
+        batch = self._batches.pop(key)
+        if batch.timer is not None and batch.timer is not asyncio.current_task():
+            batch.timer.cancel()
+        try:
+            await self.flush(key, batch.items)
+        except Exception as e:
+            logger.error(f"提交合并消息失败 {key}: {e}", exc_info=True)
+            await self._fail(batch.items)
+
+    async def _fail(self, items: List[Item]) -> None:
+        if self.fail is None:
+            return
+        for msg_id, _ in items:
+            try:
+                await self.fail(msg_id)
+            except Exception as e:
+                logger.error(f"标记合并消息失败 {msg_id}: {e}")
+
+    async def drain(self) -> None:
+        """立即提交所有等待中的片段"""
+        for key in list(self._batches):
+            await self._submit(key)
+
+    async def close(self) -> None:
+        """取消等待中的合并，片段不再提交，交给 fail 标记失败"""
+        batches = list(self._batches.values())
+        self._batches.clear()
+        for batch in batches:
+            if batch.timer is not None:
+                batch.timer.cancel()
+        for batch in batches:
+            await self._fail(batch.items)
@@ -19,7 +19,25 @@ class Config:
         self.cut_max_rows: Optional[int] = None
         self.init_code: str = "kiro-cli"
         self.tny_decision_chars: List[str] = ["t", "n", "y"]
+        # submit_wait_ready 开启时，等待 pane 回显输入的最长时间（秒）
         self.tmux_send_delay: float = 1.0
+        self.submit_wait_ready: bool = False
+        # 超过该长度（字符）或包含换行的消息经 tmux buffer 粘贴
+        self.paste_threshold: int = 512
+        self.paste_chunk_size: int = 16384
+        self.tmux_control_mode: bool = False
+        self.tmux_timeout: float = 5.0
+        self.worker_win_ids: List[str] = []
+        self.worker_wait_timeout: float = 30.0
+        self.session_idle_timeout: float = 1800.0
+        # 回复生成过程中逐步编辑 Telegram 消息，每个 chat 最多每 reply_edit_interval 秒一次
+        self.stream_replies: bool = True
+        self.reply_edit_interval: float = 1.0
+        # 同一 chat 连发的文本在 coalesce_quiet 秒内合并为一条 prompt（0 关闭），
+        # 一次最多合并 coalesce_max_parts 条 / coalesce_max_chars 字符
+        self.coalesce_quiet: float = 0.25
+        self.coalesce_max_parts: int = 8
+        self.coalesce_max_chars: int = 4000
         self._load()
 
     def _load(self) -> None:
@@ -36,6 +54,35 @@ class Config:
                     "tny_decision_chars", self.tny_decision_chars
                 )
                 self.tmux_send_delay = data.get("tmux_send_delay", self.tmux_send_delay)
+                self.submit_wait_ready = data.get(
+                    "submit_wait_ready", self.submit_wait_ready
+                )
+                self.paste_threshold = data.get("paste_threshold", self.paste_threshold)
+                self.paste_chunk_size = data.get(
+                    "paste_chunk_size", self.paste_chunk_size
+                )
+                self.tmux_control_mode = data.get(
+                    "tmux_control_mode", self.tmux_control_mode
+                )
+                self.tmux_timeout = data.get("tmux_timeout", self.tmux_timeout)
+                self.worker_win_ids = data.get("worker_win_ids", self.worker_win_ids)
+                self.worker_wait_timeout = data.get(
+                    "worker_wait_timeout", self.worker_wait_timeout
+                )
+                self.session_idle_timeout = data.get(
+                    "session_idle_timeout", self.session_idle_timeout
+                )
+                self.stream_replies = data.get("stream_replies", self.stream_replies)
+                self.reply_edit_interval = data.get(
+                    "reply_edit_interval", self.reply_edit_interval
+                )
+                self.coalesce_quiet = data.get("coalesce_quiet", self.coalesce_quiet)
+                self.coalesce_max_parts = data.get(
+                    "coalesce_max_parts", self.coalesce_max_parts
+                )
+                self.coalesce_max_chars = data.get(
+                    "coalesce_max_chars", self.coalesce_max_chars
+                )
             except Exception as e:
                 print(f"⚠️ 配置文件加载失败: {e}，使用默认配置")
 
@@ -50,6 +97,19 @@ class Config:
                 "init_code": self.init_code,
                 "tny_decision_chars": self.tny_decision_chars,
                 "tmux_send_delay": self.tmux_send_delay,
+                "submit_wait_ready": self.submit_wait_ready,
+                "paste_threshold": self.paste_threshold,
+                "paste_chunk_size": self.paste_chunk_size,
+                "tmux_control_mode": self.tmux_control_mode,
+                "tmux_timeout": self.tmux_timeout,
+                "worker_win_ids": self.worker_win_ids,
+                "worker_wait_timeout": self.worker_wait_timeout,
+                "session_idle_timeout": self.session_idle_timeout,
+                "stream_replies": self.stream_replies,
+                "reply_edit_interval": self.reply_edit_interval,
+                "coalesce_quiet": self.coalesce_quiet,
+                "coalesce_max_parts": self.coalesce_max_parts,
+                "coalesce_max_chars": self.coalesce_max_chars,
             }
             with open(CONFIG_PATH, "w", encoding="utf-8") as f:
                 json.dump(data, f, ensure_ascii=False, indent=2)
@@ -70,6 +130,11 @@ class Config:
         """检查字符是否为 t/n/y 决策字符"""
         return char in self.tny_decision_chars
 
+    @property
+    def worker_panes(self) -> List[str]:
+        """kiro-cli 工作 pane 列表（未配置时只有 win_id）"""
+        return self.worker_win_ids or [self.win_id]
+
     @property
     def capture_max_rows(self) -> int:
         """获取捕获最大行数（None 时默认 50）"""
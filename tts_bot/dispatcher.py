@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+队列派发
+从 Redis 队列按通道调度取出消息交给投递函数；interactive 通道（t/n/y、方向键）
+就地投递，normal 通道的消息可能要等 pane 空闲，放到后台任务里，不挡住后面的交互输入；
+同一 chat 连发的文本先经 Coalescer 合并成一条 prompt
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from .coalescer import (
+    COALESCE_MAX_CHARS,
+    COALESCE_MAX_PARTS,
+    Coalescer,
+    Item,
+    merge_text,
+)
+from .redis_queue import LANE_INTERACTIVE, AsyncRedisQueue
+
+logger = logging.getLogger(__name__)
+
+# 一次最多取出的消息数
+DISPATCH_BATCH = 8
+# 空队列时每次等待的秒数
+DISPATCH_WAIT = 5
+# 已取出但还没标记完成的消息最多条数，达到后暂停取消息（背压）
+DISPATCH_INFLIGHT = 32
+
+# 投递函数：(msg_id, data) → 是否成功
+Deliver = Callable[[str, dict], Awaitable[bool]]
+
+
+class QueueDispatcher:
+    """队列派发循环
+
+    同一 chat 的 normal 消息按入队顺序投递；不同 chat 之间并发，最多 concurrency 个。
+    合并后的一批只投递一次（回复最后一条），批内每条消息一起标记完成或失败。
+    取消息前先占用在途名额，最多 DISPATCH_INFLIGHT 条消息处于已取出未完成状态，
+    pane 忙时消息留在队列里，不会在本进程里越积越多。
+    关闭时已取出但没投递完的消息标记为失败。
+    """
+
+    def __init__(
+        self,
+        queue: AsyncRedisQueue,
+        deliver: Deliver,
+        concurrency: int = 4,
+        coalesce_quiet: float = 0.0,
+        coalesce_max_parts: int = COALESCE_MAX_PARTS,
+        coalesce_max_chars: int = COALESCE_MAX_CHARS,
+    ):
+        """
+        Args:
+            queue: 异步队列
+            deliver: 投递函数
+            concurrency: normal 消息最多同时投递的条数
+            coalesce_quiet: 文本合并窗口（秒），0 表示不合并
+            coalesce_max_parts: 一次最多合并的消息数
+            coalesce_max_chars: 一次最多合并的字符数
+        """
+        self.queue = queue
+        self.deliver = deliver
+        self._slots = asyncio.Semaphore(concurrency)
+        self._inflight = asyncio.Semaphore(DISPATCH_INFLIGHT)
+        self._chat_locks: Dict[int, asyncio.Lock] = {}
+        self._chat_waiting: Dict[int, int] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.coalescer: Optional[Coalescer] = None
+        if coalesce_quiet > 0:
+            self.coalescer = Coalescer(
+                self._submit,
+                coalesce_quiet,
+                coalesce_max_parts,
+                coalesce_max_chars,
+                self._fail,
+            )
+
+    async def run(self) -> None:
+        """派发循环，直到任务被取消"""
+        logger.info("队列派发已启动")
+        while True:
+            count = await self._reserve()
+            try:
+                items = await self.queue.pop_many(count, DISPATCH_WAIT)
+            except asyncio.CancelledError:
+                self._release(count)
+                raise
+            except Exception as e:
+                self._release(count)
+                logger.error(f"取队列消息失败: {e}")
+                await asyncio.sleep(1)
+                continue
+            self._release(count - len(items))
+            for i, (msg_id, data) in enumerate(items):
+                try:
+                    await self._dispatch(msg_id, data)
+                except asyncio.CancelledError:
+                    # 已取出但还没交出去的消息标记失败，不留在 processing
+                    await self._finish(items[i + 1:], False)
+                    raise
+
+    async def _reserve(self) -> int:
+        """占用在途名额：至少等到一个，再顺带占用空闲的，最多 DISPATCH_BATCH 个"""
+        await self._inflight.acquire()
+        count = 1
+        while count < DISPATCH_BATCH and not self._inflight.locked():
+            await self._inflight.acquire()
+            count += 1
+        return count
+
+    def _release(self, count: int) -> None:
+        for _ in range(count):
+            self._inflight.release()
+
+    async def _dispatch(self, msg_id: str, data: dict) -> None:
+        if data.get("lane") == LANE_INTERACTIVE:
+            await self._handle([(msg_id, data)])
+        elif self.coalescer is not None and data.get("action") != "keys":
+            await self.coalescer.add(data.get("chat_id"), msg_id, data)
+        else:
+            await self._submit(data.get("chat_id"), [(msg_id, data)])
+
+    async def _submit(self, chat_id: int, items: List[Item]) -> None:
+        """一批消息放到后台任务里按 chat 顺序投递"""
+        task = asyncio.create_task(self._handle_in_order(chat_id, items))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _handle_in_order(self, chat_id: int, items: List[Item]) -> None:
+        lock = self._chat_locks.setdefault(chat_id, asyncio.Lock())
+        self._chat_waiting[chat_id] = self._chat_waiting.get(chat_id, 0) + 1
+        started = False
+        try:
+            async with lock:
+                async with self._slots:
+                    started = True
+                    await self._handle(items)
+        except asyncio.CancelledError:
+            # 排队等锁 / 并发名额时被取消（投递中被取消由 _handle 处理）
+            if not started:
+                await self._finish(items, False)
+            raise
+        finally:
+            self._chat_waiting[chat_id] -= 1
+            if not self._chat_waiting[chat_id]:
+                del self._chat_waiting[chat_id]
+                del self._chat_locks[chat_id]
+
+    async def _handle(self, items: List[Item]) -> None:
+        msg_id, data = items[-1]
+        if len(items) > 1:
+            data = dict(data, text=merge_text(items))
+            logger.info(f"合并 {len(items)} 条消息: {', '.join(i for i, _ in items)}")
+        try:
+            ok = await self.deliver(msg_id, data)
+        except asyncio.CancelledError:
+            await self._finish(items, False)
+            raise
+        except Exception as e:
+            logger.error(f"投递消息失败 {msg_id}: {e}", exc_info=True)
+            ok = False
+        await self._finish(items, ok)
+
+    async def _finish(self, items: List[Item], ok: bool) -> None:
+        """批内每条消息标记完成或失败，并归还在途名额"""
+        for item_id, _ in items:
+            try:
+                if ok:
+                    await self.queue.done(item_id)
+                else:
+                    await self.queue.error(item_id)
+            except Exception as e:
+                logger.error(f"更新消息状态失败 {item_id}: {e}")
+            finally:
+                self._release(1)
+
+    async def _fail(self, msg_id: str) -> None:
+        """合并提交失败或关闭时丢弃的片段"""
+        await self._finish([(msg_id, {})], False)
+
+    async def close(self) -> None:
+        """取消等待合并的消息和进行中的投递，这些消息都标记为失败"""
+        if self.coalescer is not None:
+            await self.coalescer.close()
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -3,170 +3,496 @@
 Kiro Tmux 后端实现
 """
 
+import asyncio
+import itertools
 import os
 import subprocess
-from typing import Optional
-
-from .tmux_backend import TmuxBackend
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .tmux_backend import AsyncTmuxBackend, TmuxBackend
+from .pane_history import PROBE_FORMAT, PaneHistory, parse_metadata
+from .reply_parser import PROMPT_PREFIX
+from .tmux_control import (
+    COMMAND_SEPARATOR,
+    TmuxControlClient,
+    cli_args,
+    get_control_client,
+)
+from .tmux_topology import TmuxTopology
 from .config import config
 
 
 TMUX_SOCKET = os.environ.get("TMUX_SOCKET", "")
-TMUX_PREFIX = f"tmux -S {TMUX_SOCKET}" if TMUX_SOCKET else "tmux"
+TMUX_BASE = ["tmux", "-S", TMUX_SOCKET] if TMUX_SOCKET else ["tmux"]
+
+# 等待 pane 回显输入时的探测间隔（秒）
+READY_POLL_INTERVAL = 0.01
+
+KEY_MAP = {
+    "ENTER": "Enter",
+    "LEFT": "Left",
+    "RIGHT": "Right",
+    "UP": "Up",
+    "DOWN": "Down",
+    "CTRL+C": "C-c",
+    "CMD+C": "C-c",
+}
+
+
+def run_cmd(
+    args: List[str], timeout: Optional[float] = None, input: Optional[str] = None
+) -> tuple[str, int]:
+    """启动一个 tmux 子进程执行命令，input 写入子进程 stdin"""
+    try:
+        result = subprocess.run(
+            TMUX_BASE + cli_args(args),
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+            input=input,
+        )
+        return result.stdout, result.returncode
+    except Exception as e:
+        return str(e), 1
 
 
-def run_cmd(cmd: str) -> tuple[str, int]:
-    """执行 shell 命令"""
+async def run_cmd_async(
+    args: List[str], timeout: Optional[float] = None, input: Optional[str] = None
+) -> tuple[str, int]:
+    """异步启动一个 tmux 子进程执行命令，超时会杀掉子进程"""
     try:
-        result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-        return result.stdout, result.returncode
+        proc = await asyncio.create_subprocess_exec(
+            *TMUX_BASE,
+            *cli_args(args),
+            stdin=asyncio.subprocess.PIPE if input is not None else None,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
     except Exception as e:
         return str(e), 1
+    data = input.encode("utf-8") if input is not None else None
+    try:
+        stdout, _ = await asyncio.wait_for(proc.communicate(data), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return f"tmux 命令超时: {' '.join(args[:1])}", 1
+    return stdout.decode("utf-8", errors="replace"), proc.returncode
+
+
+def _submit_args(text: str, win_id: str) -> List[str]:
+    """字面量发送文本并回车，一次 tmux 调用完成"""
+    return [
+        "send-keys", "-t", win_id, "-l", text,
+        COMMAND_SEPARATOR, "send-keys", "-t", win_id, "Enter",
+    ]
+
+
+_buffer_ids = itertools.count()
+
+
+def _needs_paste(text: str) -> bool:
+    """多行或较长的文本走 buffer 粘贴，避免逐字符 send-keys 和换行被当作回车"""
+    return "\n" in text or len(text) >= config.paste_threshold
+
+
+def _chunks(text: str, size: int) -> List[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+def _paste_args(win_id: str, enter: bool) -> List[str]:
+    """从 stdin 载入 buffer 后以 bracketed paste 粘贴并删除 buffer"""
+    buffer = f"tts-bot-{os.getpid()}-{next(_buffer_ids)}"
+    args = [
+        "load-buffer", "-b", buffer, "-",
+        COMMAND_SEPARATOR, "paste-buffer", "-p", "-d", "-b", buffer, "-t", win_id,
+    ]
+    if enter:
+        args += [COMMAND_SEPARATOR, "send-keys", "-t", win_id, "Enter"]
+    return args
+
+
+def _tail_lines(output: str, max_rows: Optional[int]) -> str:
+    """截取最后 max_rows 行"""
+    lines = output.rstrip().split("\n")
+    if max_rows and len(lines) > max_rows:
+        lines = lines[-max_rows:]
+    return "\n".join(lines)
+
+
+def _has_thinking(output: str) -> bool:
+    return any("Thinking" in line for line in output.rstrip().split("\n"))
+
+
+def _ends_with_prompt(output: str) -> bool:
+    """最后一个非空行是否为 kiro-cli 提示符"""
+    for line in reversed(output.split("\n")):
+        if line.strip():
+            return line.strip().startswith(PROMPT_PREFIX)
+    return False
+
+
+def _parse_int(output: str) -> int:
+    try:
+        return int(output.strip())
+    except ValueError:
+        return 0
+
+
+def _literal_args(text: str, win_id: str) -> List[str]:
+    """字面量发送文本（不回车）"""
+    return ["send-keys", "-t", win_id, "-l", text]
+
+
+def _key_args(keys: str, win_id: str) -> List[str]:
+    """发送按键，KEY_MAP 中的名字转为 tmux 键名"""
+    return ["send-keys", "-t", win_id, KEY_MAP.get(keys, keys)]
+
+
+def _probe_args(win_id: str) -> List[str]:
+    """一次 display -p 读出 pane 的探测信息（光标、历史行数等）"""
+    return ["display", "-t", win_id, "-p", PROBE_FORMAT]
+
+
+def _capture_args(win_id: str, *span: str) -> List[str]:
+    """capture-pane 参数，span 为 -S / -E 等行范围"""
+    return ["capture-pane", "-t", win_id, "-p", *span]
+
+
+def _new_window_steps(session: str, window: str, command: str) -> List[List[str]]:
+    """创建新窗口、发送初始命令、回车，依次执行"""
+    target = f"{session}:{window}"
+    return [
+        ["new-window", "-t", session, "-n", window],
+        ["send-keys", "-t", target, command],
+        ["send-keys", "-t", target, "Enter"],
+    ]
+
+
+def _changed(output: str, code: int, token: str) -> Tuple[bool, str]:
+    """探测结果与上次的 token 比较 → (是否变化, 新 token)；探测失败按已变化处理"""
+    if code != 0:
+        return True, ""
+    output = output.strip()
+    return output != token, output
+
+
+def _captured(output: str, code: int, max_rows: Optional[int]) -> str:
+    """capture-pane 结果 → 最后 max_rows 行（默认 capture_max_rows）"""
+    if code != 0:
+        return f"捕获失败: {output}"
+    if max_rows is None:
+        max_rows = config.capture_max_rows
+    return _tail_lines(output, max_rows)
+
+
+class KiroTmuxBase:
+    """KiroTmuxBackend / AsyncKiroTmuxBackend 共用的状态、tmux 参数构造和输出解析
+
+    子类只负责执行命令（同步调用或 await），拓扑缓存用子类的 _run 加载。
+    """
 
+    def __init__(self, control_mode: Optional[bool] = None):
+        """
+        Args:
+            control_mode: 是否复用 tmux -C 长连接，None=使用配置 tmux_control_mode
+        """
+        if control_mode is None:
+            control_mode = config.tmux_control_mode
+        self.control_mode = control_mode
+        self.topology = TmuxTopology(self._run)
+        self._watched_client: Optional[TmuxControlClient] = None
+        self._histories: Dict[str, PaneHistory] = {}
 
-class KiroTmuxBackend(TmuxBackend):
+    def pane_history(self, win_id: str) -> PaneHistory:
+        """pane 的增量捕获状态（环形缓冲大小取 capture_max_rows）"""
+        history = self._histories.get(win_id)
+        if history is None:
+            history = PaneHistory(config.capture_max_rows)
+            self._histories[win_id] = history
+        return history
+
+    def _watch(self, client: Optional[TmuxControlClient]) -> None:
+        """新连接：用它的窗口/会话通知来失效拓扑缓存"""
+        if client is not None and client is not self._watched_client:
+            client.add_listener(self.topology.on_notification)
+            self._watched_client = client
+            self.topology.invalidate()
+
+    def _delta_args(self, win_id: str, output: str, code: int) -> Optional[List[str]]:
+        """探测结果 → 只读取新追加行的 capture-pane 参数，没有新内容时为 None"""
+        metadata = parse_metadata(output) if code == 0 else None
+        if metadata is None:
+            return None
+        history = self.pane_history(win_id)
+        if not history.changed(output.strip()):
+            return None
+        start, end = history.plan(*metadata)
+        return _capture_args(win_id, "-S", str(start), "-E", str(end))
+
+    def _delta_lines(self, win_id: str, output: str, code: int) -> List[str]:
+        """增量 capture-pane 结果 → 新提交的行"""
+        return self.pane_history(win_id).apply(output) if code == 0 else []
+
+
+class KiroTmuxBackend(KiroTmuxBase, TmuxBackend):
     """Kiro tmux 后端实现"""
 
+    def _run(self, args: List[str]) -> tuple[str, int]:
+        """执行 tmux 命令，控制模式不可用时退回子进程"""
+        if self.control_mode:
+            client = get_control_client(TMUX_SOCKET)
+            if client is not None:
+                self._watch(client)
+                return client.command(args, timeout=config.tmux_timeout)
+        return run_cmd(args, timeout=config.tmux_timeout)
+
     def send_text(self, text: str, win_id: str) -> bool:
         """发送文本到 tmux"""
-        escaped = text.replace("'", "'\\''")
-        cmd = f"{TMUX_PREFIX} send-keys -t '{win_id}' '{escaped}'"
-        output, code = run_cmd(cmd)
+        output, code = self._run(["send-keys", "-t", win_id, text])
         return code == 0
 
+    def paste_text(self, text: str, win_id: str, enter: bool = False) -> bool:
+        """经 tmux buffer 粘贴文本（按 paste_chunk_size 分块）"""
+        # load-buffer 需要 stdin，只能走子进程
+        chunks = _chunks(text, config.paste_chunk_size)
+        for i, chunk in enumerate(chunks):
+            args = _paste_args(win_id, enter and i == len(chunks) - 1)
+            output, code = run_cmd(args, timeout=config.tmux_timeout, input=chunk)
+            if code != 0:
+                return False
+        return True
+
+    def submit(self, text: str, win_id: str) -> bool:
+        """发送文本并回车"""
+        paste = _needs_paste(text)
+        if not config.submit_wait_ready:
+            if paste:
+                return self.paste_text(text, win_id, enter=True)
+            output, code = self._run(_submit_args(text, win_id))
+            return code == 0
+
+        # 等 pane 回显输入后再回车，最多等 tmux_send_delay 秒
+        _, token = self.pane_changed_since(win_id, "")
+        if paste:
+            sent = self.paste_text(text, win_id)
+        else:
+            sent = self._run(_literal_args(text, win_id))[1] == 0
+        if not sent:
+            return False
+        deadline = time.monotonic() + config.tmux_send_delay
+        while time.monotonic() < deadline:
+            changed, _ = self.pane_changed_since(win_id, token)
+            if changed:
+                break
+            time.sleep(READY_POLL_INTERVAL)
+        return self.send_keys("ENTER", win_id)
+
     def send_keys(self, keys: str, win_id: str) -> bool:
         """发送特殊按键到 tmux"""
-        key_map = {
-            "ENTER": "Enter",
-            "LEFT": "Left",
-            "RIGHT": "Right",
-            "UP": "Up",
-            "DOWN": "Down",
-            "CTRL+C": "C-c",
-            "CMD+C": "C-c",
-        }
-        key = key_map.get(keys, keys)
-        cmd = f"{TMUX_PREFIX} send-keys -t '{win_id}' '{key}'"
-        output, code = run_cmd(cmd)
+        output, code = self._run(_key_args(keys, win_id))
         return code == 0
 
     def capture_pane(self, win_id: str, max_rows: Optional[int] = None) -> str:
         """捕获 tmux pane 内容"""
-        if max_rows is None:
-            max_rows = config.capture_max_rows
-
-        cmd = f"{TMUX_PREFIX} capture-pane -t '{win_id}' -p"
-        output, code = run_cmd(cmd)
-
-        if code != 0:
-            return f"捕获失败: {output}"
-
-        lines = output.rstrip().split("\n")
+        return _captured(*self._run(_capture_args(win_id)), max_rows)
 
-        if max_rows and len(lines) > max_rows:
-            lines = lines[-max_rows:]
+    def pane_changed_since(self, win_id: str, token: str) -> Tuple[bool, str]:
+        """一次 display -p 探测 pane 是否变化"""
+        return _changed(*self._run(_probe_args(win_id)), token)
 
-        return "\n".join(lines)
+    def capture_delta(self, win_id: str) -> List[str]:
+        """增量捕获 tmux pane，只读取新追加的行"""
+        args = self._delta_args(win_id, *self._run(_probe_args(win_id)))
+        if args is None:
+            return []
+        return self._delta_lines(win_id, *self._run(args))
 
     def check_thinking(self, win_id: str) -> bool:
         """检测 AI 是否处于 Thinking 状态"""
-        output, code = run_cmd(f"{TMUX_PREFIX} capture-pane -t '{win_id}' -p -S -10")
-        if code != 0:
-            return False
-        lines = output.rstrip().split("\n")
-        return any("Thinking" in line for line in lines)
+        output, code = self._run(_capture_args(win_id, "-S", "-10"))
+        return code == 0 and _has_thinking(output)
+
+    def is_idle(self, win_id: str) -> bool:
+        """kiro-cli 是否空闲（最后非空行是 λ >）"""
+        output, code = self._run(_capture_args(win_id))
+        return code == 0 and _ends_with_prompt(output)
 
     def get_pane_height(self, win_id: str) -> int:
         """获取当前窗格高度"""
-        output, code = run_cmd(f"{TMUX_PREFIX} display -t '{win_id}' -p '#{{pane_height}}'")
-        if code == 0:
-            try:
-                return int(output.strip())
-            except ValueError:
-                pass
-        return 0
+        output, code = self._run(["display", "-t", win_id, "-p", "#{pane_height}"])
+        return _parse_int(output) if code == 0 else 0
 
     def resize_pane(self, win_id: str, height: int) -> bool:
         """设置窗格高度"""
-        cmd = f"{TMUX_PREFIX} resize-pane -t '{win_id}' -y {height}"
-        output, code = run_cmd(cmd)
+        output, code = self._run(["resize-pane", "-t", win_id, "-y", str(height)])
         return code == 0
 
     def tree_sessions(self) -> str:
         """树状显示所有 session、window、pane"""
-        output, code = run_cmd(f"{TMUX_PREFIX} list-sessions -F '#{{session_name}}' 2>/dev/null")
-        if code != 0:
-            return "没有运行中的 session"
+        return self.topology.render_tree()
 
-        sessions = [s for s in output.strip().split("\n") if s]
-        lines = []
+    def pane_exists(self, win_id: str) -> bool:
+        """目标 pane 是否存在"""
+        return self.topology.resolve(win_id) is not None
 
-        for i, session in enumerate(sessions):
-            is_last_session = i == len(sessions) - 1
-            prefix = "└──" if is_last_session else "├──"
-            lines.append(f"{prefix} {session}")
+    def new_window(self, session: str, window: str, command: str, win_id: str) -> bool:
+        """创建新窗口"""
+        for i, args in enumerate(_new_window_steps(session, window, command)):
+            _, code = self._run(args)
+            if i == 0:
+                self.topology.invalidate()
+            if code != 0:
+                return False
+        return True
 
-            # 列出 windows
-            win_output, _ = run_cmd(
-                f"{TMUX_PREFIX} list-windows -t '{session}' -F '#{{window_index}} #{{window_name}}'"
-            )
-            windows = [w for w in win_output.strip().split("\n") if w]
-
-            for j, window in enumerate(windows):
-                parts = window.split(None, 1)
-                if len(parts) < 2:
-                    continue
-                win_idx = parts[0]
-                win_name = parts[1]
-                is_last_win = j == len(windows) - 1
-                win_prefix = "└──" if is_last_win else "├──"
-                indent = "    " if is_last_session else "│   "
-                lines.append(f"{indent}{win_prefix} {win_idx} {win_name}")
-
-                # 列出 panes
-                pane_output, _ = run_cmd(
-                    f"{TMUX_PREFIX} list-panes -t '{session}:{win_idx}' -F '#{{pane_index}} #{{pane_current_command}}'"
-                )
-                panes = [p for p in pane_output.strip().split("\n") if p]
-
-                for k, pane in enumerate(panes):
-                    parts = pane.split(None, 1)
-                    if len(parts) < 2:
-                        continue
-                    pane_idx = parts[0]
-                    pane_cmd = parts[1]
-                    is_last_pane = k == len(panes) - 1
-                    pane_prefix = "└──" if is_last_pane else "├──"
-                    pane_indent = "    " if is_last_win else "│   "
-                    pane_id = f"{session}:{win_idx}.{pane_idx}"
-                    lines.append(
-                        f"{indent}{pane_indent}{pane_prefix} {pane_id} {pane_cmd}"
+    def del_window(self, win_id: str) -> bool:
+        """删除窗口"""
+        output, code = self._run(["kill-window", "-t", win_id])
+        self.topology.invalidate()
+        return code == 0
+
+
+class AsyncKiroTmuxBackend(KiroTmuxBase, AsyncTmuxBackend):
+    """Kiro tmux 异步后端实现
+
+    每次调用都有超时（config.tmux_timeout），不会阻塞事件循环。
+    """
+
+    async def _get_client(self) -> Optional[TmuxControlClient]:
+        client = self._watched_client
+        if client is not None and client.alive:
+            return client
+        # 首次连接需要等待 tmux 响应，放到线程里做
+        loop = asyncio.get_running_loop()
+        client = await loop.run_in_executor(None, get_control_client, TMUX_SOCKET)
+        self._watch(client)
+        return client
+
+    async def _run(self, args: List[str]) -> tuple[str, int]:
+        """执行 tmux 命令，控制模式不可用时退回子进程"""
+        timeout = config.tmux_timeout
+        if self.control_mode:
+            client = await self._get_client()
+            if client is not None:
+                try:
+                    return await asyncio.wait_for(
+                        asyncio.wrap_future(client.submit(args)), timeout
                     )
+                except asyncio.TimeoutError:
+                    return f"tmux 命令超时: {' '.join(args[:1])}", 1
+        return await run_cmd_async(args, timeout=timeout)
 
-        return "\n".join(lines)
+    async def send_text(self, text: str, win_id: str) -> bool:
+        """发送文本到 tmux"""
+        output, code = await self._run(["send-keys", "-t", win_id, text])
+        return code == 0
 
-    def new_window(self, session: str, window: str, command: str, win_id: str) -> bool:
-        """创建新窗口"""
-        # 创建新窗口
-        cmd1 = f"{TMUX_PREFIX} new-window -t '{session}' -n '{window}'"
-        _, code1 = run_cmd(cmd1)
-        if code1 != 0:
+    async def paste_text(self, text: str, win_id: str, enter: bool = False) -> bool:
+        """经 tmux buffer 粘贴文本（按 paste_chunk_size 分块）"""
+        # load-buffer 需要 stdin，只能走子进程
+        chunks = _chunks(text, config.paste_chunk_size)
+        for i, chunk in enumerate(chunks):
+            args = _paste_args(win_id, enter and i == len(chunks) - 1)
+            output, code = await run_cmd_async(
+                args, timeout=config.tmux_timeout, input=chunk
+            )
+            if code != 0:
+                return False
+        return True
+
+    async def submit(self, text: str, win_id: str) -> bool:
+        """发送文本并回车"""
+        paste = _needs_paste(text)
+        if not config.submit_wait_ready:
+            if paste:
+                return await self.paste_text(text, win_id, enter=True)
+            output, code = await self._run(_submit_args(text, win_id))
+            return code == 0
+
+        # 等 pane 回显输入后再回车，最多等 tmux_send_delay 秒
+        _, token = await self.pane_changed_since(win_id, "")
+        if paste:
+            sent = await self.paste_text(text, win_id)
+        else:
+            sent = (await self._run(_literal_args(text, win_id)))[1] == 0
+        if not sent:
             return False
+        deadline = time.monotonic() + config.tmux_send_delay
+        while time.monotonic() < deadline:
+            changed, _ = await self.pane_changed_since(win_id, token)
+            if changed:
+                break
+            await asyncio.sleep(READY_POLL_INTERVAL)
+        return await self.send_keys("ENTER", win_id)
+
+    async def send_keys(self, keys: str, win_id: str) -> bool:
+        """发送特殊按键到 tmux"""
+        output, code = await self._run(_key_args(keys, win_id))
+        return code == 0
 
-        # 发送初始命令
-        cmd2 = f"{TMUX_PREFIX} send-keys -t '{session}:{window}' '{command}'"
-        _, code2 = run_cmd(cmd2)
-        if code2 != 0:
-            return False
+    async def capture_pane(self, win_id: str, max_rows: Optional[int] = None) -> str:
+        """捕获 tmux pane 内容"""
+        return _captured(*await self._run(_capture_args(win_id)), max_rows)
 
-        # 发送回车
-        cmd3 = f"{TMUX_PREFIX} send-keys -t '{session}:{window}' 'Enter'"
-        _, code3 = run_cmd(cmd3)
+    async def pane_changed_since(self, win_id: str, token: str) -> Tuple[bool, str]:
+        """一次 display -p 探测 pane 是否变化"""
+        return _changed(*await self._run(_probe_args(win_id)), token)
 
-        return code3 == 0
+    async def capture_delta(self, win_id: str) -> List[str]:
+        """增量捕获 tmux pane，只读取新追加的行"""
+        args = self._delta_args(win_id, *await self._run(_probe_args(win_id)))
+        if args is None:
+            return []
+        return self._delta_lines(win_id, *await self._run(args))
 
-    def del_window(self, win_id: str) -> bool:
+    async def check_thinking(self, win_id: str) -> bool:
+        """检测 AI 是否处于 Thinking 状态"""
+        output, code = await self._run(_capture_args(win_id, "-S", "-10"))
+        return code == 0 and _has_thinking(output)
+
+    async def is_idle(self, win_id: str) -> bool:
+        """kiro-cli 是否空闲（最后非空行是 λ >）"""
+        output, code = await self._run(_capture_args(win_id))
+        return code == 0 and _ends_with_prompt(output)
+
+    async def get_pane_height(self, win_id: str) -> int:
+        """获取当前窗格高度"""
+        output, code = await self._run(
+            ["display", "-t", win_id, "-p", "#{pane_height}"]
+        )
+        return _parse_int(output) if code == 0 else 0
+
+    async def resize_pane(self, win_id: str, height: int) -> bool:
+        """设置窗格高度"""
+        output, code = await self._run(
+            ["resize-pane", "-t", win_id, "-y", str(height)]
+        )
+        return code == 0
+
+    async def tree_sessions(self) -> str:
+        """树状显示所有 session、window、pane"""
+        return self.topology.render_tree(await self.topology.panes_async())
+
+    async def pane_exists(self, win_id: str) -> bool:
+        """目标 pane 是否存在"""
+        return await self.topology.resolve_async(win_id) is not None
+
+    async def new_window(
+        self, session: str, window: str, command: str, win_id: str
+    ) -> bool:
+        """创建新窗口"""
+        for i, args in enumerate(_new_window_steps(session, window, command)):
+            _, code = await self._run(args)
+            if i == 0:
+                self.topology.invalidate()
+            if code != 0:
+                return False
+        return True
+
+    async def del_window(self, win_id: str) -> bool:
         """删除窗口"""
-        cmd = f"{TMUX_PREFIX} kill-window -t '{win_id}'"
-        output, code = run_cmd(cmd)
+        output, code = await self._run(["kill-window", "-t", win_id])
+        self.topology.invalidate()
         return code == 0
@@ -0,0 +1,709 @@
+#!/usr/bin/env python3
+"""
+进程内队列后端（单机部署，不依赖 Redis）
+消息记录以追加方式写入分段日志：分段文件预分配、pwrite 追加、mmap 读取；内存里只保留
+msg_id → (分段, 偏移) 索引和各通道的排队顺序。fsync 按条数 / 时间合并，旧分段里存活
+的记录过少时搬到当前分段后删除。启动时重放日志恢复索引和队列。
+"""
+
+import asyncio
+import atexit
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .redis_queue import (
+    DEDUP_TTL,
+    LANE_NORMAL,
+    LANES,
+    MSG_TTL,
+    PENDING_TTL,
+    LaneScheduler,
+    _now,
+    _now_ms,
+    lane_stats,
+    new_record,
+)
+
+logger = logging.getLogger(__name__)
+
+# 日志目录（同一时间只能被一个进程打开）
+LOCAL_QUEUE_DIR = os.path.expanduser(
+    os.getenv("LOCAL_QUEUE_DIR", "~/data/tts-tg-bot/queue-log")
+)
+# 分段大小（字节），写满后换新分段
+SEGMENT_BYTES = int(os.getenv("LOCAL_QUEUE_SEGMENT_BYTES", 8 << 20))
+# fsync 合并：最多间隔 FSYNC_INTERVAL 秒，或积累 FSYNC_BATCH 条后立即 fsync
+FSYNC_INTERVAL = int(os.getenv("LOCAL_QUEUE_FSYNC_MS", 50)) / 1000
+FSYNC_BATCH = 64
+# 已封存分段中存活记录占比低于此值时压缩
+COMPACT_RATIO = 0.5
+
+# 条目头：载荷长度、CRC32；长度为 0 表示已写部分到此结束（预分配的空白）
+HEADER = struct.Struct("<II")
+SEGMENT_SUFFIX = ".log"
+
+# 结束状态；其余已排队的记录（包括处理中的）重启后重新排队
+FINISHED_STATUSES = ("done", "error")
+
+
+class Segment:
+    """日志分段：pwrite 追加，mmap 读取
+
+    当前分段按 capacity 预分配，映射一次即可读到之后追加的内容；换分段时截断到
+    实际长度。
+    """
+
+    def __init__(self, directory: str, number: int, capacity: int = None):
+        """
+        Args:
+            directory: 日志目录
+            number: 分段编号（重放顺序）
+            capacity: 预分配大小，None 表示已封存的分段按文件实际大小打开
+        """
+        self.number = number
+        self.path = os.path.join(directory, f"{number:020d}{SEGMENT_SUFFIX}")
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if capacity is not None and os.fstat(self.fd).st_size < capacity:
+            os.ftruncate(self.fd, capacity)
+        self.end = 0
+        self.closed = False
+        self._map()
+
+    def _map(self) -> None:
+        self.capacity = os.fstat(self.fd).st_size
+        self.view = (
+            mmap.mmap(self.fd, self.capacity, access=mmap.ACCESS_READ)
+            if self.capacity
+            else None
+        )
+
+    def scan(self) -> Iterator[Tuple[int, int, dict]]:
+        """依次读出完整的条目 (偏移, 长度, 条目)，遇到空白或损坏的条目停止"""
+        offset = 0
+        while offset + HEADER.size <= self.capacity:
+            length, crc = HEADER.unpack_from(self.view, offset)
+            start = offset + HEADER.size
+            if length == 0 or start + length > self.capacity:
+                break
+            payload = self.view[start:start + length]
+            if zlib.crc32(payload) != crc:
+                logger.warning(f"日志条目校验失败，截断: {self.path}@{offset}")
+                break
+            yield offset, HEADER.size + length, json.loads(payload)
+            offset = start + length
+            self.end = offset
+        self.end = offset
+
+    def reset_tail(self) -> None:
+        """清零已写部分之后的内容（崩溃时可能留下半条或乱序落盘的条目）"""
+        if self.end < self.capacity:
+            os.ftruncate(self.fd, self.end)
+            os.ftruncate(self.fd, self.capacity)
+
+    def room(self, size: int) -> bool:
+        return self.end + size <= self.capacity
+
+    def append(self, buf: bytes) -> int:
+        """追加一条，返回偏移"""
+        offset = self.end
+        os.pwrite(self.fd, buf, offset)
+        self.end += len(buf)
+        return offset
+
+    def read(self, offset: int, size: int) -> dict:
+        return json.loads(self.view[offset + HEADER.size:offset + size])
+
+    def seal(self) -> None:
+        """不再写入：fsync 后截断预分配的空白并重新映射"""
+        os.fsync(self.fd)
+        if self.view is not None:
+            self.view.close()
+        os.ftruncate(self.fd, self.end)
+        self._map()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        if self.view is not None:
+            self.view.close()
+        os.close(self.fd)
+
+
+class Slot:
+    """索引项：记录最新版本在日志中的位置，以及排队和过期需要的元数据"""
+
+    def __init__(self, segment: int, offset: int, size: int, entry: dict):
+        self.segment = segment
+        self.offset = offset
+        self.size = size
+        self.ts = entry["ts"]
+        self.expires = entry["exp"]
+        self.seq = entry.get("seq")
+        self.seen = entry.get("seen")
+        data = entry["data"]
+        self.status = data.get("status")
+        self.lane = data.get("lane")
+        self.queued_ms = data.get("queued_ms")
+
+    def entry(self, msg_id: str, data: dict, **changes) -> dict:
+        """以当前元数据为基础的新版本条目"""
+        entry = {
+            "id": msg_id,
+            "ts": self.ts,
+            "exp": self.expires,
+            "seq": self.seq,
+            "seen": self.seen,
+            "data": data,
+        }
+        entry.update(changes)
+        return entry
+
+
+def _pack(entry: dict) -> bytes:
+    payload = json.dumps(entry, ensure_ascii=False, separators=(",", ":")).encode()
+    return HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def _compact_fields(data: dict) -> dict:
+    """与 Redis 后端一致：值为 None 的字段不保存"""
+    return {key: value for key, value in data.items() if value is not None}
+
+
+class LocalQueue:
+    """进程内消息队列，接口与 RedisQueue 相同
+
+    所有状态由一把锁保护，可在多个线程中使用；空队列的 pop 在条件变量上等待，
+    push 时按 FIFO 顺序唤醒。日志目录同一时间只能被一个进程打开。
+    """
+
+    # 没有 Redis 连接：会话映射、回复台账等退回内存模式
+    client = None
+
+    def __init__(self, directory: str = None, schedule: str = None):
+        """
+        Args:
+            directory: 日志目录，默认 LOCAL_QUEUE_DIR
+            schedule: 通道调度方式 strict / weighted，默认 QUEUE_SCHEDULE
+        """
+        self.directory = directory or LOCAL_QUEUE_DIR
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock_file = open(os.path.join(self.directory, "LOCK"), "w")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock_file.close()
+            raise RuntimeError(f"本地队列目录已被其他进程使用: {self.directory}")
+        self.scheduler = LaneScheduler(schedule)
+        self._cond = threading.Condition()
+        self._segments: Dict[int, Segment] = {}
+        self._index: Dict[str, Slot] = {}
+        # 每个分段中仍被索引引用的字节数（决定是否压缩）
+        self._live: Dict[int, int] = {}
+        self._lanes: Dict[str, Deque[str]] = {lane: deque() for lane in LANES}
+        self._processing = set()
+        self._seen: Dict[str, float] = {}
+        self._counters: Dict[str, int] = {}
+        self._listeners: List[Callable[[], None]] = []
+        self._seq = 0
+        self._compacting = False
+        self._closed = False
+        self._recover()
+        # fsync 在后台线程里合并进行，不阻塞入队
+        self._unsynced = 0
+        self._sync_lock = threading.Lock()
+        self._sync_wake = threading.Event()
+        self._sync_thread = threading.Thread(
+            target=self._sync_loop, name="local-queue-fsync", daemon=True
+        )
+        self._sync_thread.start()
+        atexit.register(self.close)
+
+    def _recover(self) -> None:
+        """重放全部分段，重建索引、去重标记和各通道的排队顺序"""
+        numbers = sorted(
+            int(name[: -len(SEGMENT_SUFFIX)])
+            for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX) and name[: -len(SEGMENT_SUFFIX)].isdigit()
+        )
+        for number in numbers:
+            last = number == numbers[-1]
+            segment = Segment(self.directory, number, SEGMENT_BYTES if last else None)
+            self._segments[number] = segment
+            self._live[number] = 0
+            for offset, size, entry in segment.scan():
+                self._index_entry(Slot(number, offset, size, entry), entry["id"])
+            if last:
+                segment.reset_tail()
+        if not numbers:
+            self._segments[0] = Segment(self.directory, 0, SEGMENT_BYTES)
+            self._live[0] = 0
+        self._active = self._segments[max(self._segments)]
+
+        now = time.time()
+        queued, requeued = [], 0
+        for msg_id, slot in list(self._index.items()):
+            if slot.expires <= now:
+                self._forget(msg_id)
+            elif (
+                slot.lane
+                and slot.seq is not None
+                and slot.status not in FINISHED_STATUSES
+            ):
+                queued.append((slot.seq, msg_id, slot.lane))
+                requeued += slot.status == "processing"
+        for seq, msg_id, lane in sorted(queued):
+            self._lanes.setdefault(lane, deque()).append(msg_id)
+        self._seq = max((slot.seq or 0 for slot in self._index.values()), default=0)
+        if self._index:
+            logger.info(
+                f"本地队列已恢复: {len(self._index)} 条记录, {len(queued)} 条排队"
+                + (f"（{requeued} 条处理中的重新排队）" if requeued else "")
+            )
+
+    def _index_entry(self, slot: Slot, msg_id: str) -> Slot:
+        old = self._index.get(msg_id)
+        if old is not None:
+            self._live[old.segment] -= old.size
+        self._index[msg_id] = slot
+        self._live[slot.segment] += slot.size
+        if slot.seen:
+            self._seen[slot.seen] = slot.ts + DEDUP_TTL
+        return slot
+
+    def _write(self, entry: dict) -> Slot:
+        """追加一个记录版本并更新索引"""
+        buf = _pack(entry)
+        # 换分段后的压缩也会写入当前分段，写入前要重新检查
+        while not self._active.room(len(buf)):
+            self._roll(len(buf))
+        offset = self._active.append(buf)
+        slot = self._index_entry(
+            Slot(self._active.number, offset, len(buf), entry), entry["id"]
+        )
+        self._unsynced += 1
+        if self._unsynced >= FSYNC_BATCH:
+            self._sync_wake.set()
+        return slot
+
+    def _roll(self, size: int) -> None:
+        """封存当前分段，换新分段，然后压缩存活记录过少的旧分段"""
+        self._active.seal()
+        number = self._active.number + 1
+        self._active = Segment(self.directory, number, max(SEGMENT_BYTES, size))
+        self._segments[number] = self._active
+        self._live[number] = 0
+        if not self._compacting:
+            self._expire()
+            self.compact()
+
+    def _read(self, slot: Slot) -> dict:
+        return self._segments[slot.segment].read(slot.offset, slot.size)["data"]
+
+    def _forget(self, msg_id: str) -> None:
+        slot = self._index.pop(msg_id)
+        self._live[slot.segment] -= slot.size
+        self._processing.discard(msg_id)
+
+    def _expire(self) -> None:
+        """从索引中移除已过期的记录和去重标记"""
+        now = time.time()
+        for msg_id, slot in list(self._index.items()):
+            if slot.expires <= now:
+                self._forget(msg_id)
+        for key, expires in list(self._seen.items()):
+            if expires <= now:
+                del self._seen[key]
+
+    def compact(self) -> None:
+        """已封存分段中存活记录合计低于 COMPACT_RATIO 时，把存活记录搬到当前分段，
+        删除全部已封存分段
+
+        只整体删除当前分段之前的所有分段：单独删掉中间某个分段可能丢掉记录的最新
+        版本（如已过期的 done），更早分段里的旧版本（pending）重启后会重新排队。
+        """
+        with self._cond:
+            victims = [
+                segment
+                for segment in self._segments.values()
+                if segment is not self._active
+            ]
+            used = sum(segment.end for segment in victims)
+            live = sum(self._live[segment.number] for segment in victims)
+            if not victims or live >= used * COMPACT_RATIO:
+                return
+            self._compacting = True
+            try:
+                for segment in victims:
+                    moved = [
+                        (msg_id, slot)
+                        for msg_id, slot in self._index.items()
+                        if slot.segment == segment.number
+                    ]
+                    for msg_id, slot in moved:
+                        self._write(segment.read(slot.offset, slot.size))
+                # 搬过去的记录落盘后才能删除旧分段
+                os.fsync(self._active.fd)
+                with self._sync_lock:
+                    for segment in victims:
+                        del self._segments[segment.number]
+                        del self._live[segment.number]
+                        segment.close()
+                        os.remove(segment.path)
+            finally:
+                self._compacting = False
+            logger.info(f"本地队列压缩: 删除 {len(victims)} 个分段")
+
+    def sync(self) -> None:
+        """把已写入的条目 fsync 到磁盘"""
+        with self._cond:
+            if not self._unsynced:
+                return
+            self._unsynced = 0
+            segment = self._active
+        with self._sync_lock:
+            if not segment.closed:
+                os.fsync(segment.fd)
+
+    def _sync_loop(self) -> None:
+        while not self._closed:
+            self._sync_wake.wait(FSYNC_INTERVAL)
+            self._sync_wake.clear()
+            try:
+                self.sync()
+            except Exception as e:
+                logger.error(f"本地队列 fsync 失败: {e}")
+
+    def add_listener(self, callback: Callable[[], None]) -> None:
+        """有新消息排队时调用 callback（在 push 的线程里，持有队列锁）"""
+        with self._cond:
+            self._listeners.append(callback)
+
+    def _enqueue(self, msg_id: str, lane: str) -> None:
+        self._lanes.setdefault(lane, deque()).append(msg_id)
+
+    def _ring(self, count: int) -> None:
+        self._cond.notify(count)
+        for callback in self._listeners:
+            callback()
+
+    def _add(self, msg_id: str, data: dict, lane: Optional[str], seen: str = None):
+        created = new_record(data, lane)
+        self._write(
+            {
+                "id": msg_id,
+                "ts": created,
+                "exp": created + PENDING_TTL,
+                "seq": self._next_seq() if lane is not None else None,
+                "seen": seen,
+                "data": _compact_fields(data),
+            }
+        )
+        if lane is not None:
+            self._enqueue(msg_id, lane)
+
+    def _next_seq(self) -> int:
+        self._seq += 1
+        return self._seq
+
+    def push(self, msg_id: str, data: dict, lane: Optional[str] = LANE_NORMAL) -> None:
+        """添加消息到队列"""
+        self.push_many([(msg_id, data)], lane)
+
+    def push_many(
+        self, items: Iterable[Tuple[str, dict]], lane: Optional[str] = LANE_NORMAL
+    ) -> None:
+        """批量添加消息；lane 为 None 时只写入记录不排队"""
+        items = list(items)
+        if not items:
+            return
+        with self._cond:
+            for msg_id, data in items:
+                self._add(msg_id, data, lane)
+            if lane is not None:
+                self._ring(len(items))
+        logger.info(f"队列推入: {', '.join(msg_id for msg_id, _ in items)}")
+
+    def push_once(
+        self, dedup: str, msg_id: str, data: dict, lane: Optional[str] = LANE_NORMAL
+    ) -> bool:
+        """幂等入队：去重标记 dedup 在 DEDUP_TTL 内第一次出现才写入并排队"""
+        with self._cond:
+            if self._seen.get(dedup, 0) > time.time():
+                logger.info(f"重复入队已忽略: {msg_id}")
+                return False
+            self._add(msg_id, data, lane, seen=dedup)
+            if lane is not None:
+                self._ring(1)
+        logger.info(f"队列推入: {msg_id}")
+        return True
+
+    def schedule(self, msg_id: str, lane: str = LANE_NORMAL) -> None:
+        """把已有记录放入通道排队"""
+        with self._cond:
+            slot = self._index.get(msg_id)
+            if slot is None:
+                logger.warning(f"排队的消息不存在: {msg_id}")
+                return
+            data = self._read(slot)
+            data["lane"] = lane
+            data["queued_ms"] = _now_ms()
+            self._write(slot.entry(msg_id, data, seq=self._next_seq()))
+            self._enqueue(msg_id, lane)
+            self._ring(1)
+
+    def pop(self, timeout: int = 5) -> Optional[tuple]:
+        """阻塞获取消息，返回 (msg_id, data) 或 None"""
+        results = self.pop_many(1, timeout)
+        return results[0] if results else None
+
+    def _claim_many(self, count: int) -> List[Tuple[str, dict]]:
+        claimed = []
+        now, now_ms = _now(), _now_ms()
+        for lane in self.scheduler.order():
+            pending = self._lanes.get(lane)
+            while pending and len(claimed) < count:
+                msg_id = pending.popleft()
+                slot = self._index.get(msg_id)
+                if slot is None or slot.expires <= time.time():
+                    continue
+                data = self._read(slot)
+                data["status"] = "processing"
+                data["updated_at"] = now
+                self._write(slot.entry(msg_id, data))
+                self._processing.add(msg_id)
+                self._count(f"{lane}:claimed", 1)
+                if slot.queued_ms:
+                    self._count(f"{lane}:wait_ms", max(0, now_ms - slot.queued_ms))
+                claimed.append((msg_id, data))
+        return claimed
+
+    def _count(self, key: str, value: int) -> None:
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def pop_many(self, count: int, timeout: int = 5) -> List[Tuple[str, dict]]:
+        """按通道调度取出最多 count 条消息，返回 [(msg_id, data)]；
+        所有通道都为空时等待 push 唤醒，最多 timeout 秒"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                claimed = self._claim_many(count)
+                remaining = deadline - time.monotonic()
+                if claimed or remaining <= 0:
+                    return claimed
+                self._cond.wait(remaining)
+
+    def stats(self) -> dict:
+        """各通道深度、最早一条已等待秒数、累计取出条数和平均等待秒数（进程内累计）"""
+        with self._cond:
+            lanes = []
+            for lane in LANES:
+                pending = self._lanes.get(lane) or ()
+                oldest = self._index.get(pending[0]) if pending else None
+                lanes.append((len(pending), oldest.queued_ms if oldest else None))
+            return lane_stats(dict(self._counters), lanes, _now_ms())
+
+    def _finish(self, msg_id: str, status: str) -> None:
+        with self._cond:
+            self._processing.discard(msg_id)
+            slot = self._index.get(msg_id)
+            if slot is None:
+                return
+            data = self._read(slot)
+            data["status"] = status
+            data["updated_at"] = _now()
+            self._write(slot.entry(msg_id, data, exp=time.time() + MSG_TTL))
+
+    def done(self, msg_id: str) -> None:
+        """标记完成"""
+        self._finish(msg_id, "done")
+
+    def error(self, msg_id: str) -> None:
+        """标记失败"""
+        self._finish(msg_id, "error")
+
+    def update(self, msg_id: str, data: dict) -> None:
+        """更新消息数据（只写入 data 中的字段）"""
+        self.update_fields(msg_id, **data)
+
+    def update_fields(self, msg_id: str, **fields) -> None:
+        """部分更新消息字段"""
+        fields["updated_at"] = _now()
+        with self._cond:
+            slot = self._index.get(msg_id)
+            if slot is None:
+                return
+            data = self._read(slot)
+            data.update(_compact_fields(fields))
+            self._write(slot.entry(msg_id, data))
+
+    def _live_slot(self, msg_id: str) -> Optional[Slot]:
+        slot = self._index.get(msg_id)
+        return slot if slot is not None and slot.expires > time.time() else None
+
+    def get(self, msg_id: str) -> Optional[dict]:
+        """获取消息"""
+        with self._cond:
+            slot = self._live_slot(msg_id)
+            return self._read(slot) if slot else None
+
+    def get_field(self, msg_id: str, field: str):
+        """读取单个字段，不存在返回 None"""
+        data = self.get(msg_id)
+        return data.get(field) if data else None
+
+    def recent(self, hours: int = 24, limit: int = 100) -> List[str]:
+        """最近 hours 小时内创建的消息 ID，最新在前"""
+        since = time.time() - hours * 3600
+        with self._cond:
+            recent = [
+                (slot.ts, msg_id)
+                for msg_id, slot in self._index.items()
+                if slot.ts >= since
+            ]
+        recent.sort(reverse=True)
+        return [msg_id for _, msg_id in recent[:limit]]
+
+    def get_many(self, msg_ids: List[str]) -> List[Optional[dict]]:
+        """批量获取消息，已过期的为 None"""
+        with self._cond:
+            return [self.get(msg_id) for msg_id in msg_ids]
+
+    def ping(self) -> bool:
+        return not self._closed
+
+    def close(self) -> None:
+        """停止 fsync 线程，落盘并关闭分段"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+        self._sync_wake.set()
+        self._sync_thread.join()
+        self.sync()
+        with self._cond:
+            for segment in self._segments.values():
+                segment.close()
+            self._lock_file.close()
+
+
+class AsyncLocalQueue:
+    """LocalQueue 的异步接口（与 AsyncRedisQueue 相同）
+
+    操作都在内存和页缓存里完成，直接调用；空队列的 pop 在 asyncio.Event 上等待，
+    push 时由队列回调唤醒，不占用线程。
+    """
+
+    client = None
+
+    def __init__(self, queue: LocalQueue):
+        """
+        Args:
+            queue: 进程内共享的 LocalQueue
+        """
+        self.queue = queue
+        # 第一次 pop 时在事件循环里创建
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ready: Optional[asyncio.Event] = None
+        queue.add_listener(self._wake)
+
+    def _wake(self) -> None:
+        if self._ready is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._ready.set)
+
+    async def push(
+        self, msg_id: str, data: dict, lane: Optional[str] = LANE_NORMAL
+    ) -> None:
+        """添加消息到队列"""
+        self.queue.push(msg_id, data, lane)
+
+    async def push_many(
+        self, items: Iterable[Tuple[str, dict]], lane: Optional[str] = LANE_NORMAL
+    ) -> None:
+        """批量添加消息；lane 为 None 时只写入记录不排队"""
+        self.queue.push_many(items, lane)
+
+    async def push_once(
+        self, dedup: str, msg_id: str, data: dict, lane: Optional[str] = LANE_NORMAL
+    ) -> bool:
+        """幂等入队，重复时返回 False"""
+        return self.queue.push_once(dedup, msg_id, data, lane)
+
+    async def schedule(self, msg_id: str, lane: str = LANE_NORMAL) -> None:
+        """把已有记录放入通道排队"""
+        self.queue.schedule(msg_id, lane)
+
+    async def pop(self, timeout: int = 5) -> Optional[tuple]:
+        """等待获取消息，返回 (msg_id, data) 或 None"""
+        results = await self.pop_many(1, timeout)
+        return results[0] if results else None
+
+    async def pop_many(self, count: int, timeout: int = 5) -> List[Tuple[str, dict]]:
+        """按通道调度取出最多 count 条消息；所有通道都为空时等待 push 唤醒"""
+        if self._ready is None:
+            self._loop = asyncio.get_running_loop()
+            self._ready = asyncio.Event()
+        deadline = self._loop.time() + timeout
+        while True:
+            # 先清除再取：取完到等待之间的 push 会重新置位
+            self._ready.clear()
+            claimed = self.queue.pop_many(count, 0)
+            remaining = deadline - self._loop.time()
+            if claimed or remaining <= 0:
+                return claimed
+            try:
+                await asyncio.wait_for(self._ready.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    async def stats(self) -> dict:
+        """各通道深度、最早一条已等待秒数、累计取出条数和平均等待秒数"""
+        return self.queue.stats()
+
+    async def done(self, msg_id: str) -> None:
+        """标记完成"""
+        self.queue.done(msg_id)
+
+    async def error(self, msg_id: str) -> None:
+        """标记失败"""
+        self.queue.error(msg_id)
+
+    async def update(self, msg_id: str, data: dict) -> None:
+        """更新消息数据（只写入 data 中的字段）"""
+        self.queue.update(msg_id, data)
+
+    async def update_fields(self, msg_id: str, **fields) -> None:
+        """部分更新消息字段"""
+        self.queue.update_fields(msg_id, **fields)
+
+    async def get(self, msg_id: str) -> Optional[dict]:
+        """获取消息"""
+        return self.queue.get(msg_id)
+
+    async def get_field(self, msg_id: str, field: str):
+        """读取单个字段，不存在返回 None"""
+        return self.queue.get_field(msg_id, field)
+
+    async def recent(self, hours: int = 24, limit: int = 100) -> List[str]:
+        """最近 hours 小时内创建的消息 ID，最新在前"""
+        return self.queue.recent(hours, limit)
+
+    async def get_many(self, msg_ids: List[str]) -> List[Optional[dict]]:
+        """批量获取消息，已过期的为 None"""
+        return self.queue.get_many(msg_ids)
+
+    async def ping(self) -> bool:
+        return self.queue.ping()
+
+    async def close(self) -> None:
+        """把已写入的条目落盘（LocalQueue 由 get_queue 持有，进程退出时关闭）"""
+        self.queue.sync()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+pane 增量捕获
+按 history_size + cursor_y 记录每个 pane 已读到的绝对行号，只 capture 新追加的行，
+已完成的行放进有界环形缓冲
+"""
+
+from collections import deque
+from typing import List, Optional, Tuple
+
+# 变化探测 + 增量捕获共用的 pane 元数据（一次 display -p）
+# 前三项用于计算行号，整串作为变化令牌：滚动、光标移动、有输出都会改变它
+PROBE_FORMAT = (
+    "#{history_size} #{cursor_y} #{history_limit} #{cursor_x} #{window_activity}"
+)
+
+# history 写满后行号会漂移，用最后几行已提交内容做锚点对齐
+ANCHOR_SIZE = 3
+
+
+def parse_metadata(output: str) -> Optional[Tuple[int, int, int]]:
+    """解析 PROBE_FORMAT 的输出为 (history_size, cursor_y, history_limit)"""
+    try:
+        history_size, cursor_y, history_limit = (
+            int(v) for v in output.split()[:3]
+        )
+    except ValueError:
+        return None
+    return history_size, cursor_y, history_limit
+
+
+def _split_rows(output: str) -> List[str]:
+    """capture-pane -p 每行以换行结尾"""
+    if output.endswith("\n"):
+        output = output[:-1]
+    return output.split("\n")
+
+
+class PaneHistory:
+    """单个 pane 的增量读取状态
+
+    lines 是已完成（光标已经离开）的最近若干行，tail 是光标所在行，
+    它在下次读取前可能还会变化，所以不提交到 lines。
+    """
+
+    def __init__(self, max_lines: int):
+        self.lines: deque = deque(maxlen=max_lines)
+        self.tail: List[str] = []
+        # 第一个尚未提交的绝对行号（= 上次读取时光标所在行）
+        self.next_line: Optional[int] = None
+        self.history_size = 0
+        # 上次读取时的 PROBE_FORMAT 输出
+        self.token = ""
+        self._align = False
+
+    def changed(self, token: str) -> bool:
+        """与上次读取相比 pane 是否可能有变化，并记录新令牌"""
+        if token == self.token:
+            return False
+        self.token = token
+        return True
+
+    def plan(
+        self, history_size: int, cursor_y: int, history_limit: int
+    ) -> Tuple[int, int]:
+        """根据 pane 元数据计算 capture-pane 的 (-S, -E) 相对行号"""
+        cursor = history_size + cursor_y
+        self._align = False
+        if self.next_line is None:
+            start = max(0, cursor - self.lines.maxlen)
+        elif history_size < self.history_size:
+            # history 被清空（clear / clear-history），从屏幕顶部重新读
+            start = history_size
+        elif history_size >= history_limit:
+            # history 已满，旧行被丢弃后绝对行号不再可靠，多读一段再用锚点对齐
+            start = max(0, cursor - self.lines.maxlen)
+            self._align = True
+        else:
+            # 光标上移（重绘）时只重读光标行，不回退已提交的行
+            start = min(self.next_line, cursor)
+        self.history_size = history_size
+        self.next_line = cursor
+        return start - history_size, cursor_y
+
+    def apply(self, output: str) -> List[str]:
+        """写入 capture-pane 的结果，返回新提交的行"""
+        rows = _split_rows(output)
+        committed, self.tail = rows[:-1], rows[-1:]
+        if self._align:
+            committed = self._after_anchor(committed)
+        self.lines.extend(committed)
+        return committed
+
+    def _after_anchor(self, rows: List[str]) -> List[str]:
+        """去掉 rows 中已提交过的部分（以最后 ANCHOR_SIZE 行为锚点）"""
+        size = min(ANCHOR_SIZE, len(self.lines))
+        if size == 0:
+            return rows
+        anchor = [self.lines[-i] for i in range(size, 0, -1)]
+        for end in range(len(rows), size - 1, -1):
+            if rows[end - size:end] == anchor:
+                return rows[end:]
+        return rows
+
+    def last_nonempty(self) -> str:
+        """最后一个非空行（含光标行），去掉首尾空白"""
+        for line in self.tail:
+            if line.strip():
+                return line.strip()
+        for line in reversed(self.lines):
+            if line.strip():
+                return line.strip()
+        return ""
+
+    def text(self) -> str:
+        """环形缓冲 + 光标行的完整文本"""
+        return "\n".join(list(self.lines) + self.tail)
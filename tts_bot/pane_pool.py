@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+kiro-cli 多窗格工作池
+多个运行 kiro-cli 的 pane 作为 worker，新消息分配给空闲 pane，回复按 pane 路由回提问的 chat
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+from .chat_sessions import ChatSessionMap
+from .tmux_backend import AsyncTmuxBackend
+
+logger = logging.getLogger(__name__)
+
+# 刚派发的 pane 在这段时间内不做空闲检测（kiro-cli 还没来得及开始输出）
+BUSY_GRACE = 2.0
+# 所有 pane 都忙时，重新检测的间隔（秒）
+ACQUIRE_INTERVAL = 1.0
+
+
+class PaneWorker:
+    """一个 kiro-cli pane 的状态"""
+
+    def __init__(self, win_id: str):
+        self.win_id = win_id
+        self.busy = False
+        self.since = 0.0
+
+
+class PanePool:
+    """pane 工作池
+
+    派发时把 pane 标记为忙，之后用 is_idle（最后非空行是 λ >）判断它是否已经答完。
+    pane 归属由 ChatSessionMap 维护：chat 粘在自己的 pane 上，直到会话空闲被释放。
+    """
+
+    def __init__(
+        self, tmux: AsyncTmuxBackend, win_ids: List[str], sessions: ChatSessionMap
+    ):
+        self.tmux = tmux
+        self.sessions = sessions
+        self.workers: Dict[str, PaneWorker] = {w: PaneWorker(w) for w in win_ids}
+        self._lock = asyncio.Lock()
+
+    async def _refresh(self, worker: PaneWorker) -> None:
+        """忙碌的 pane 超过宽限期后检测是否已回到空闲"""
+        if not worker.busy or time.monotonic() - worker.since < BUSY_GRACE:
+            return
+        if await self.tmux.is_idle(worker.win_id):
+            worker.busy = False
+
+    async def try_acquire(self, chat_id: int) -> Optional[str]:
+        """为 chat 分配 pane，需要等待时返回 None
+
+        已有会话的 chat 只会回到自己的 pane；新 chat 只拿无主的空闲 pane。
+        会话空闲超过 session_idle_timeout 后由 evict_idle 释放 pane，
+        未过期的会话不会被接管，pane 都有主时新 chat 等待。
+        """
+        async with self._lock:
+            await self.sessions.evict_idle()
+            own = self.workers.get(self.sessions.pane_of(chat_id) or "")
+            if own is not None:
+                await self._refresh(own)
+                candidates = [own]
+            else:
+                workers = list(self.workers.values())
+                await asyncio.gather(*(self._refresh(w) for w in workers))
+                candidates = [w for w in workers if not self.sessions.owner(w.win_id)]
+            worker = next((w for w in candidates if not w.busy), None)
+            if worker is None:
+                self.sessions.touch(chat_id)
+                return None
+            worker.busy = True
+            worker.since = time.monotonic()
+            await self.sessions.assign(chat_id, worker.win_id)
+            return worker.win_id
+
+    async def acquire(self, chat_id: int, timeout: float) -> Optional[str]:
+        """等待空闲 pane，超时返回 None"""
+        deadline = time.monotonic() + timeout
+        while True:
+            win_id = await self.try_acquire(chat_id)
+            if win_id is not None or time.monotonic() >= deadline:
+                return win_id
+            await asyncio.sleep(ACQUIRE_INTERVAL)
+
+    def pane_of(self, chat_id: int) -> Optional[str]:
+        """chat 当前会话的 pane（用于 t/n/y、方向键等交互）"""
+        win_id = self.sessions.pane_of(chat_id)
+        return win_id if win_id in self.workers else None
+
+    def status(self) -> str:
+        """各 pane 的忙闲状态"""
+        lines = []
+        for worker in self.workers.values():
+            state = "⚙️ 忙碌" if worker.busy else "✅ 空闲"
+            chat_id = self.sessions.owner(worker.win_id)
+            owner = f" chat={chat_id}" if chat_id else ""
+            lines.append(f"{worker.win_id} {state}{owner}")
+        return "\n".join(lines)
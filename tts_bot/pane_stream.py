@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+tmux pane 输出推送
+通过控制模式的 %output 通知订阅 pane 输出，取代定时 capture-pane 轮询；
+PaneMirror 用输出驱动内存中的屏幕模型
+"""
+
+import asyncio
+import codecs
+import logging
+import re
+from typing import Optional
+
+from .kiro_tmux_backend import TMUX_SOCKET, run_cmd_async
+from .tmux_control import COMMAND_SEPARATOR, TmuxControlClient
+from .vt_screen import VTScreen
+
+logger = logging.getLogger(__name__)
+
+_OCTAL_ESCAPE = re.compile(r"\\([0-7]{3})")
+
+# 重建屏幕模型用的 pane 元数据
+MIRROR_FORMAT = "#{pane_width} #{pane_height} #{cursor_x} #{cursor_y} #{history_size}"
+
+
+def decode_output(data: str) -> str:
+    """还原 %output 中的八进制转义（控制字符和反斜杠）"""
+    return _OCTAL_ESCAPE.sub(lambda m: chr(int(m.group(1), 8)), data)
+
+
+def output_bytes(data: str) -> bytes:
+    """%output 数据还原为原始字节（不完整的 UTF-8 序列以 surrogateescape 保留）"""
+    return decode_output(data).encode("utf-8", errors="surrogateescape")
+
+
+class PaneOutputStream:
+    """单个 pane 的输出流
+
+    用法:
+        stream = PaneOutputStream("kiro:master.0")
+        if await stream.start():
+            while (chunk := await stream.read()) is not None:
+                ...
+    """
+
+    def __init__(self, win_id: str, socket: str = TMUX_SOCKET):
+        self.win_id = win_id
+        self.socket = socket
+        self.pane_id = ""
+        self._client: Optional[TmuxControlClient] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # 拼接被拆到两条通知里的多字节字符
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    async def start(self) -> bool:
+        """解析 pane id 并附加到其所在 session，失败返回 False"""
+        output, code = await run_cmd_async(
+            ["display", "-p", "-t", self.win_id, "#{pane_id} #{session_id}"]
+        )
+        parts = output.split()
+        if code != 0 or len(parts) != 2:
+            logger.warning(f"无法解析 pane: {self.win_id}")
+            return False
+        self.pane_id, session_id = parts
+
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        # %output 只发给附加在该 session 上的客户端，所以单独起一个连接
+        self._client = TmuxControlClient(self.socket, session=session_id, output=True)
+        self._client.add_listener(self._on_notification)
+        started = await self._loop.run_in_executor(None, self._client.start)
+        if not started:
+            self._client.close()
+            return False
+        logger.info(f"已订阅 pane 输出: {self.win_id} ({self.pane_id})")
+        return True
+
+    async def read(self) -> Optional[str]:
+        """等待下一段输出，连接断开时返回 None"""
+        return await self._queue.get()
+
+    def read_nowait(self) -> Optional[str]:
+        """取出已到达的输出，没有时返回空字符串"""
+        try:
+            return self._queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return ""
+
+    def close(self) -> None:
+        """关闭订阅"""
+        if self._client is not None:
+            self._client.remove_listener(self._on_notification)
+            self._client.close()
+            self._client = None
+
+    def _on_notification(self, line: str) -> None:
+        """读线程回调：过滤本 pane 的输出并投递到事件循环"""
+        if line.startswith("%output "):
+            _, pane_id, data = (line.split(" ", 2) + [""])[:3]
+        elif line.startswith("%extended-output "):
+            # %extended-output %pane age ... : data
+            head, _, data = line.partition(" : ")
+            pane_id = head.split(" ", 2)[1]
+        elif line == "%exit":
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, None)
+            return
+        else:
+            return
+        if pane_id != self.pane_id:
+            return
+        text = self._decoder.decode(output_bytes(data))
+        if text:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, text)
+
+
+class PaneMirror:
+    """pane 的内存屏幕镜像
+
+    订阅 pane 输出并喂给 VTScreen，读取屏幕内容不再需要 tmux 调用。
+    模型与 tmux 可能因未支持的转义序列或窗格尺寸变化出现偏差，调用方在
+    合适的时机（如每次回复结束）用 sync() 从 tmux 重建一次。
+    """
+
+    def __init__(self, win_id: str, socket: str = TMUX_SOCKET):
+        self.win_id = win_id
+        self.stream = PaneOutputStream(win_id, socket)
+        self.screen: Optional[VTScreen] = None
+        self._closed = False
+
+    async def start(self) -> bool:
+        """订阅输出并载入当前屏幕，失败返回 False"""
+        if not await self.stream.start():
+            return False
+        if not await self.sync():
+            self.close()
+            return False
+        return True
+
+    async def sync(self) -> bool:
+        """从 tmux 重建屏幕模型（一次 display + capture-pane 调用）"""
+        output, code = await run_cmd_async([
+            "display", "-p", "-t", self.win_id, MIRROR_FORMAT,
+            COMMAND_SEPARATOR, "capture-pane", "-p", "-t", self.win_id,
+        ])
+        head, _, body = output.partition("\n")
+        try:
+            width, height, cursor_x, cursor_y, history_size = (
+                int(v) for v in head.split()
+            )
+        except ValueError:
+            logger.warning(f"无法读取 pane 屏幕: {self.win_id}")
+            return False
+        # 已到达的输出已经反映在 capture 结果里
+        self._discard_pending()
+        screen = VTScreen(width, height)
+        screen.restore(body.split("\n"), cursor_x, cursor_y, history_size)
+        self.screen = screen
+        return True
+
+    def _discard_pending(self) -> None:
+        chunk = self.stream.read_nowait()
+        while chunk:
+            chunk = self.stream.read_nowait()
+        if chunk is None:
+            self._closed = True
+
+    async def update(self, settle: float = 0.0) -> bool:
+        """等到屏幕内容有变化（spinner 原地重绘不算），订阅断开时返回 False
+
+        Args:
+            settle: 收到输出后再等待多久，把连续输出合并成一次更新（秒）
+        """
+        while not self._closed:
+            chunk = await self.stream.read()
+            if settle:
+                await asyncio.sleep(settle)
+            while chunk:
+                self.screen.feed(chunk)
+                chunk = self.stream.read_nowait()
+            if chunk is None:
+                self._closed = True
+            elif self.screen.changed():
+                return True
+        return False
+
+    def close(self) -> None:
+        """关闭订阅"""
+        self._closed = True
+        self.stream.close()
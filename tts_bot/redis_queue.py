@@ -5,74 +5,689 @@ import json
 import time
 import logging
 import os
-from typing import Optional
+from typing import Iterable, List, Optional, Tuple
 
 import redis
+import redis.asyncio as aioredis
 
 logger = logging.getLogger(__name__)
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# 队列后端：list（默认）、stream（Redis Streams 消费组，见 stream_queue.py）
+# 或 local（进程内分段日志，不需要 Redis，见 local_queue.py）
+QUEUE_BACKEND = os.getenv("QUEUE_BACKEND", "list")
+# 通道调度：strict（总是先取高优先级通道）或 weighted（按 LANE_WEIGHTS 轮转）
+QUEUE_SCHEDULE = os.getenv("QUEUE_SCHEDULE", "strict")
 
 # 队列 key
 Q_PENDING = "tts:queue:pending"
 Q_PROCESSING = "tts:queue:processing"
 MSG_PREFIX = "tts:msg:"
+# 有新消息时推入的门铃，空队列的 pop 在这里阻塞等待（长度有上限）
+DOORBELL_KEY = "tts:queue:doorbell"
+DOORBELL_MAX = 64
+# 各通道累计取出条数和等待时间：<lane>:claimed / <lane>:wait_ms
+STATS_KEY = "tts:queue:stats"
+# 幂等入队的去重标记：tts:queue:seen:<chat_id>:<message_id> → msg_id
+DEDUP_PREFIX = "tts:queue:seen:"
 
+# 优先级通道，按优先级从高到低：interactive 是 kiro-cli 正在等待的输入
+# （t/n/y 决策、方向键），不能排在长 prompt 后面
+LANE_INTERACTIVE = "interactive"
+LANE_NORMAL = "normal"
+LANES = (LANE_INTERACTIVE, LANE_NORMAL)
+# weighted 调度时各通道的权重
+LANE_WEIGHTS = {LANE_INTERACTIVE: 4, LANE_NORMAL: 1}
+# 按小时分桶的时间索引：tts:idx:msg:<桶起始时间戳> → zset(msg_id, 创建时间)
+INDEX_PREFIX = "tts:idx:msg:"
+INDEX_BUCKET = 3600
+# 已完成 / 失败消息的精简归档（定长 list，最新在前）
+ARCHIVE_KEY = "tts:archive:msg"
 
-class RedisQueue:
+# 保留策略（秒 / 条）：完成或失败的记录保留 MSG_TTL；一直未处理的记录和索引桶
+# 最多保留 PENDING_TTL；归档只保留最近 ARCHIVE_MAX 条
+MSG_TTL = int(os.getenv("QUEUE_MSG_TTL", 3 * 86400))
+PENDING_TTL = int(os.getenv("QUEUE_PENDING_TTL", 30 * 86400))
+ARCHIVE_MAX = int(os.getenv("QUEUE_ARCHIVE_MAX", 1000))
+# 去重标记保留时间（Telegram 重投的更新不会晚于这个时间）
+DEDUP_TTL = int(os.getenv("QUEUE_DEDUP_TTL", 86400))
+
+# 消息记录字段类型，未列出的字段按字符串处理
+FIELD_TYPES = {
+    "message_id": int,
+    "chat_id": int,
+    "user_id": int,
+    "ack_message_id": int,
+    "is_text": bool,
+    "queued_ms": int,
+}
+
+# 更新消息状态：记录是 hash 时直接 HSET；旧版 JSON 字符串记录就地改写
+# status / updated_at（不经 cjson 解码再编码，避免大整数丢失精度）。
+# 返回更新后的记录（hash 为 HGETALL 平铺列表，旧记录为 JSON 字符串）
+_MARK_LUA = """
+local function mark(key, status, now)
+    local kind = redis.call('TYPE', key).ok
+    if kind == 'hash' then
+        redis.call('HSET', key, 'status', status, 'updated_at', now)
+        return redis.call('HGETALL', key)
+    end
+    if kind ~= 'string' then
+        return false
+    end
+    local raw = redis.call('GET', key)
+    raw = string.gsub(raw, '"status": "[^"]*"', '"status": "' .. status .. '"', 1)
+    raw = string.gsub(raw, '"updated_at": "[^"]*"', '"updated_at": "' .. now .. '"', 1)
+    redis.call('SET', key, raw, 'KEEPTTL')
+    return raw
+end
+"""
+
+# 完成或失败的记录：缩短 TTL，精简信息写入定长归档
+_RETIRE_LUA = """
+local function retire(key, msg_id, status, archive, ttl, archive_max)
+    if ttl > 0 then
+        redis.call('EXPIRE', key, ttl)
+    end
+    if archive_max <= 0 then
+        return
+    end
+    local entry = {id = msg_id, status = status}
+    if redis.call('TYPE', key).ok == 'hash' then
+        local names = {'chat_id', 'message_id', 'created_at', 'updated_at'}
+        local values = redis.call('HMGET', key, unpack(names))
+        for i, name in ipairs(names) do
+            if values[i] then
+                entry[name] = values[i]
+            end
+        end
+    end
+    redis.call('LPUSH', archive, cjson.encode(entry))
+    redis.call('LTRIM', archive, 0, archive_max - 1)
+end
+"""
+
+# 累计通道的取出条数和排队时间（记录中的 queued_ms 到 now_ms）
+_WAIT_LUA = """
+local function record_wait(key, stats, lane, now_ms)
+    if redis.call('TYPE', key).ok ~= 'hash' then
+        return
+    end
+    local queued = tonumber(redis.call('HGET', key, 'queued_ms'))
+    if queued then
+        redis.call('HINCRBY', stats, lane .. ':claimed', 1)
+        redis.call('HINCRBY', stats, lane .. ':wait_ms', math.max(0, now_ms - queued))
+    end
+end
+"""
+
+# 按通道顺序取出最多 N 条消息：移入 processing、标记 processing、累计等待时间在同一个
+# 脚本里完成，不会出现已在 processing 而状态仍是 pending 的消息。记录的 key 要经 KEYS
+# 声明（Redis Cluster 要求），所以由客户端先读出各通道队尾的候选 ID 一并传入；队尾
+# 不是候选（已被其他 worker 取走）时不再从该通道取。记录已过期的 ID 直接丢弃。
+# 返回 {{msg_id, 记录}, ...}
+# KEYS: processing, stats, 各通道 pending, 候选 msg key...
+# ARGV: N, 时间, 毫秒时间, 通道数, 各通道名, 候选 msg_id...
+CLAIM_SCRIPT = _MARK_LUA + _WAIT_LUA + """
+local lanes = tonumber(ARGV[4])
+local keys = {}
+for i = 5 + lanes, #ARGV do
+    keys[ARGV[i]] = KEYS[i - 2]
+end
+local claimed = {}
+local lane = 1
+while #claimed < tonumber(ARGV[1]) and lane <= lanes do
+    local pending = KEYS[2 + lane]
+    local msg_id = redis.call('LINDEX', pending, -1)
+    local key = msg_id and keys[msg_id]
+    if not key then
+        lane = lane + 1
+    else
+        redis.call('RPOP', pending)
+        record_wait(key, KEYS[2], ARGV[4 + lane], tonumber(ARGV[3]))
+        local record = mark(key, 'processing', ARGV[2])
+        if record then
+            redis.call('LPUSH', KEYS[1], msg_id)
+            claimed[#claimed + 1] = {msg_id, record}
+        end
+    end
+end
+return claimed
+"""
+
+# 幂等入队：去重标记第一次出现时才写入记录、索引并排队，重复返回 0
+# KEYS: 去重标记, msg key, 索引桶[, 通道 pending 或 stream, 门铃]
+# ARGV: 去重 TTL, 记录 TTL, 索引桶 TTL, msg_id, 创建时间, 排队方式 list/stream/空,
+#       门铃上限或 stream 长度, 记录字段/值...
+ENQUEUE_ONCE_SCRIPT = """
+if not redis.call('SET', KEYS[1], ARGV[4], 'NX', 'EX', ARGV[1]) then
+    return 0
+end
+redis.call('HSET', KEYS[2], unpack(ARGV, 8))
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+redis.call('ZADD', KEYS[3], ARGV[5], ARGV[4])
+redis.call('EXPIRE', KEYS[3], ARGV[3])
+if ARGV[6] == 'list' then
+    redis.call('LPUSH', KEYS[4], ARGV[4])
+    redis.call('LPUSH', KEYS[5], '1')
+    redis.call('LTRIM', KEYS[5], 0, tonumber(ARGV[7]) - 1)
+elseif ARGV[6] == 'stream' then
+    redis.call('XADD', KEYS[4], 'MAXLEN', '~', ARGV[7], '*', 'msg_id', ARGV[4])
+end
+return 1
+"""
+
+# 部分更新已有记录的字段。记录已过期时不写，否则 HSET 会建出没有 TTL 的孤儿 hash；
+# 返回 1 已更新，0 记录不存在，-1 旧版 JSON 记录（需先转成 hash）
+# KEYS: msg key  ARGV: 字段/值...
+UPDATE_SCRIPT = """
+local kind = redis.call('TYPE', KEYS[1]).ok
+if kind == 'hash' then
+    redis.call('HSET', KEYS[1], unpack(ARGV))
+    return 1
+elseif kind == 'none' then
+    return 0
+end
+return -1
+"""
+
+# 更新消息状态
+# KEYS: msg key  ARGV: 状态, 时间
+MARK_SCRIPT = _MARK_LUA + """
+return mark(KEYS[1], ARGV[1], ARGV[2])
+"""
+
+# 移出 processing、更新状态并归档
+# KEYS: processing, msg key, 归档  ARGV: msg_id, 状态, 时间, TTL, 归档条数
+FINISH_SCRIPT = _MARK_LUA + _RETIRE_LUA + """
+redis.call('LREM', KEYS[1], 1, ARGV[1])
+local record = mark(KEYS[2], ARGV[2], ARGV[3])
+if record then
+    retire(KEYS[2], ARGV[1], ARGV[2], KEYS[3], tonumber(ARGV[4]), tonumber(ARGV[5]))
+end
+return record
+"""
+
+
+def _now() -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def lane_key(lane: str) -> str:
+    """通道的 pending list（normal 沿用原来的 tts:queue:pending）"""
+    return Q_PENDING if lane == LANE_NORMAL else f"{Q_PENDING}:{lane}"
+
+
+class LaneScheduler:
+    """通道调度
+
+    strict 总是按优先级顺序取；weighted 按权重平滑轮转首选通道（高优先级通道
+    不会饿死低优先级通道），首选通道为空时依次取其他通道。
+    """
+
+    def __init__(self, mode: str = None, weights: dict = None):
+        self.mode = mode or QUEUE_SCHEDULE
+        self.weights = dict(weights or LANE_WEIGHTS)
+        self._credit = {lane: 0 for lane in LANES}
+
+    def order(self) -> List[str]:
+        """本次取消息时的通道顺序"""
+        if self.mode != "weighted":
+            return list(LANES)
+        for lane in LANES:
+            self._credit[lane] += self.weights.get(lane, 1)
+        first = max(LANES, key=lambda lane: self._credit[lane])
+        self._credit[first] -= sum(self.weights.get(lane, 1) for lane in LANES)
+        return [first] + [lane for lane in LANES if lane != first]
+
+
+def lane_stats(counters: dict, lanes: list, now_ms: int) -> dict:
+    """各通道统计：深度、最早一条已等待秒数、累计取出条数、平均等待秒数"""
+    stats = {}
+    for lane, (depth, queued) in zip(LANES, lanes):
+        claimed = int(counters.get(f"{lane}:claimed", 0))
+        wait_ms = int(counters.get(f"{lane}:wait_ms", 0))
+        stats[lane] = {
+            "depth": int(depth or 0),
+            "oldest_wait": max(0, now_ms - int(queued)) / 1000 if queued else 0.0,
+            "claimed": claimed,
+            "avg_wait": wait_ms / claimed / 1000 if claimed else 0.0,
+        }
+    return stats
+
+
+def encode_fields(data: dict) -> dict:
+    """消息字段 → hash 字段值，None 跳过，bool 存为 1/0"""
+    fields = {}
+    for key, value in data.items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            value = int(value)
+        fields[key] = str(value)
+    return fields
+
+
+def flat_fields(data: dict) -> list:
+    """消息字段 → 脚本参数 [字段, 值, ...]"""
+    return [item for pair in encode_fields(data).items() for item in pair]
+
+
+def decode_field(key: str, value: Optional[str]):
+    """hash 字段值 → 按 FIELD_TYPES 还原类型"""
+    kind = FIELD_TYPES.get(key)
+    if value is None or kind is None:
+        return value
+    try:
+        if kind is bool:
+            return value not in ("0", "", "False", "false")
+        return kind(value)
+    except ValueError:
+        return value
+
+
+def decode_fields(fields: dict) -> dict:
+    return {key: decode_field(key, value) for key, value in fields.items()}
+
+
+def index_key(timestamp: float) -> str:
+    """时间所在索引桶的 key"""
+    return f"{INDEX_PREFIX}{int(timestamp) // INDEX_BUCKET * INDEX_BUCKET}"
+
+
+def recent_index_keys(hours: int) -> List[str]:
+    """最近 hours 小时的索引桶，最新在前"""
+    now = time.time()
+    return [index_key(now - i * INDEX_BUCKET) for i in range(hours + 1)]
+
+
+def dedup_key(chat_id: int, message_id: int) -> str:
+    """(chat_id, message_id) 的去重标记"""
+    return f"{DEDUP_PREFIX}{chat_id}:{message_id}"
+
+
+def new_record(data: dict, lane: Optional[str]) -> float:
+    """填入新消息的状态、时间和通道字段，返回创建时间"""
+    created = time.time()
+    data["status"] = "pending"
+    data["created_at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(created))
+    data["updated_at"] = data["created_at"]
+    if lane is not None:
+        data["lane"] = lane
+        data["queued_ms"] = int(created * 1000)
+    return created
+
+
+def enqueue_once_args(
+    dedup: str, msg_id: str, data: dict, target: Optional[tuple]
+) -> Tuple[list, list]:
+    """ENQUEUE_ONCE_SCRIPT 的 KEYS / ARGV
+
+    Args:
+        target: (排队 key, list/stream, 门铃上限或 stream 长度)，None 表示只写记录
+    """
+    created = new_record(data, data.get("lane"))
+    keys = [dedup, f"{MSG_PREFIX}{msg_id}", index_key(created)]
+    args = [DEDUP_TTL, PENDING_TTL, PENDING_TTL + INDEX_BUCKET, msg_id, created]
+    if target is None:
+        args += ["", 0]
+    else:
+        queue_key, kind, limit = target
+        keys.append(queue_key)
+        if kind == "list":
+            keys.append(DOORBELL_KEY)
+        args += [kind, limit]
+    return keys, args + flat_fields(data)
+
+
+def stage_record(pipe, msg_id: str, data: dict, lane: str = None) -> None:
+    """把新消息的记录、TTL 和时间索引写入 pipeline（同步 / 异步通用）"""
+    created = new_record(data, lane)
+    key = f"{MSG_PREFIX}{msg_id}"
+    pipe.hset(key, mapping=encode_fields(data))
+    pipe.expire(key, PENDING_TTL)
+    bucket = index_key(created)
+    pipe.zadd(bucket, {msg_id: created})
+    pipe.expire(bucket, PENDING_TTL + INDEX_BUCKET)
+
+
+def stage_doorbell(pipe, count: int) -> None:
+    """按新消息条数按门铃，唤醒阻塞等待的 pop"""
+    pipe.lpush(DOORBELL_KEY, *["1"] * min(count, DOORBELL_MAX))
+    pipe.ltrim(DOORBELL_KEY, 0, DOORBELL_MAX - 1)
+
+
+def stage_candidates(pipe, lanes: List[str], count: int) -> None:
+    """读出各通道队尾最多 count 个 ID，作为 CLAIM_SCRIPT 的候选"""
+    for lane in lanes:
+        pipe.lrange(lane_key(lane), -count, -1)
+
+
+def claim_args(lanes: List[str], count: int, candidates: list) -> Tuple[list, list]:
+    """CLAIM_SCRIPT 的 (KEYS, ARGV)；candidates 为各通道读出的候选 ID"""
+    ids = [msg_id for lane_ids in candidates for msg_id in lane_ids]
+    keys = [Q_PROCESSING, STATS_KEY] + [lane_key(lane) for lane in lanes]
+    args = [count, _now(), _now_ms(), len(lanes)] + lanes + ids
+    return keys + [f"{MSG_PREFIX}{msg_id}" for msg_id in ids], args
+
+
+def decode_claims(claimed: list) -> List[Tuple[str, dict]]:
+    """CLAIM_SCRIPT 返回的 [msg_id, 记录] → [(msg_id, data)]"""
+    return [(msg_id, decode_record(raw)) for msg_id, raw in claimed]
+
+
+def stage_lane_heads(pipe) -> None:
+    """各通道深度和最早一条的 msg_id，以及累计统计"""
+    pipe.hgetall(STATS_KEY)
+    for lane in LANES:
+        pipe.llen(lane_key(lane))
+        pipe.lindex(lane_key(lane), -1)
+
+
+def stage_queued_ms(pipe, heads: list) -> List[str]:
+    """查询各通道最早一条的入队时间，返回查询的 msg_id（与 pipeline 结果对应）"""
+    oldest = [msg_id for msg_id in heads[1::2] if msg_id]
+    for msg_id in oldest:
+        pipe.hget(f"{MSG_PREFIX}{msg_id}", "queued_ms")
+    return oldest
+
+
+def head_lanes(heads: list, oldest: List[str], results: list) -> list:
+    """→ lane_stats 需要的 [(深度, 最早入队毫秒时间)]；旧版 JSON 记录的查询结果是异常"""
+    queued = {
+        msg_id: value
+        for msg_id, value in zip(oldest, results)
+        if not isinstance(value, Exception)
+    }
+    return [
+        (depth, queued.get(msg_id) if msg_id else None)
+        for depth, msg_id in zip(heads[::2], heads[1::2])
+    ]
+
+
+def decode_record(raw) -> Optional[dict]:
+    """脚本返回的记录：HGETALL 平铺列表或旧版 JSON 字符串"""
+    if not raw:
+        return None
+    if isinstance(raw, list):
+        return decode_fields(dict(zip(raw[::2], raw[1::2])))
+    return json.loads(raw)
+
+
+def schedule_fields(lane: str) -> list:
+    """把已有记录放入通道时补写的字段（UPDATE_SCRIPT 的 ARGV）"""
+    return flat_fields({"lane": lane, "queued_ms": _now_ms()})
+
+
+def update_args(fields: dict) -> list:
+    """部分更新的 UPDATE_SCRIPT ARGV，同时刷新 updated_at"""
+    fields["updated_at"] = _now()
+    return flat_fields(fields)
+
+
+def finish_args(msg_id: str, status: str) -> Tuple[list, list]:
+    """FINISH_SCRIPT 的 (KEYS, ARGV)"""
+    keys = [Q_PROCESSING, f"{MSG_PREFIX}{msg_id}", ARCHIVE_KEY]
+    return keys, [msg_id, status, _now(), MSG_TTL, ARCHIVE_MAX]
+
+
+def stage_recent(pipe, hours: int, limit: int) -> None:
+    """读取最近 hours 小时的时间索引桶"""
+    for key in recent_index_keys(hours):
+        pipe.zrevrange(key, 0, limit - 1)
+
+
+def recent_ids(buckets: list, limit: int) -> List[str]:
+    """索引桶读取结果 → 最新在前的最多 limit 个消息 ID"""
+    return [msg_id for bucket in buckets for msg_id in bucket][:limit]
+
+
+def stage_get_many(pipe, msg_ids: List[str]) -> None:
+    """批量读取记录"""
+    for msg_id in msg_ids:
+        pipe.hgetall(f"{MSG_PREFIX}{msg_id}")
+
+
+def decode_many(results: list) -> list:
+    """HGETALL 结果 → 记录；旧版 JSON 记录的结果是异常，原样保留由调用方单独读取"""
+    records = []
+    for fields in results:
+        if isinstance(fields, Exception):
+            records.append(fields)
+        else:
+            records.append(decode_fields(fields) if fields else None)
+    return records
+
+
+def decode_legacy(raw: Optional[str]) -> Optional[dict]:
+    """旧版 JSON 字符串记录"""
+    return json.loads(raw) if raw else None
+
+
+def stage_migrate(pipe, key: str, raw: str) -> None:
+    """旧版 JSON 字符串记录转为 hash"""
+    pipe.delete(key)
+    pipe.hset(key, mapping=encode_fields(json.loads(raw)))
+    pipe.expire(key, PENDING_TTL)
+
+
+class QueueBase:
+    """RedisQueue / AsyncRedisQueue 共用的部分：脚本注册、排队命令和参数构造
+
+    子类只负责执行命令（同步调用或 await），Streams 后端覆盖 _target / _stage_lane。
+    """
+
+    def __init__(self, client, schedule: str = None):
+        """
+        Args:
+            client: redis 客户端（同步或 redis.asyncio）
+            schedule: 通道调度方式 strict / weighted，默认 QUEUE_SCHEDULE
+        """
+        self.client = client
+        self.scheduler = LaneScheduler(schedule)
+        # 状态变更都在服务端脚本里原子完成，每次一个往返
+        self._claim = client.register_script(CLAIM_SCRIPT)
+        self._mark = client.register_script(MARK_SCRIPT)
+        self._update = client.register_script(UPDATE_SCRIPT)
+        self._finish = client.register_script(FINISH_SCRIPT)
+        self._enqueue_once = client.register_script(ENQUEUE_ONCE_SCRIPT)
+
+    def _target(self, lane: str) -> tuple:
+        """幂等入队时的排队位置"""
+        return lane_key(lane), "list", DOORBELL_MAX
+
+    def _stage_lane(self, pipe, lane: str, msg_ids: List[str]) -> None:
+        """把消息 ID 放入通道排队，并按门铃唤醒等待的 pop"""
+        pipe.lpush(lane_key(lane), *msg_ids)
+        stage_doorbell(pipe, len(msg_ids))
+
+    def _stage_push(self, pipe, items: list, lane: Optional[str]) -> None:
+        """新消息的记录、索引和排队写入 pipeline；lane 为 None 时不排队"""
+        for msg_id, data in items:
+            stage_record(pipe, msg_id, data, lane)
+        if lane is not None:
+            self._stage_lane(pipe, lane, [msg_id for msg_id, _ in items])
+
+    def _enqueue_args(
+        self, dedup: str, msg_id: str, data: dict, lane: Optional[str]
+    ) -> Tuple[list, list]:
+        """ENQUEUE_ONCE_SCRIPT 的 (KEYS, ARGV)"""
+        if lane is not None:
+            data["lane"] = lane
+        return enqueue_once_args(
+            dedup, msg_id, data, self._target(lane) if lane else None
+        )
+
+
+class RedisQueue(QueueBase):
     """Redis 消息队列"""
 
-    def __init__(self, url: str = None):
-        self.client = redis.from_url(url or REDIS_URL, decode_responses=True)
+    def __init__(self, url: str = None, schedule: str = None):
+        """
+        Args:
+            url: Redis 连接，默认 REDIS_URL
+            schedule: 通道调度方式 strict / weighted，默认 QUEUE_SCHEDULE
+        """
+        client = redis.from_url(url or REDIS_URL, decode_responses=True)
+        super().__init__(client, schedule)
 
-    def push(self, msg_id: str, data: dict) -> None:
+    def push(self, msg_id: str, data: dict, lane: Optional[str] = LANE_NORMAL) -> None:
         """添加消息到队列"""
-        data["status"] = "pending"
-        data["created_at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
-        data["updated_at"] = data["created_at"]
-        self.client.set(f"{MSG_PREFIX}{msg_id}", json.dumps(data, ensure_ascii=False))
-        self.client.lpush(Q_PENDING, msg_id)
+        self.push_many([(msg_id, data)], lane)
+
+    def push_many(
+        self, items: Iterable[Tuple[str, dict]], lane: Optional[str] = LANE_NORMAL
+    ) -> None:
+        """批量添加消息，一个事务一次往返
+
+        lane 为 None 时只写入记录不排队（如等待识别的语音），之后用 schedule 排队。
+        """
+        items = list(items)
+        if not items:
+            return
+        pipe = self.client.pipeline()
+        self._stage_push(pipe, items, lane)
+        pipe.execute()
+        logger.info(f"队列推入: {', '.join(msg_id for msg_id, _ in items)}")
+
+    def push_once(
+        self, dedup: str, msg_id: str, data: dict, lane: Optional[str] = LANE_NORMAL
+    ) -> bool:
+        """幂等入队（一次往返）：去重标记 dedup 在 DEDUP_TTL 内第一次出现才写入并排队，
+        重复时什么也不写，返回 False"""
+        keys, args = self._enqueue_args(dedup, msg_id, data, lane)
+        if not self._enqueue_once(keys=keys, args=args):
+            logger.info(f"重复入队已忽略: {msg_id}")
+            return False
         logger.info(f"队列推入: {msg_id}")
+        return True
+
+    def schedule(self, msg_id: str, lane: str = LANE_NORMAL) -> None:
+        """把已有记录放入通道排队"""
+        pipe = self.client.pipeline()
+        # 记录已过期时不补写字段（排队的 ID 取出时按已不存在处理）
+        self._update(
+            keys=[f"{MSG_PREFIX}{msg_id}"], args=schedule_fields(lane), client=pipe
+        )
+        self._stage_lane(pipe, lane, [msg_id])
+        pipe.execute()
 
     def pop(self, timeout: int = 5) -> Optional[tuple]:
         """阻塞获取消息，返回 (msg_id, data) 或 None"""
-        result = self.client.brpoplpush(Q_PENDING, Q_PROCESSING, timeout)
-        if not result:
-            return None
-        raw = self.client.get(f"{MSG_PREFIX}{result}")
-        if not raw:
-            return None
-        data = json.loads(raw)
-        data["status"] = "processing"
-        data["updated_at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
-        self.client.set(f"{MSG_PREFIX}{result}", json.dumps(data, ensure_ascii=False))
-        return result, data
+        results = self.pop_many(1, timeout)
+        return results[0] if results else None
+
+    def _claim_many(self, count: int) -> List[Tuple[str, dict]]:
+        """读出各通道的候选 ID 后一次脚本调用取出并标记（两次往返）"""
+        lanes = self.scheduler.order()
+        while True:
+            pipe = self.client.pipeline(transaction=False)
+            stage_candidates(pipe, lanes, count)
+            candidates = pipe.execute()
+            if not any(candidates):
+                return []
+            keys, args = claim_args(lanes, count, candidates)
+            claimed = self._claim(keys=keys, args=args)
+            if claimed:
+                return decode_claims(claimed)
+            # 候选被其他 worker 先取走，或记录都已过期（已丢弃）：重新读
+
+    def pop_many(self, count: int, timeout: int = 5) -> List[Tuple[str, dict]]:
+        """按通道调度取出最多 count 条消息，返回 [(msg_id, data)]；
+        所有通道都为空时在门铃上阻塞等待，最多 timeout 秒"""
+        deadline = time.monotonic() + timeout
+        while True:
+            claimed = self._claim_many(count)
+            if claimed:
+                return claimed
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return []
+            # 脚本里不能阻塞：等门铃响后重新取（可能被其他 worker 抢先，继续等）
+            self.client.blpop(DOORBELL_KEY, remaining)
+
+    def stats(self) -> dict:
+        """各通道深度、最早一条已等待秒数、累计取出条数和平均等待秒数"""
+        pipe = self.client.pipeline(transaction=False)
+        stage_lane_heads(pipe)
+        counters, *heads = pipe.execute()
+        pipe = self.client.pipeline(transaction=False)
+        oldest = stage_queued_ms(pipe, heads)
+        results = pipe.execute(raise_on_error=False) if oldest else []
+        return lane_stats(counters, head_lanes(heads, oldest, results), _now_ms())
 
     def done(self, msg_id: str) -> None:
         """标记完成"""
-        self.client.lrem(Q_PROCESSING, 1, msg_id)
-        self._update_status(msg_id, "done")
+        keys, args = finish_args(msg_id, "done")
+        self._finish(keys=keys, args=args)
 
     def error(self, msg_id: str) -> None:
         """标记失败"""
-        self.client.lrem(Q_PROCESSING, 1, msg_id)
-        self._update_status(msg_id, "error")
+        keys, args = finish_args(msg_id, "error")
+        self._finish(keys=keys, args=args)
 
     def update(self, msg_id: str, data: dict) -> None:
-        """更新消息数据"""
-        data["updated_at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
-        self.client.set(f"{MSG_PREFIX}{msg_id}", json.dumps(data, ensure_ascii=False))
+        """更新消息数据（只写入 data 中的字段）"""
+        self.update_fields(msg_id, **data)
+
+    def update_fields(self, msg_id: str, **fields) -> None:
+        """部分更新消息字段，一次往返；记录已过期时不写入"""
+        key = f"{MSG_PREFIX}{msg_id}"
+        args = update_args(fields)
+        if self._update(keys=[key], args=args) == -1:
+            # 旧版 JSON 记录：先转成 hash 再写
+            self._migrate(key)
+            self._update(keys=[key], args=args)
 
     def get(self, msg_id: str) -> Optional[dict]:
         """获取消息"""
-        raw = self.client.get(f"{MSG_PREFIX}{msg_id}")
-        return json.loads(raw) if raw else None
+        key = f"{MSG_PREFIX}{msg_id}"
+        try:
+            fields = self.client.hgetall(key)
+        except redis.ResponseError:
+            return decode_legacy(self.client.get(key))
+        return decode_fields(fields) if fields else None
+
+    def get_field(self, msg_id: str, field: str):
+        """读取单个字段（按 FIELD_TYPES 还原类型），不存在返回 None"""
+        key = f"{MSG_PREFIX}{msg_id}"
+        try:
+            value = self.client.hget(key, field)
+        except redis.ResponseError:
+            return (decode_legacy(self.client.get(key)) or {}).get(field)
+        return decode_field(field, value)
+
+    def recent(self, hours: int = 24, limit: int = 100) -> List[str]:
+        """最近 hours 小时内创建的消息 ID，最新在前；只读时间索引，不扫描 key"""
+        pipe = self.client.pipeline(transaction=False)
+        stage_recent(pipe, hours, limit)
+        return recent_ids(pipe.execute(), limit)
+
+    def get_many(self, msg_ids: List[str]) -> List[Optional[dict]]:
+        """批量获取消息（一次往返），已过期的为 None"""
+        pipe = self.client.pipeline(transaction=False)
+        stage_get_many(pipe, msg_ids)
+        records = decode_many(pipe.execute(raise_on_error=False))
+        return [
+            self.get(msg_id) if isinstance(record, Exception) else record
+            for msg_id, record in zip(msg_ids, records)
+        ]
+
+    def _migrate(self, key: str) -> None:
+        """旧版 JSON 字符串记录转为 hash"""
+        raw = self.client.get(key)
+        if not raw:
+            return
+        pipe = self.client.pipeline()
+        stage_migrate(pipe, key, raw)
+        pipe.execute()
 
     def _update_status(self, msg_id: str, status: str) -> None:
-        data = self.get(msg_id)
-        if data:
-            data["status"] = status
-            self.update(msg_id, data)
+        self._mark(keys=[f"{MSG_PREFIX}{msg_id}"], args=[status, _now()])
 
     def ping(self) -> bool:
         try:
@@ -81,5 +696,254 @@ class RedisQueue:
             return False
 
 
-# 全局实例
-rq = RedisQueue()
+class AsyncRedisQueue(QueueBase):
+    """Redis 消息队列（redis.asyncio，不阻塞事件循环），接口与 RedisQueue 相同"""
+
+    def __init__(
+        self,
+        url: str = None,
+        pool: aioredis.ConnectionPool = None,
+        schedule: str = None,
+    ):
+        """
+        Args:
+            url: Redis 连接，默认 REDIS_URL
+            pool: 共享连接池，None 时按 url 新建
+            schedule: 通道调度方式 strict / weighted，默认 QUEUE_SCHEDULE
+        """
+        if pool is None:
+            pool = aioredis.ConnectionPool.from_url(
+                url or REDIS_URL, decode_responses=True
+            )
+        super().__init__(aioredis.Redis(connection_pool=pool), schedule)
+
+    async def push(
+        self, msg_id: str, data: dict, lane: Optional[str] = LANE_NORMAL
+    ) -> None:
+        """添加消息到队列"""
+        await self.push_many([(msg_id, data)], lane)
+
+    async def push_many(
+        self, items: Iterable[Tuple[str, dict]], lane: Optional[str] = LANE_NORMAL
+    ) -> None:
+        """批量添加消息，一个事务一次往返；lane 为 None 时只写入记录不排队"""
+        items = list(items)
+        if not items:
+            return
+        pipe = self.client.pipeline()
+        self._stage_push(pipe, items, lane)
+        await pipe.execute()
+        logger.info(f"队列推入: {', '.join(msg_id for msg_id, _ in items)}")
+
+    async def push_once(
+        self, dedup: str, msg_id: str, data: dict, lane: Optional[str] = LANE_NORMAL
+    ) -> bool:
+        """幂等入队（一次往返），重复时返回 False"""
+        keys, args = self._enqueue_args(dedup, msg_id, data, lane)
+        if not await self._enqueue_once(keys=keys, args=args):
+            logger.info(f"重复入队已忽略: {msg_id}")
+            return False
+        logger.info(f"队列推入: {msg_id}")
+        return True
+
+    async def schedule(self, msg_id: str, lane: str = LANE_NORMAL) -> None:
+        """把已有记录放入通道排队"""
+        pipe = self.client.pipeline()
+        await self._update(
+            keys=[f"{MSG_PREFIX}{msg_id}"], args=schedule_fields(lane), client=pipe
+        )
+        self._stage_lane(pipe, lane, [msg_id])
+        await pipe.execute()
+
+    async def pop(self, timeout: int = 5) -> Optional[tuple]:
+        """等待获取消息，返回 (msg_id, data) 或 None"""
+        results = await self.pop_many(1, timeout)
+        return results[0] if results else None
+
+    async def _claim_many(self, count: int) -> List[Tuple[str, dict]]:
+        """读出各通道的候选 ID 后一次脚本调用取出并标记（两次往返）"""
+        lanes = self.scheduler.order()
+        while True:
+            pipe = self.client.pipeline(transaction=False)
+            stage_candidates(pipe, lanes, count)
+            candidates = await pipe.execute()
+            if not any(candidates):
+                return []
+            keys, args = claim_args(lanes, count, candidates)
+            claimed = await self._claim(keys=keys, args=args)
+            if claimed:
+                return decode_claims(claimed)
+
+    async def pop_many(self, count: int, timeout: int = 5) -> List[Tuple[str, dict]]:
+        """按通道调度取出最多 count 条消息，返回 [(msg_id, data)]；
+        所有通道都为空时在门铃上等待，最多 timeout 秒"""
+        deadline = time.monotonic() + timeout
+        while True:
+            claimed = await self._claim_many(count)
+            if claimed:
+                return claimed
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return []
+            await self.client.blpop(DOORBELL_KEY, remaining)
+
+    async def stats(self) -> dict:
+        """各通道深度、最早一条已等待秒数、累计取出条数和平均等待秒数"""
+        pipe = self.client.pipeline(transaction=False)
+        stage_lane_heads(pipe)
+        counters, *heads = await pipe.execute()
+        pipe = self.client.pipeline(transaction=False)
+        oldest = stage_queued_ms(pipe, heads)
+        results = await pipe.execute(raise_on_error=False) if oldest else []
+        return lane_stats(counters, head_lanes(heads, oldest, results), _now_ms())
+
+    async def done(self, msg_id: str) -> None:
+        """标记完成"""
+        keys, args = finish_args(msg_id, "done")
+        await self._finish(keys=keys, args=args)
+
+    async def error(self, msg_id: str) -> None:
+        """标记失败"""
+        keys, args = finish_args(msg_id, "error")
+        await self._finish(keys=keys, args=args)
+
+    async def update(self, msg_id: str, data: dict) -> None:
+        """更新消息数据（只写入 data 中的字段）"""
+        await self.update_fields(msg_id, **data)
+
+    async def update_fields(self, msg_id: str, **fields) -> None:
+        """部分更新消息字段，一次往返；记录已过期时不写入"""
+        key = f"{MSG_PREFIX}{msg_id}"
+        args = update_args(fields)
+        if await self._update(keys=[key], args=args) == -1:
+            await self._migrate(key)
+            await self._update(keys=[key], args=args)
+
+    async def get(self, msg_id: str) -> Optional[dict]:
+        """获取消息"""
+        key = f"{MSG_PREFIX}{msg_id}"
+        try:
+            fields = await self.client.hgetall(key)
+        except redis.ResponseError:
+            return decode_legacy(await self.client.get(key))
+        return decode_fields(fields) if fields else None
+
+    async def get_field(self, msg_id: str, field: str):
+        """读取单个字段（按 FIELD_TYPES 还原类型），不存在返回 None"""
+        key = f"{MSG_PREFIX}{msg_id}"
+        try:
+            value = await self.client.hget(key, field)
+        except redis.ResponseError:
+            return (decode_legacy(await self.client.get(key)) or {}).get(field)
+        return decode_field(field, value)
+
+    async def recent(self, hours: int = 24, limit: int = 100) -> List[str]:
+        """最近 hours 小时内创建的消息 ID，最新在前；只读时间索引，不扫描 key"""
+        pipe = self.client.pipeline(transaction=False)
+        stage_recent(pipe, hours, limit)
+        return recent_ids(await pipe.execute(), limit)
+
+    async def get_many(self, msg_ids: List[str]) -> List[Optional[dict]]:
+        """批量获取消息（一次往返），已过期的为 None"""
+        pipe = self.client.pipeline(transaction=False)
+        stage_get_many(pipe, msg_ids)
+        records = decode_many(await pipe.execute(raise_on_error=False))
+        return [
+            await self.get(msg_id) if isinstance(record, Exception) else record
+            for msg_id, record in zip(msg_ids, records)
+        ]
+
+    async def _migrate(self, key: str) -> None:
+        """旧版 JSON 字符串记录转为 hash"""
+        raw = await self.client.get(key)
+        if not raw:
+            return
+        pipe = self.client.pipeline()
+        stage_migrate(pipe, key, raw)
+        await pipe.execute()
+
+    async def _update_status(self, msg_id: str, status: str) -> None:
+        await self._mark(keys=[f"{MSG_PREFIX}{msg_id}"], args=[status, _now()])
+
+    async def ping(self) -> bool:
+        try:
+            return await self.client.ping()
+        except Exception:
+            return False
+
+    async def close(self) -> None:
+        """关闭连接池"""
+        await self.client.aclose(close_connection_pool=True)
+
+
+# 全局实例（首次使用时创建，不在 import 时连接）
+_queue: Optional[RedisQueue] = None
+_async_queue: Optional[AsyncRedisQueue] = None
+
+
+def get_queue() -> RedisQueue:
+    """同步队列（脚本、线程中使用），后端由 QUEUE_BACKEND 决定"""
+    global _queue
+    if _queue is None:
+        if QUEUE_BACKEND == "stream":
+            from .stream_queue import StreamQueue
+
+            _queue = StreamQueue()
+        elif QUEUE_BACKEND == "local":
+            from .local_queue import LocalQueue
+
+            _queue = LocalQueue()
+        else:
+            _queue = RedisQueue()
+    return _queue
+
+
+def get_async_queue() -> AsyncRedisQueue:
+    """异步队列，进程内共享一个连接池；应在事件循环启动后调用"""
+    global _async_queue
+    if _async_queue is None:
+        if QUEUE_BACKEND == "stream":
+            from .stream_queue import AsyncStreamQueue
+
+            _async_queue = AsyncStreamQueue()
+        elif QUEUE_BACKEND == "local":
+            from .local_queue import AsyncLocalQueue
+
+            # 与同步接口共用一个 LocalQueue（日志目录只能被一个实例打开）
+            _async_queue = AsyncLocalQueue(get_queue())
+        else:
+            _async_queue = AsyncRedisQueue()
+    return _async_queue
+
+
+def get_client() -> Optional[redis.Redis]:
+    """会话映射、回复详情等共用的同步 Redis 客户端；local 后端时为 None（内存模式）"""
+    if QUEUE_BACKEND == "local":
+        return None
+    return get_queue().client
+
+
+def require_shared_backend(process: str) -> None:
+    """bot_api / bot / kiro_handler 分进程部署时检查后端
+
+    三个进程之间要共享队列、会话映射（kiro_handler 按 pane 找回 chat）、回复详情和
+    回复台账，local 后端的日志目录只能被一个进程打开，这些状态也只在进程内存里，
+    分进程部署会丢回复；这里直接拒绝启动，而不是等到取锁失败或回复找不到归属。
+
+    Raises:
+        RuntimeError: QUEUE_BACKEND=local
+    """
+    if QUEUE_BACKEND == "local":
+        raise RuntimeError(
+            f"{process}: QUEUE_BACKEND=local 只支持单进程内使用，bot_api / bot / "
+            "kiro_handler 分进程部署需要共享的 Redis，请设置 QUEUE_BACKEND=list "
+            "或 stream"
+        )
+
+
+async def close_async_queue() -> None:
+    """关闭异步队列的连接池"""
+    global _async_queue
+    if _async_queue is not None:
+        await _async_queue.close()
+        _async_queue = None
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+已发送回复的指纹账本
+按 pane + 提交轮次 + 规范化文本计算指纹，进程内 LRU 在前，Redis（带 TTL）持久化，重启后仍能去重
+"""
+
+import hashlib
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Redis key 前缀：tts:reply:seen:<sha1>
+LEDGER_PREFIX = "tts:reply:seen:"
+# 指纹保留时间（秒）
+LEDGER_TTL = 86400
+# 进程内 LRU 容量
+LEDGER_CACHE_SIZE = 4096
+# 每个 pane 已提交的 prompt 数：tts:reply:turn → hash(win_id → 轮次)，bot 每次向 pane
+# 提交时加一。屏幕行号在 scrollback 写满后不再增长、清屏或重启 pane 后归零，
+# 不能用来区分两次相同的回复；轮次单调递增
+TURN_KEY = "tts:reply:turn"
+
+
+def normalize(text: str) -> str:
+    """合并空白，重新折行或行尾空格不同的同一回复得到相同结果"""
+    return " ".join(text.split())
+
+
+def fingerprint(win_id: str, turn: str, text: str) -> str:
+    """回复指纹"""
+    data = f"{win_id}\0{turn}\0{normalize(text)}".encode("utf-8")
+    return hashlib.sha1(data).hexdigest()
+
+
+async def advance_turn(client, win_id: str) -> None:
+    """向 pane 提交了新的 prompt（client 为 redis.asyncio 客户端，None 时忽略）"""
+    if client is None:
+        return
+    try:
+        await client.hincrby(TURN_KEY, win_id, 1)
+    except Exception as e:
+        logger.warning(f"记录提交轮次失败: {e}")
+
+
+class ReplyLedger:
+    """已发送回复的账本
+
+    查询先走进程内 LRU，未命中时用一次 SET NX EX 同时完成查询和登记，
+    每条回复都是常数时间。同一轮次里重绘或重启后重复读到的回复被跳过，
+    下一轮里内容相同的回复照常发送。Redis 不可用时只用 LRU，并以屏幕位置代替轮次。
+    Redis 读写用 redis.asyncio 客户端，不阻塞事件循环。
+    """
+
+    def __init__(
+        self, client=None, ttl: int = LEDGER_TTL, cache_size: int = LEDGER_CACHE_SIZE
+    ):
+        """
+        Args:
+            client: redis.asyncio 客户端，None 表示只在内存中记录
+            ttl: Redis 中指纹的保留时间（秒）
+            cache_size: 进程内 LRU 容量
+        """
+        self.client = client
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self._cache: OrderedDict = OrderedDict()
+
+    def _remember(self, key: str) -> None:
+        self._cache[key] = True
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def turn(self, win_id: str, position: int) -> str:
+        """pane 当前的提交轮次；没有 Redis 时退回屏幕位置"""
+        if self.client is None:
+            return f"@{position}"
+        try:
+            return await self.client.hget(TURN_KEY, win_id) or "0"
+        except Exception as e:
+            logger.warning(f"读取提交轮次失败: {e}")
+            return f"@{position}"
+
+    async def claim(self, win_id: str, position: int, text: str) -> bool:
+        """登记回复，第一次出现返回 True，已发送过返回 False
+
+        Args:
+            position: 回复在屏幕上的行号，只在没有轮次时使用
+        """
+        key = fingerprint(win_id, await self.turn(win_id, position), text)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return False
+        self._remember(key)
+        if self.client is None:
+            return True
+        try:
+            return bool(
+                await self.client.set(LEDGER_PREFIX + key, 1, nx=True, ex=self.ttl)
+            )
+        except Exception as e:
+            logger.warning(f"回复账本写入 Redis 失败: {e}")
+            return True
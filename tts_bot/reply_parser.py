@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+kiro-cli 回复解析
+逐行消费 pane 新提交的行，按提示符 / 回复 / Credits 切换状态，回复块结束时产出事件
+"""
+
+from typing import List, NamedTuple, Optional, Tuple
+
+# kiro-cli 空闲时的输入提示符
+PROMPT_PREFIX = "λ >"
+# 回复块的首行前缀
+REPLY_PREFIX = "> "
+# 回复结束后的用量统计行
+CREDITS_PREFIX = "▸ Credits:"
+
+
+def _is_boundary(stripped: str) -> bool:
+    """提示符或 Credits 行：回复块在此结束"""
+    return stripped.startswith(PROMPT_PREFIX) or stripped.startswith(CREDITS_PREFIX)
+
+
+def _advance(
+    block: Optional[List[str]], line: str
+) -> Tuple[Optional[List[str]], bool]:
+    """状态机前进一行，返回 (新的回复块, 回复块是否在此行结束)"""
+    stripped = line.strip()
+    if not stripped:
+        return block, False
+    if _is_boundary(stripped):
+        return None, True
+    if stripped.startswith(REPLY_PREFIX):
+        if block is None:
+            block = []
+        block.append(stripped[len(REPLY_PREFIX):])
+    elif block is not None:
+        # 多行回复的续行
+        block.append(line.rstrip())
+    return block, False
+
+
+class ReplyEvent(NamedTuple):
+    """一个完整的回复块"""
+
+    text: str
+    # 回复块首行的行号（见 ReplyParser.feed 的 first_line），可与 pane 一起作为回复的位置
+    line: int
+
+
+class ReplyParser:
+    """kiro-cli 回复的增量状态机
+
+    每行只处理一次，开销与新输出的行数成正比。已消费的行不会再被解析，
+    因此同一回复不会产出两次，去重不依赖屏幕上还剩下什么。
+    """
+
+    def __init__(self):
+        self._block: Optional[List[str]] = None
+        self._start = 0
+        # 已消费的行数
+        self.line_count = 0
+
+    @property
+    def in_reply(self) -> bool:
+        """是否处于未结束的回复块中"""
+        return self._block is not None
+
+    def partial(self) -> str:
+        """未结束回复块的当前内容"""
+        return "\n".join(self._block).strip() if self._block else ""
+
+    def preview(self, pending: List[str]) -> str:
+        """未结束回复块加上尚未提交的行（光标行）后的内容，不改变解析状态"""
+        block = list(self._block) if self._block is not None else None
+        for line in pending:
+            advanced, ended = _advance(block, line)
+            if ended:
+                break
+            block = advanced
+        return "\n".join(block).strip() if block else ""
+
+    def feed(
+        self, lines: List[str], first_line: Optional[int] = None
+    ) -> List[ReplyEvent]:
+        """消费新提交的行，返回其中结束的回复块
+
+        Args:
+            lines: 新提交的行
+            first_line: 第一行的行号（如 pane 的绝对行号），None 表示接着上次计数
+        """
+        if first_line is not None:
+            self.line_count = first_line - 1
+        events = []
+        for line in lines:
+            event = self._feed_line(line)
+            if event is not None:
+                events.append(event)
+        return events
+
+    def flush(self) -> List[ReplyEvent]:
+        """结束当前回复块（kiro-cli 已回到提示符，但提示符行还在光标处未提交）"""
+        event = self._finish()
+        return [event] if event is not None else []
+
+    def reset(self) -> None:
+        """丢弃未结束的回复块"""
+        self._block = None
+
+    def _feed_line(self, line: str) -> Optional[ReplyEvent]:
+        self.line_count += 1
+        started = self._block is None
+        block, ended = _advance(self._block, line)
+        if ended:
+            return self._finish()
+        if started and block is not None:
+            self._start = self.line_count
+        self._block = block
+        return None
+
+    def _finish(self) -> Optional[ReplyEvent]:
+        text = self.partial()
+        self._block = None
+        return ReplyEvent(text, self._start) if text else None
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+长回复详情存储
+完整回复按页存入 Redis list（带 TTL），"查看详情"按钮直接按页读取，
+多进程共享，重启后仍可用，内存有界
+"""
+
+import logging
+import uuid
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Redis key 前缀：tts:reply:full:<reply_id> → list[page]
+STORE_PREFIX = "tts:reply:full:"
+# 详情保留时间（秒）
+STORE_TTL = 7 * 86400
+# 每页字符数（Telegram 单条消息上限 4096，留出页码的位置）
+PAGE_SIZE = 4000
+# 单条回复最多保存的页数
+MAX_PAGES = 50
+
+
+def paginate(text: str, size: int = PAGE_SIZE) -> List[str]:
+    """按 size 分页，尽量在换行处断开；换行留在上一页末尾，各页直接拼接即还原原文"""
+    pages = []
+    while len(text) > size:
+        cut = text.rfind("\n", size // 2, size)
+        if cut == -1:
+            pages.append(text[:size])
+            text = text[size:]
+        else:
+            pages.append(text[:cut + 1])
+            text = text[cut + 1:]
+    pages.append(text)
+    return pages
+
+
+class ReplyStore:
+    """长回复详情存储"""
+
+    def __init__(self, client, ttl: int = STORE_TTL, page_size: int = PAGE_SIZE):
+        """
+        Args:
+            client: redis 客户端
+            ttl: 详情保留时间（秒）
+            page_size: 每页字符数
+        """
+        self.client = client
+        self.ttl = ttl
+        self.page_size = page_size
+
+    def save(self, text: str) -> Optional[str]:
+        """保存完整回复，返回 reply_id，失败返回 None"""
+        reply_id = uuid.uuid4().hex[:16]
+        pages = paginate(text, self.page_size)[:MAX_PAGES]
+        try:
+            pipe = self.client.pipeline()
+            pipe.rpush(STORE_PREFIX + reply_id, *pages)
+            pipe.expire(STORE_PREFIX + reply_id, self.ttl)
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"保存回复详情失败: {e}")
+            return None
+        return reply_id
+
+    def page(self, reply_id: str, index: int) -> Optional[Tuple[str, int]]:
+        """读取一页，返回 (内容, 总页数)，已过期返回 None"""
+        try:
+            pipe = self.client.pipeline()
+            pipe.lindex(STORE_PREFIX + reply_id, index)
+            pipe.llen(STORE_PREFIX + reply_id)
+            text, total = pipe.execute()
+        except Exception as e:
+            logger.error(f"读取回复详情失败: {e}")
+            return None
+        if text is None:
+            return None
+        return text, total
+
+    def text(self, reply_id: str) -> Optional[str]:
+        """读取完整回复，已过期返回 None"""
+        try:
+            pages = self.client.lrange(STORE_PREFIX + reply_id, 0, -1)
+        except Exception as e:
+            logger.error(f"读取回复详情失败: {e}")
+            return None
+        return "".join(pages) if pages else None
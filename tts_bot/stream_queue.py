@@ -0,0 +1,482 @@
+#!/usr/bin/env python3
+"""
+Redis Streams 队列后端
+消息 ID 追加到各通道的 stream，消费组内每个 worker 独立读取、显式 ack；
+worker 崩溃后，空闲超过 claim_idle 的未 ack 条目由其他 worker 用 XAUTOCLAIM 接管；
+worker 自己还没处理完的条目每次取消息时用 XCLAIM 重置空闲时间，不会被当作遗留条目接管
+"""
+
+import logging
+import os
+import socket
+from typing import Dict, List, Optional, Tuple
+
+import redis
+import redis.asyncio as aioredis
+
+from .redis_queue import (
+    ARCHIVE_KEY,
+    ARCHIVE_MAX,
+    LANE_NORMAL,
+    LANES,
+    MSG_PREFIX,
+    MSG_TTL,
+    STATS_KEY,
+    _MARK_LUA,
+    _RETIRE_LUA,
+    _WAIT_LUA,
+    _now,
+    _now_ms,
+    AsyncRedisQueue,
+    RedisQueue,
+    decode_record,
+    lane_stats,
+)
+
+logger = logging.getLogger(__name__)
+
+# stream key 与消费组
+STREAM_KEY = "tts:stream:msgs"
+STREAM_GROUP = "tts-workers"
+# stream 近似保留条数（已 ack 的旧条目由 XADD MAXLEN ~ 裁剪）
+STREAM_MAXLEN = 10000
+# 未 ack 条目空闲多久（毫秒）后可被其他 worker 接管
+CLAIM_IDLE_MS = 60000
+
+# 标记 processing，记下 stream、条目 ID 和消费者，并累计通道等待时间
+# KEYS: msg key, stats  ARGV: 时间, stream, 条目 ID, 消费者, 毫秒时间, 通道
+STREAM_CLAIM_SCRIPT = _MARK_LUA + _WAIT_LUA + """
+if redis.call('TYPE', KEYS[1]).ok == 'hash' then
+    redis.call('HSET', KEYS[1], 'stream', ARGV[2], 'stream_id', ARGV[3],
+               'consumer', ARGV[4])
+end
+record_wait(KEYS[1], KEYS[2], ARGV[6], tonumber(ARGV[5]))
+return mark(KEYS[1], 'processing', ARGV[1])
+"""
+
+# ack 记录中的 stream 条目、更新状态并归档。条目所在的 stream 由调用方查好经 KEYS 传入
+# KEYS: 条目所在 stream, msg key, 归档  ARGV: 消费组, 状态, 时间, msg_id, TTL, 归档条数
+STREAM_FINISH_SCRIPT = _MARK_LUA + _RETIRE_LUA + """
+if redis.call('TYPE', KEYS[2]).ok == 'hash' then
+    local entry_id = redis.call('HGET', KEYS[2], 'stream_id')
+    if entry_id then
+        redis.call('XACK', KEYS[1], ARGV[1], entry_id)
+    end
+end
+local record = mark(KEYS[2], ARGV[2], ARGV[3])
+if record then
+    retire(KEYS[2], ARGV[4], ARGV[2], KEYS[3], tonumber(ARGV[5]), tonumber(ARGV[6]))
+end
+return record
+"""
+
+
+def stream_key(lane: str) -> str:
+    """通道的 stream（normal 沿用 tts:stream:msgs）"""
+    return STREAM_KEY if lane == LANE_NORMAL else f"{STREAM_KEY}:{lane}"
+
+
+def claimed_entries(entries: list, records: list) -> Tuple[list, list]:
+    """按条目配对标记结果，返回 ([(msg_id, data)], [记录已不存在的 (通道, 条目 ID)])"""
+    results, stale = [], []
+    for (lane, entry_id, fields), raw in zip(entries, records):
+        data = decode_record(raw)
+        if data is None:
+            stale.append((lane, entry_id))
+        else:
+            results.append((fields["msg_id"], data))
+    return results, stale
+
+
+def held_entries(entries: list, stale: list) -> Dict[str, Tuple[str, str]]:
+    """取出的条目中仍需处理的 → {msg_id: (通道, 条目 ID)}"""
+    stale = set(stale)
+    return {
+        fields["msg_id"]: (lane, entry_id)
+        for lane, entry_id, fields in entries
+        if (lane, entry_id) not in stale
+    }
+
+
+def held_by_lane(held: Dict[str, Tuple[str, str]]) -> Dict[str, List[str]]:
+    """{msg_id: (通道, 条目 ID)} → {通道: [条目 ID]}"""
+    lanes: Dict[str, List[str]] = {}
+    for lane, entry_id in held.values():
+        lanes.setdefault(lane, []).append(entry_id)
+    return lanes
+
+
+def lane_backlog(groups: list, group: str) -> Tuple[int, Optional[str]]:
+    """XINFO GROUPS 结果 → (未投递条数, 最后投递的条目 ID)"""
+    for info in groups or []:
+        if info.get("name") == group:
+            return info.get("lag") or 0, info.get("last-delivered-id")
+    return 0, None
+
+
+def entry_ms(entry_id: str) -> int:
+    """stream 条目 ID 的毫秒时间部分（即入队时间）"""
+    return int(entry_id.split("-")[0])
+
+
+def default_consumer() -> str:
+    """默认消费者名：主机名 + 进程号"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def check_groups(results: list) -> None:
+    """XGROUP CREATE 的结果：消费组已存在（BUSYGROUP）不算错误"""
+    for result in results:
+        if isinstance(result, Exception) and "BUSYGROUP" not in str(result):
+            raise result
+
+
+class StreamQueueBase:
+    """StreamQueue / AsyncStreamQueue 共用的状态、命令参数构造和结果解析
+
+    子类只负责执行命令（同步调用或 await）。
+    """
+
+    def _setup_stream(self, consumer: str, group: str, claim_idle: int) -> None:
+        self.consumer = consumer or default_consumer()
+        self.group = group
+        self.claim_idle = claim_idle
+        self._group_ready = False
+        self._reclaim_from = {lane: "0-0" for lane in LANES}
+        # 本 worker 已取出、还没 ack 的条目：msg_id → (通道, 条目 ID)
+        self._held: Dict[str, Tuple[str, str]] = {}
+        self._stream_claim = self.client.register_script(STREAM_CLAIM_SCRIPT)
+        self._stream_finish = self.client.register_script(STREAM_FINISH_SCRIPT)
+
+    def _target(self, lane: str) -> tuple:
+        return stream_key(lane), "stream", STREAM_MAXLEN
+
+    def _stage_lane(self, pipe, lane: str, msg_ids: List[str]) -> None:
+        """把消息 ID 追加到通道的 stream"""
+        for msg_id in msg_ids:
+            pipe.xadd(
+                stream_key(lane),
+                {"msg_id": msg_id},
+                maxlen=STREAM_MAXLEN,
+                approximate=True,
+            )
+
+    def _stage_groups(self, pipe) -> None:
+        """为各通道的 stream 创建消费组（stream 不存在时一并创建）"""
+        for lane in LANES:
+            pipe.xgroup_create(stream_key(lane), self.group, id="0", mkstream=True)
+
+    def _stage_refresh(self, pipe) -> bool:
+        """重置本 worker 仍持有条目的空闲时间（pane 忙时消息可能等很久才处理完），
+        没有持有的条目时返回 False"""
+        lanes = held_by_lane(self._held)
+        for lane, entry_ids in lanes.items():
+            pipe.xclaim(
+                stream_key(lane), self.group, self.consumer, 0, entry_ids, justid=True
+            )
+        return bool(lanes)
+
+    def _reclaim_args(self, lane: str) -> tuple:
+        """XAUTOCLAIM 的位置参数"""
+        return stream_key(lane), self.group, self.consumer, self.claim_idle
+
+    def _reclaimed(self, lane: str, result: list) -> List[tuple]:
+        """XAUTOCLAIM 结果 → [(通道, 条目 ID, 字段)]，自己还持有的条目不算遗留"""
+        self._reclaim_from[lane] = result[0]
+        held = set(held_by_lane(self._held).get(lane, []))
+        entries = [
+            (lane, entry_id, fields)
+            for entry_id, fields in result[1]
+            if fields and entry_id not in held
+        ]
+        for _, _, fields in entries:
+            logger.warning(f"接管超时未确认的消息: {fields.get('msg_id')}")
+        return entries
+
+    def _read_args(self, lanes: List[str]) -> tuple:
+        """XREADGROUP 的位置参数"""
+        return self.group, self.consumer, {stream_key(lane): ">" for lane in lanes}
+
+    @staticmethod
+    def _read_entries(lanes: List[str], result: list) -> List[tuple]:
+        """XREADGROUP 结果 → [(通道, 条目 ID, 字段)]"""
+        lane_of = {stream_key(lane): lane for lane in lanes}
+        return [
+            (lane_of[stream], entry_id, fields)
+            for stream, items in result or []
+            for entry_id, fields in items
+        ]
+
+    def _on_error(self, error: redis.ResponseError) -> None:
+        if "NOGROUP" in str(error):
+            # stream 被删除后重建消费组
+            self._group_ready = False
+
+    def _claim_calls(self, entries: List[tuple]) -> List[Tuple[list, list]]:
+        """逐条 STREAM_CLAIM_SCRIPT 的 (KEYS, ARGV)"""
+        now, now_ms = _now(), _now_ms()
+        return [
+            (
+                [f"{MSG_PREFIX}{fields['msg_id']}", STATS_KEY],
+                [now, stream_key(lane), entry_id, self.consumer, now_ms, lane],
+            )
+            for lane, entry_id, fields in entries
+        ]
+
+    def _claimed(self, entries: List[tuple], records: list) -> Tuple[list, list]:
+        """标记结果 → ([(msg_id, data)], [记录已不存在、要确认掉的 (stream, 条目 ID)])，
+        其余条目记为本 worker 持有"""
+        results, stale = claimed_entries(entries, records)
+        self._held.update(held_entries(entries, stale))
+        return results, [(stream_key(lane), entry_id) for lane, entry_id in stale]
+
+    def _held_stream(self, msg_id: str) -> Optional[str]:
+        """本 worker 取出的消息条目所在的 stream，不是自己取出的返回 None"""
+        held = self._held.pop(msg_id, None)
+        return stream_key(held[0]) if held is not None else None
+
+    def _finish_args(self, stream: str, msg_id: str, status: str) -> Tuple[list, list]:
+        """STREAM_FINISH_SCRIPT 的 (KEYS, ARGV)"""
+        keys = [stream, f"{MSG_PREFIX}{msg_id}", ARCHIVE_KEY]
+        return keys, [self.group, status, _now(), msg_id, MSG_TTL, ARCHIVE_MAX]
+
+    @staticmethod
+    def _stage_group_info(pipe) -> None:
+        """各通道消费组信息和累计统计"""
+        for lane in LANES:
+            pipe.xinfo_groups(stream_key(lane))
+        pipe.hgetall(STATS_KEY)
+
+    def _stage_oldest(self, pipe, groups: list) -> list:
+        """查询各通道最早一条未投递的条目，返回 [(未投递条数, 最后投递的条目 ID)]"""
+        backlogs = [lane_backlog(info, self.group) for info in groups]
+        for lane, (_, last_id) in zip(LANES, backlogs):
+            pipe.xrange(stream_key(lane), f"({last_id or '0-0'}", "+", count=1)
+        return backlogs
+
+    @staticmethod
+    def _stream_stats(counters: dict, backlogs: list, oldest: list) -> dict:
+        lanes = [
+            (lag, entry_ms(entries[0][0]) if entries else None)
+            for (lag, _), entries in zip(backlogs, oldest)
+        ]
+        return lane_stats(counters, lanes, _now_ms())
+
+
+class StreamQueue(StreamQueueBase, RedisQueue):
+    """Redis Streams 消息队列，push / pop / done / error 与 RedisQueue 相同
+
+    每个 worker（如每个 kiro pane）用不同的 consumer 名，可水平扩展。
+    """
+
+    def __init__(
+        self,
+        url: str = None,
+        consumer: str = None,
+        group: str = STREAM_GROUP,
+        claim_idle: int = CLAIM_IDLE_MS,
+        schedule: str = None,
+    ):
+        """
+        Args:
+            url: Redis 连接，默认 REDIS_URL
+            consumer: 消费者名，默认主机名 + 进程号
+            group: 消费组
+            claim_idle: 未 ack 条目空闲多久（毫秒）后接管
+            schedule: 通道调度方式 strict / weighted
+        """
+        super().__init__(url, schedule)
+        self._setup_stream(consumer, group, claim_idle)
+
+    def _ensure_group(self) -> None:
+        if self._group_ready:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        self._stage_groups(pipe)
+        check_groups(pipe.execute(raise_on_error=False))
+        self._group_ready = True
+
+    def _refresh(self) -> None:
+        pipe = self.client.pipeline(transaction=False)
+        if self._stage_refresh(pipe):
+            pipe.execute()
+
+    def _reclaim(self, lane: str, count: int) -> List[tuple]:
+        """接管通道中最多 count 条空闲超时的未 ack 条目，返回 [(通道, 条目 ID, 字段)]"""
+        result = self.client.xautoclaim(
+            *self._reclaim_args(lane), start_id=self._reclaim_from[lane], count=count
+        )
+        return self._reclaimed(lane, result)
+
+    def _read(self, lanes: List[str], count: int, block: Optional[int]) -> List[tuple]:
+        """从通道读取新条目，返回 [(通道, 条目 ID, 字段)]"""
+        result = self.client.xreadgroup(
+            *self._read_args(lanes), count=count, block=block
+        )
+        return self._read_entries(lanes, result)
+
+    def pop_many(self, count: int, timeout: int = 5) -> List[Tuple[str, dict]]:
+        """按通道调度取出最多 count 条消息，返回 [(msg_id, data)]；
+        先接管其他 worker 遗留的条目，所有通道都为空时阻塞等待"""
+        self._ensure_group()
+        lanes = self.scheduler.order()
+        entries = []
+        try:
+            self._refresh()
+            for lane in lanes:
+                if len(entries) < count:
+                    entries += self._reclaim(lane, count - len(entries))
+            for lane in lanes:
+                if len(entries) < count:
+                    entries += self._read([lane], count - len(entries), None)
+            if not entries:
+                # 同时在所有通道上阻塞，每个通道最多返回一条
+                entries = self._read(lanes, 1, timeout * 1000)
+        except redis.ResponseError as e:
+            self._on_error(e)
+            raise
+        if not entries:
+            return []
+        pipe = self.client.pipeline(transaction=False)
+        for keys, args in self._claim_calls(entries):
+            self._stream_claim(keys=keys, args=args, client=pipe)
+        results, stale = self._claimed(entries, pipe.execute())
+        # 记录已不存在，确认掉这些条目
+        for stream, entry_id in stale:
+            self.client.xack(stream, self.group, entry_id)
+        return results
+
+    def _entry_stream(self, msg_id: str) -> str:
+        """消息条目所在的 stream：本 worker 取出的直接可知，否则读记录的 stream 字段"""
+        stream = self._held_stream(msg_id)
+        if stream is not None:
+            return stream
+        try:
+            return self.client.hget(f"{MSG_PREFIX}{msg_id}", "stream") or STREAM_KEY
+        except redis.ResponseError:
+            # 旧版 JSON 记录，没有 stream 条目
+            return STREAM_KEY
+
+    def done(self, msg_id: str) -> None:
+        """确认并标记完成"""
+        keys, args = self._finish_args(self._entry_stream(msg_id), msg_id, "done")
+        self._stream_finish(keys=keys, args=args)
+
+    def error(self, msg_id: str) -> None:
+        """确认并标记失败"""
+        keys, args = self._finish_args(self._entry_stream(msg_id), msg_id, "error")
+        self._stream_finish(keys=keys, args=args)
+
+    def stats(self) -> dict:
+        """各通道未投递条数、最早一条已等待秒数、累计取出条数和平均等待秒数"""
+        self._ensure_group()
+        pipe = self.client.pipeline(transaction=False)
+        self._stage_group_info(pipe)
+        *groups, counters = pipe.execute()
+        pipe = self.client.pipeline(transaction=False)
+        backlogs = self._stage_oldest(pipe, groups)
+        return self._stream_stats(counters, backlogs, pipe.execute())
+
+
+class AsyncStreamQueue(StreamQueueBase, AsyncRedisQueue):
+    """Redis Streams 消息队列（redis.asyncio），接口与 StreamQueue 相同"""
+
+    def __init__(
+        self,
+        url: str = None,
+        pool: aioredis.ConnectionPool = None,
+        consumer: str = None,
+        group: str = STREAM_GROUP,
+        claim_idle: int = CLAIM_IDLE_MS,
+        schedule: str = None,
+    ):
+        super().__init__(url, pool, schedule)
+        self._setup_stream(consumer, group, claim_idle)
+
+    async def _ensure_group(self) -> None:
+        if self._group_ready:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        self._stage_groups(pipe)
+        check_groups(await pipe.execute(raise_on_error=False))
+        self._group_ready = True
+
+    async def _refresh(self) -> None:
+        pipe = self.client.pipeline(transaction=False)
+        if self._stage_refresh(pipe):
+            await pipe.execute()
+
+    async def _reclaim(self, lane: str, count: int) -> List[tuple]:
+        result = await self.client.xautoclaim(
+            *self._reclaim_args(lane), start_id=self._reclaim_from[lane], count=count
+        )
+        return self._reclaimed(lane, result)
+
+    async def _read(
+        self, lanes: List[str], count: int, block: Optional[int]
+    ) -> List[tuple]:
+        result = await self.client.xreadgroup(
+            *self._read_args(lanes), count=count, block=block
+        )
+        return self._read_entries(lanes, result)
+
+    async def pop_many(self, count: int, timeout: int = 5) -> List[Tuple[str, dict]]:
+        """按通道调度取出最多 count 条消息，返回 [(msg_id, data)]；
+        先接管其他 worker 遗留的条目，所有通道都为空时等待"""
+        await self._ensure_group()
+        lanes = self.scheduler.order()
+        entries = []
+        try:
+            await self._refresh()
+            for lane in lanes:
+                if len(entries) < count:
+                    entries += await self._reclaim(lane, count - len(entries))
+            for lane in lanes:
+                if len(entries) < count:
+                    entries += await self._read([lane], count - len(entries), None)
+            if not entries:
+                entries = await self._read(lanes, 1, timeout * 1000)
+        except redis.ResponseError as e:
+            self._on_error(e)
+            raise
+        if not entries:
+            return []
+        pipe = self.client.pipeline(transaction=False)
+        for keys, args in self._claim_calls(entries):
+            await self._stream_claim(keys=keys, args=args, client=pipe)
+        results, stale = self._claimed(entries, await pipe.execute())
+        for stream, entry_id in stale:
+            await self.client.xack(stream, self.group, entry_id)
+        return results
+
+    async def _entry_stream(self, msg_id: str) -> str:
+        stream = self._held_stream(msg_id)
+        if stream is not None:
+            return stream
+        try:
+            stream = await self.client.hget(f"{MSG_PREFIX}{msg_id}", "stream")
+        except redis.ResponseError:
+            return STREAM_KEY
+        return stream or STREAM_KEY
+
+    async def done(self, msg_id: str) -> None:
+        """确认并标记完成"""
+        stream = await self._entry_stream(msg_id)
+        keys, args = self._finish_args(stream, msg_id, "done")
+        await self._stream_finish(keys=keys, args=args)
+
+    async def error(self, msg_id: str) -> None:
+        """确认并标记失败"""
+        stream = await self._entry_stream(msg_id)
+        keys, args = self._finish_args(stream, msg_id, "error")
+        await self._stream_finish(keys=keys, args=args)
+
+    async def stats(self) -> dict:
+        """各通道未投递条数、最早一条已等待秒数、累计取出条数和平均等待秒数"""
+        await self._ensure_group()
+        pipe = self.client.pipeline(transaction=False)
+        self._stage_group_info(pipe)
+        *groups, counters = await pipe.execute()
+        pipe = self.client.pipeline(transaction=False)
+        backlogs = self._stage_oldest(pipe, groups)
+        return self._stream_stats(counters, backlogs, await pipe.execute())
@@ -1,11 +1,11 @@
 #!/usr/bin/env python3
 """
 Tmux 后端抽象接口
-支持可扩展的 tmux 操作
+支持可扩展的 tmux 操作，提供同步 (TmuxBackend) 和 asyncio (AsyncTmuxBackend) 两套接口
 """
 
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import List, Optional, Tuple
 
 
 class TmuxBackend(ABC):
@@ -24,6 +24,33 @@ class TmuxBackend(ABC):
         """
         pass
 
+    @abstractmethod
+    def submit(self, text: str, win_id: str) -> bool:
+        """发送文本并回车（一次提交一条消息）
+
+        Args:
+            text: 要发送的文本（按字面量发送，不解析为按键名）
+            win_id: tmux 目标窗口 ID
+
+        Returns:
+            是否发送成功
+        """
+        pass
+
+    @abstractmethod
+    def paste_text(self, text: str, win_id: str, enter: bool = False) -> bool:
+        """经 tmux buffer 粘贴大段文本（bracketed paste）
+
+        Args:
+            text: 要粘贴的文本，可包含换行
+            win_id: tmux 目标窗口 ID
+            enter: 粘贴后是否回车
+
+        Returns:
+            是否粘贴成功
+        """
+        pass
+
     @abstractmethod
     def send_keys(self, keys: str, win_id: str) -> bool:
         """发送特殊按键到 tmux
@@ -50,6 +77,32 @@ class TmuxBackend(ABC):
         """
         pass
 
+    @abstractmethod
+    def pane_changed_since(self, win_id: str, token: str) -> Tuple[bool, str]:
+        """廉价探测 pane 自 token 之后是否变化，不捕获内容
+
+        Args:
+            win_id: tmux 目标窗口 ID
+            token: 上次返回的令牌，空字符串表示未知
+
+        Returns:
+            (是否变化, 新令牌)
+        """
+        pass
+
+    @abstractmethod
+    def capture_delta(self, win_id: str) -> List[str]:
+        """增量捕获 tmux pane，只读取上次调用之后新追加的行
+        先做一次 pane_changed_since 式的探测，没有变化时不执行 capture-pane
+
+        Args:
+            win_id: tmux 目标窗口 ID
+
+        Returns:
+            新完成的行（光标所在行在光标离开前不返回）
+        """
+        pass
+
     @abstractmethod
     def check_thinking(self, win_id: str) -> bool:
         """检测 AI 是否处于 Thinking 状态
@@ -62,6 +115,18 @@ class TmuxBackend(ABC):
         """
         pass
 
+    @abstractmethod
+    def is_idle(self, win_id: str) -> bool:
+        """检测 AI 是否空闲（已回到输入提示符）
+
+        Args:
+            win_id: tmux 目标窗口 ID
+
+        Returns:
+            是否空闲
+        """
+        pass
+
     @abstractmethod
     def get_pane_height(self, win_id: str) -> int:
         """获取当前窗格高度
@@ -96,6 +161,18 @@ class TmuxBackend(ABC):
         """
         pass
 
+    @abstractmethod
+    def pane_exists(self, win_id: str) -> bool:
+        """检查目标 pane 是否存在
+
+        Args:
+            win_id: tmux 目标窗口 ID
+
+        Returns:
+            是否存在
+        """
+        pass
+
     @abstractmethod
     def new_window(self, session: str, window: str, command: str, win_id: str) -> bool:
         """创建新窗口
@@ -122,3 +199,87 @@ class TmuxBackend(ABC):
             是否删除成功
         """
         pass
+
+
+class AsyncTmuxBackend(ABC):
+    """tmux 后端异步接口，方法与 TmuxBackend 一一对应
+
+    供事件循环中的调用方使用，实现需保证单次调用有超时、不阻塞事件循环。
+    """
+
+    @abstractmethod
+    async def send_text(self, text: str, win_id: str) -> bool:
+        """发送文本到 tmux，见 TmuxBackend.send_text"""
+        pass
+
+    @abstractmethod
+    async def submit(self, text: str, win_id: str) -> bool:
+        """发送文本并回车，见 TmuxBackend.submit"""
+        pass
+
+    @abstractmethod
+    async def paste_text(self, text: str, win_id: str, enter: bool = False) -> bool:
+        """经 tmux buffer 粘贴大段文本，见 TmuxBackend.paste_text"""
+        pass
+
+    @abstractmethod
+    async def send_keys(self, keys: str, win_id: str) -> bool:
+        """发送特殊按键到 tmux，见 TmuxBackend.send_keys"""
+        pass
+
+    @abstractmethod
+    async def capture_pane(self, win_id: str, max_rows: Optional[int] = None) -> str:
+        """捕获 tmux pane 内容，见 TmuxBackend.capture_pane"""
+        pass
+
+    @abstractmethod
+    async def pane_changed_since(self, win_id: str, token: str) -> Tuple[bool, str]:
+        """廉价探测 pane 是否变化，见 TmuxBackend.pane_changed_since"""
+        pass
+
+    @abstractmethod
+    async def capture_delta(self, win_id: str) -> List[str]:
+        """增量捕获 tmux pane，见 TmuxBackend.capture_delta"""
+        pass
+
+    @abstractmethod
+    async def check_thinking(self, win_id: str) -> bool:
+        """检测 AI 是否处于 Thinking 状态，见 TmuxBackend.check_thinking"""
+        pass
+
+    @abstractmethod
+    async def is_idle(self, win_id: str) -> bool:
+        """检测 AI 是否空闲，见 TmuxBackend.is_idle"""
+        pass
+
+    @abstractmethod
+    async def get_pane_height(self, win_id: str) -> int:
+        """获取当前窗格高度，见 TmuxBackend.get_pane_height"""
+        pass
+
+    @abstractmethod
+    async def resize_pane(self, win_id: str, height: int) -> bool:
+        """设置窗格高度，见 TmuxBackend.resize_pane"""
+        pass
+
+    @abstractmethod
+    async def tree_sessions(self) -> str:
+        """树状显示所有 session、window、pane，见 TmuxBackend.tree_sessions"""
+        pass
+
+    @abstractmethod
+    async def pane_exists(self, win_id: str) -> bool:
+        """检查目标 pane 是否存在，见 TmuxBackend.pane_exists"""
+        pass
+
+    @abstractmethod
+    async def new_window(
+        self, session: str, window: str, command: str, win_id: str
+    ) -> bool:
+        """创建新窗口，见 TmuxBackend.new_window"""
+        pass
+
+    @abstractmethod
+    async def del_window(self, win_id: str) -> bool:
+        """删除窗口，见 TmuxBackend.del_window"""
+        pass
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+tmux 控制模式 (tmux -C) 长连接客户端
+一个 socket 只保留一个 tmux 客户端进程，所有命令通过它的 stdin/stdout 多路复用
+"""
+
+import logging
+import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 单条命令默认等待时间（秒）
+COMMAND_TIMEOUT = 10.0
+
+# 连接失败后多久再尝试重连（秒），期间调用方走子进程
+RETRY_INTERVAL = 30.0
+
+
+class _Separator(str):
+    """命令分隔符的类型，用来和内容恰好是 ";" 的普通参数区分"""
+
+
+# 命令分隔符：argv 中的这个对象表示下一条命令，与 tmux 命令行的 \; 含义一致。
+# 按类型判断，普通参数（包括用户文本 ";"）一律按参数引用
+COMMAND_SEPARATOR = _Separator(";")
+
+# pane 输出通知
+_OUTPUT_PREFIXES = (b"%output ", b"%extended-output ")
+
+
+def quote_arg(arg: str) -> str:
+    """按 tmux 命令语法引用单个参数（双引号 + 转义）
+
+    tmux 对开头的 "~" 即使在双引号里也会展开成 home 目录（"~/a" → "/root/a"），
+    所以开头的 "~" 也要转义。
+    """
+    out = ['"']
+    for i, ch in enumerate(arg):
+        if ch in ('\\', '"', "$") or (ch == "~" and i == 0):
+            out.append("\\" + ch)
+        elif ch == "\n":
+            out.append("\\n")
+        elif ch == "\r":
+            out.append("\\r")
+        elif ch == "\t":
+            out.append("\\t")
+        elif ord(ch) < 0x20 or ord(ch) == 0x7F:
+            out.append("\\%03o" % ord(ch))
+        else:
+            out.append(ch)
+    out.append('"')
+    return "".join(out)
+
+
+def is_separator(arg: str) -> bool:
+    """argv 元素是否为命令分隔符"""
+    return isinstance(arg, _Separator)
+
+
+def build_command_line(args: List[str]) -> str:
+    """把 argv 转成一行控制模式命令"""
+    return " ".join(";" if is_separator(arg) else quote_arg(arg) for arg in args)
+
+
+def cli_args(args: List[str]) -> List[str]:
+    """把 argv 转成 tmux 子进程参数
+
+    tmux 命令行把以 ";" 结尾的参数拆成参数 + 分隔符（"a;" → "a" ;），
+    "\\;" 结尾才表示字面量 ";"。普通参数以 ";" 结尾时在最后的 ";" 前补一个反斜杠。
+    """
+    return [
+        arg if is_separator(arg) or not arg.endswith(";") else arg[:-1] + "\\;"
+        for arg in args
+    ]
+
+
+class _Request:
+    """一次等待响应的请求（可能包含多条以 ; 分隔的命令）"""
+
+    def __init__(self, blocks: int):
+        self.blocks = blocks
+        self.output: List[str] = []
+        self.failed = False
+        self.future: Future = Future()
+
+
+class TmuxControlClient:
+    """tmux 控制模式客户端
+
+    命令按写入顺序执行，tmux 对每条命令返回一个 %begin ... %end/%error 块，
+    因此用 FIFO 队列即可把响应与请求一一对应。块外的 % 开头行是通知
+    （%output、%window-add 等），转发给已注册的监听器。
+    """
+
+    def __init__(
+        self, socket: str = "", session: Optional[str] = None, output: bool = False
+    ):
+        """
+        Args:
+            socket: tmux socket 路径，空字符串表示默认 socket
+            session: 要附加的 session，None 表示最近使用的 session
+            output: 是否接收 %output 通知（仅命令复用时关闭以节省带宽）
+        """
+        self.socket = socket
+        self.session = session
+        self.output = output
+        self._proc: Optional[subprocess.Popen] = None
+        self._reader: Optional[threading.Thread] = None
+        self._write_lock = threading.Lock()
+        self._pending: deque = deque()
+        self._listeners: List[Callable[[str], None]] = []
+
+    @property
+    def alive(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    def start(self) -> bool:
+        """启动控制模式客户端，失败返回 False"""
+        if self.alive:
+            return True
+        cmd = ["tmux"]
+        if self.socket:
+            cmd += ["-S", self.socket]
+        cmd += ["-C", "attach-session"]
+        if self.session:
+            cmd += ["-t", self.session]
+        try:
+            self._proc = subprocess.Popen(
+                cmd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                bufsize=0,
+            )
+        except OSError as e:
+            logger.warning(f"tmux 控制模式启动失败: {e}")
+            self._proc = None
+            return False
+
+        self._reader = threading.Thread(
+            target=self._read_loop, name="tmux-control-reader", daemon=True
+        )
+        self._reader.start()
+
+        # 不让控制客户端影响窗口尺寸；按需关闭 %output
+        flags = "ignore-size" if self.output else "ignore-size,no-output"
+        _, code = self.command(["refresh-client", "-f", flags])
+        if not self.alive:
+            logger.warning("tmux 控制模式客户端已退出（可能没有可附加的 session）")
+            return False
+        if code != 0:
+            logger.debug("当前 tmux 版本不支持 refresh-client -f，忽略")
+        logger.info(f"tmux 控制模式已连接: socket={self.socket or 'default'}")
+        return True
+
+    def close(self) -> None:
+        """关闭客户端"""
+        proc = self._proc
+        if proc is None:
+            return
+        try:
+            proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            proc.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        self._proc = None
+
+    def add_listener(self, callback: Callable[[str], None]) -> None:
+        """注册通知监听器（在读线程中调用，需自行保证线程安全）"""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[str], None]) -> None:
+        """移除通知监听器"""
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def submit(self, args: List[str]) -> Future:
+        """异步发送命令，返回结果为 (stdout, returncode) 的 Future"""
+        request = _Request(sum(map(is_separator, args)) + 1)
+        line = build_command_line(args) + "\n"
+        with self._write_lock:
+            if not self.alive:
+                request.future.set_result(("tmux 控制模式未连接", 1))
+                return request.future
+            self._pending.append(request)
+            try:
+                self._proc.stdin.write(line.encode("utf-8"))
+            except OSError as e:
+                self._pending.remove(request)
+                request.future.set_result((str(e), 1))
+        return request.future
+
+    def command(
+        self, args: List[str], timeout: Optional[float] = COMMAND_TIMEOUT
+    ) -> Tuple[str, int]:
+        """同步发送命令，返回 (stdout, returncode)"""
+        future = self.submit(args)
+        try:
+            return future.result(timeout=timeout)
+        except Exception as e:
+            return f"tmux 命令超时: {e}", 1
+
+    def _read_loop(self) -> None:
+        """读取 stdout，匹配响应块并分发通知"""
+        proc = self._proc
+        in_block = False
+        ours = False
+        request: Optional[_Request] = None
+        try:
+            for raw in proc.stdout:
+                # pane 输出中的多字节字符可能被拆到两条通知里，保留原始字节由订阅方拼接
+                output = raw.startswith(_OUTPUT_PREFIXES)
+                errors = "surrogateescape" if output else "replace"
+                line = raw.decode("utf-8", errors=errors).rstrip("\n")
+                if in_block:
+                    if line.startswith(("%end ", "%error ")):
+                        in_block = False
+                        if ours and request is not None:
+                            request.blocks -= 1
+                            if line.startswith("%error "):
+                                # 出错后 tmux 跳过同一行里剩下的命令，不会再有它们的块
+                                request.failed = True
+                                request.blocks = 0
+                            if request.blocks <= 0:
+                                self._pending.popleft()
+                                output = "".join(l + "\n" for l in request.output)
+                                # 调用方超时后可能已取消 Future
+                                if not request.future.done():
+                                    request.future.set_result(
+                                        (output, 1 if request.failed else 0)
+                                    )
+                    elif ours and request is not None:
+                        request.output.append(line)
+                    continue
+
+                if line.startswith("%begin "):
+                    in_block = True
+                    # flags=1 表示该命令由本客户端发送
+                    ours = line.split()[-1] == "1"
+                    request = self._pending[0] if ours and self._pending else None
+                    continue
+
+                if line.startswith("%"):
+                    for callback in list(self._listeners):
+                        try:
+                            callback(line)
+                        except Exception as e:
+                            logger.error(f"tmux 通知处理失败: {e}")
+        except (OSError, ValueError):
+            pass
+        finally:
+            self._fail_pending("tmux 控制模式连接已断开")
+            for callback in list(self._listeners):
+                try:
+                    callback("%exit")
+                except Exception:
+                    pass
+
+    def _fail_pending(self, message: str) -> None:
+        with self._write_lock:
+            while self._pending:
+                request = self._pending.popleft()
+                if not request.future.done():
+                    request.future.set_result((message, 1))
+
+
+# 每个 socket 一个命令复用客户端
+_clients: Dict[str, TmuxControlClient] = {}
+_clients_lock = threading.Lock()
+_failed_at: Dict[str, float] = {}
+
+
+def get_control_client(socket: str = "") -> Optional[TmuxControlClient]:
+    """获取（必要时启动）指定 socket 的控制模式客户端，不可用时返回 None"""
+    with _clients_lock:
+        client = _clients.get(socket)
+        if client is not None and client.alive:
+            return client
+        if time.monotonic() - _failed_at.get(socket, -RETRY_INTERVAL) < RETRY_INTERVAL:
+            return None
+        client = TmuxControlClient(socket)
+        if not client.start():
+            client.close()
+            _failed_at[socket] = time.monotonic()
+            return None
+        _clients[socket] = client
+        return client
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+tmux 拓扑缓存
+一次 list-panes -a 构建 session/window/pane 索引，供 /tree、win_id 校验和 pane 查找使用
+"""
+
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from .tmux_control import COMMAND_SEPARATOR
+
+# 缓存最长有效期（秒）。pane_current_command 变化没有通知，靠它兜底刷新
+TOPOLOGY_TTL = 5.0
+
+# 这些控制模式通知意味着拓扑发生变化
+INVALIDATING_EVENTS = (
+    "%window-add",
+    "%window-close",
+    "%window-renamed",
+    "%unlinked-window-add",
+    "%unlinked-window-close",
+    "%unlinked-window-renamed",
+    "%layout-change",
+    "%session-changed",
+    "%session-renamed",
+    "%sessions-changed",
+    "%exit",
+)
+
+_FIELDS = (
+    "session_id",
+    "session_name",
+    "window_id",
+    "window_index",
+    "window_name",
+    "window_active",
+    "pane_id",
+    "pane_index",
+    "pane_active",
+    "pane_current_command",
+)
+LIST_FORMAT = "\t".join("#{%s}" % f for f in _FIELDS)
+LIST_ARGS = ["list-panes", "-a", "-F", LIST_FORMAT]
+
+
+class PaneInfo(NamedTuple):
+    """一个 pane 的拓扑信息"""
+
+    session_id: str
+    session_name: str
+    window_id: str
+    window_index: str
+    window_name: str
+    window_active: bool
+    pane_id: str
+    pane_index: str
+    pane_active: bool
+    pane_current_command: str
+
+    @property
+    def target(self) -> str:
+        """session:window_index.pane_index 形式的目标"""
+        return f"{self.session_name}:{self.window_index}.{self.pane_index}"
+
+
+def parse_panes(output: str) -> List[PaneInfo]:
+    """解析 list-panes -a -F LIST_FORMAT 的输出"""
+    panes = []
+    for line in output.split("\n"):
+        values = line.split("\t")
+        if len(values) != len(_FIELDS):
+            continue
+        values[5] = values[5] == "1"
+        values[8] = values[8] == "1"
+        panes.append(PaneInfo(*values))
+    return panes
+
+
+# 缓存能直接解析的目标片段：普通名字、编号、$id / @id / %id。其他写法（"=name"、
+# 含 "." 的名字、模式、{last} 之类的特殊目标）的规则由 tmux 决定，原样交给 tmux
+_PLAIN_TOKEN = re.compile(r"[$@]?[\w-]+")
+_PANE_TOKEN = re.compile(r"%?\d+")
+
+
+def _resolve_args(target: str) -> List[str]:
+    """让 tmux 解析目标、输出 pane ID 的命令
+
+    display -t 找不到目标时不报错，会退回当前 pane（"kiro:9" 得到 kiro 的活动 pane）；
+    先用找不到就报错的 capture-pane（-S 1 -E 0 不输出内容）校验目标，再 display 取 ID
+    """
+    return [
+        "capture-pane", "-p", "-t", target, "-S", "1", "-E", "0",
+        COMMAND_SEPARATOR, "display", "-p", "-t", target, "#{pane_id}",
+    ]
+
+
+def _exact(
+    panes: List[PaneInfo],
+    token: str,
+    keys: Tuple[Callable[[PaneInfo], str], ...],
+    group: Callable[[PaneInfo], str],
+) -> List[PaneInfo]:
+    """按 keys 的先后（与 tmux 相同：ID、编号、名字）精确匹配 session / window，
+    返回其中的 pane；匹配到多个 session / window 时有歧义，返回空"""
+    for key in keys:
+        matched = [p for p in panes if key(p) == token]
+        if matched:
+            return matched if len({group(p) for p in matched}) == 1 else []
+    return []
+
+
+class TmuxTopology:
+    """session → window → pane 的内存索引"""
+
+    def __init__(self, run: Callable[[List[str]], Any], ttl: float = TOPOLOGY_TTL):
+        """
+        Args:
+            run: 执行 tmux 命令的函数，返回 (stdout, returncode)；
+                为协程函数时只能用 panes_async() 加载
+            ttl: 缓存有效期（秒）
+        """
+        self._run = run
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._panes: Optional[List[PaneInfo]] = None
+        self._by_pane_id: Dict[str, PaneInfo] = {}
+        self._loaded_at = 0.0
+        self._generation = 0
+
+    def invalidate(self) -> None:
+        """丢弃缓存，下次访问时重新加载"""
+        self._generation += 1
+        self._panes = None
+
+    def on_notification(self, line: str) -> None:
+        """控制模式通知回调"""
+        if line.startswith(INVALIDATING_EVENTS):
+            self.invalidate()
+
+    def _expired(self) -> bool:
+        return (
+            self._panes is None or time.monotonic() - self._loaded_at > self.ttl
+        )
+
+    def _store(self, output: str, code: int, generation: int) -> List[PaneInfo]:
+        panes = parse_panes(output) if code == 0 else []
+        self._by_pane_id = {p.pane_id: p for p in panes}
+        self._loaded_at = time.monotonic()
+        # 加载期间收到变更通知时，本次结果只用一次
+        self._panes = panes if generation == self._generation else None
+        return panes
+
+    def panes(self) -> List[PaneInfo]:
+        """所有 pane，按 session、window、pane 顺序"""
+        with self._lock:
+            if not self._expired():
+                return self._panes
+            generation = self._generation
+            output, code = self._run(LIST_ARGS)
+            return self._store(output, code, generation)
+
+    async def panes_async(self) -> List[PaneInfo]:
+        """panes() 的异步版本，run 为协程函数时使用"""
+        if not self._expired():
+            return self._panes
+        generation = self._generation
+        output, code = await self._run(LIST_ARGS)
+        return self._store(output, code, generation)
+
+    def _lookup(self, target: str, panes: List[PaneInfo]) -> Optional[PaneInfo]:
+        """在缓存中解析 %id、@id[.pane]、session:window[.pane]，各片段都精确匹配；
+        其他写法或缓存中找不到时返回 None"""
+        if target.startswith("%"):
+            return self._by_pane_id.get(target)
+        if target.startswith("@"):
+            session = None
+            window, _, pane = target.partition(".")
+        elif ":" in target:
+            session, _, rest = target.partition(":")
+            window, _, pane = rest.partition(".")
+        else:
+            # 单独的名字在 tmux 里依次按 pane、window、session 查找，交给 tmux
+            return None
+        if not all(_PLAIN_TOKEN.fullmatch(t) for t in (session, window) if t):
+            return None
+        if pane and not _PANE_TOKEN.fullmatch(pane):
+            return None
+
+        candidates = panes
+        if session is not None:
+            candidates = _exact(
+                candidates,
+                session,
+                (lambda p: p.session_id, lambda p: p.session_name),
+                lambda p: p.session_id,
+            )
+        if window:
+            candidates = _exact(
+                candidates,
+                window,
+                (
+                    lambda p: p.window_id,
+                    lambda p: p.window_index,
+                    lambda p: p.window_name,
+                ),
+                lambda p: p.window_id,
+            )
+        else:
+            candidates = [p for p in candidates if p.window_active]
+        if pane:
+            candidates = [p for p in candidates if pane in (p.pane_index, p.pane_id)]
+        else:
+            candidates = [p for p in candidates if p.pane_active]
+        return candidates[0] if candidates else None
+
+    def _found(self, output: str, code: int) -> Optional[str]:
+        """tmux 解析目标的结果 → pane ID；已知的 pane 直接返回，
+        缓存里还没有时丢弃缓存，由调用方重新加载"""
+        lines = output.split() if code == 0 else []
+        pane_id = lines[-1] if lines else ""
+        if pane_id and pane_id not in self._by_pane_id:
+            self.invalidate()
+        return pane_id or None
+
+    def resolve(self, target: str) -> Optional[PaneInfo]:
+        """把 tmux 目标解析为 pane
+
+        %id、@id、session:window.pane 中的名字、编号和 ID 精确匹配时直接查缓存；
+        前缀、模式、"=name"、含 "." 的名字等写法以及缓存中找不到的目标，
+        原样交给 tmux 解析，与 tmux 命令实际作用的 pane 一致。
+        """
+        pane = self._lookup(target, self.panes())
+        if pane is not None:
+            return pane
+        pane_id = self._found(*self._run(_resolve_args(target)))
+        if pane_id is None:
+            return None
+        self.panes()
+        return self._by_pane_id.get(pane_id)
+
+    async def resolve_async(self, target: str) -> Optional[PaneInfo]:
+        """resolve() 的异步版本，run 为协程函数时使用"""
+        pane = self._lookup(target, await self.panes_async())
+        if pane is not None:
+            return pane
+        pane_id = self._found(*await self._run(_resolve_args(target)))
+        if pane_id is None:
+            return None
+        await self.panes_async()
+        return self._by_pane_id.get(pane_id)
+
+    def render_tree(self, panes: Optional[List[PaneInfo]] = None) -> str:
+        """树状显示所有 session、window、pane"""
+        if panes is None:
+            panes = self.panes()
+        tree: Dict[str, Dict[Tuple[str, str], List[PaneInfo]]] = {}
+        for p in panes:
+            windows = tree.setdefault(p.session_name, {})
+            windows.setdefault((p.window_index, p.window_name), []).append(p)
+
+        if not tree:
+            return "没有运行中的 session"
+
+        lines = []
+        for i, (session, windows) in enumerate(tree.items()):
+            is_last_session = i == len(tree) - 1
+            prefix = "└──" if is_last_session else "├──"
+            lines.append(f"{prefix} {session}")
+            indent = "    " if is_last_session else "│   "
+
+            for j, ((win_idx, win_name), panes) in enumerate(windows.items()):
+                is_last_win = j == len(windows) - 1
+                win_prefix = "└──" if is_last_win else "├──"
+                lines.append(f"{indent}{win_prefix} {win_idx} {win_name}")
+                pane_indent = "    " if is_last_win else "│   "
+
+                for k, pane in enumerate(panes):
+                    pane_prefix = "└──" if k == len(panes) - 1 else "├──"
+                    lines.append(
+                        f"{indent}{pane_indent}{pane_prefix} {pane.target} "
+                        f"{pane.pane_current_command}"
+                    )
+
+        return "\n".join(lines)
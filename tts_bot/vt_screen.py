@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+VT100 屏幕模型
+由 pane 的原始输出驱动，在内存中维护屏幕、光标和滚动历史，
+按光标离开的行提交已完成的逻辑行（自动折行的多行合并为一行）
+"""
+
+import re
+import unicodedata
+from collections import deque
+from typing import List, Optional, Tuple
+
+# 滚动历史行数（与 tmux history-limit 默认值一致）
+SCROLLBACK = 2000
+TAB_WIDTH = 8
+# 未结束的转义序列最多缓存的长度，超过视为垃圾数据丢弃
+MAX_PENDING = 4096
+
+_TOKEN = re.compile(
+    r"\x1b\[([?>=!]?)([0-9;:]*)[ -/]*([@-~])"  # CSI
+    r"|\x1b\][^\x07\x1b]*(?:\x07|\x1b\\)"  # OSC（标题等）
+    r"|\x1b[P^_X][^\x1b]*\x1b\\"  # DCS / PM / APC / SOS
+    r"|\x1b[()*+#%][0-~]"  # 字符集选择等
+    r"|\x1b([78=>DEHMNOZc\\])"  # 两字节转义
+    r"|([\x00-\x1a\x1c-\x1f\x7f])"  # 控制字符
+    r"|([^\x00-\x1f\x7f]+)"  # 可打印文本
+)
+# 在数据末尾被截断的转义序列，留到下一段输出再解析
+_INCOMPLETE = re.compile(
+    r"\x1b(?:\[[?>=!]?[0-9;:]*[ -/]*|\][^\x07]*|[P^_X].*|[()*+#%])?\Z", re.S
+)
+# 变化检测时忽略的 spinner 字符（braille 点阵、转圈符号）
+_SPINNER = re.compile("[\u2800-\u28ff\u25d0-\u25d3\u25f4-\u25f7]")
+# 切换备用屏幕的私有模式
+_ALT_SCREEN_MODES = (47, 1047, 1049)
+
+
+def char_width(ch: str) -> int:
+    """字符占用的列数：组合字符 0，全角 / 宽字符 2"""
+    if unicodedata.combining(ch) or ch in "\u200b\u200c\u200d\ufe0e\ufe0f":
+        return 0
+    return 2 if unicodedata.east_asian_width(ch) in "WF" else 1
+
+
+class VTScreen:
+    """单个 pane 的终端屏幕
+
+    buffer 的每个单元格是一个字符，宽字符的第二格是空串。wrapped[y] 表示第 y 行
+    因自动折行延续到下一行。行号分两种：屏幕行（0..rows-1）和绝对行号
+    （= 滚出屏幕的行数 + 屏幕行，与 tmux 的 history_size + cursor_y 对应）。
+    """
+
+    def __init__(self, cols: int = 80, rows: int = 24, scrollback: int = SCROLLBACK):
+        self.cols = max(1, cols)
+        self.rows = max(1, rows)
+        self.history: deque = deque(maxlen=scrollback)
+        # 屏幕第 0 行的绝对行号
+        self.scrolled = 0
+        # 第一个尚未提交的绝对行号
+        self.next_line = 0
+        self._signature: Optional[Tuple[int, List[str]]] = None
+        self._pending = ""
+        self.reset()
+
+    def reset(self) -> None:
+        """清屏并复位光标、滚动区域和模式（ESC c）"""
+        self.buffer = [self._blank() for _ in range(self.rows)]
+        self.wrapped = [False] * self.rows
+        self.x = 0
+        self.y = 0
+        self.top = 0
+        self.bottom = self.rows - 1
+        self._wrap_pending = False
+        self._saved = (0, 0)
+        # 进入备用屏幕时保存的主屏幕
+        self._main: Optional[tuple] = None
+
+    def restore(
+        self, rows: List[str], cursor_x: int, cursor_y: int, history_size: int
+    ) -> None:
+        """用 capture-pane 的内容和光标位置重建屏幕，光标之前的行视为已提交"""
+        self.reset()
+        for y, row in enumerate(rows[: self.rows]):
+            self.x, self.y = 0, y
+            self._write(self._clip(row))
+            self._wrap_pending = False
+            self.wrapped[y] = False
+        self.x = min(max(cursor_x, 0), self.cols - 1)
+        self.y = min(max(cursor_y, 0), self.rows - 1)
+        self.scrolled = history_size
+        self.next_line = self.scrolled + self.y
+        self._signature = None
+
+    # ---------- 输入 ----------
+
+    def feed(self, data: str) -> None:
+        """解析一段终端输出"""
+        data = self._pending + data
+        self._pending = ""
+        pos = 0
+        while pos < len(data):
+            m = _TOKEN.match(data, pos)
+            if m is None:
+                if _INCOMPLETE.match(data, pos) and len(data) - pos < MAX_PENDING:
+                    self._pending = data[pos:]
+                    return
+                # 无法识别的转义，跳过 ESC
+                pos += 1
+                continue
+            pos = m.end()
+            private, params, final, esc, control, text = m.groups()
+            if text is not None:
+                self._write(text)
+            elif control is not None:
+                self._control(control)
+            elif final is not None:
+                self._csi(private, params, final)
+            elif esc is not None:
+                self._esc(esc)
+
+    def _clip(self, text: str) -> str:
+        """截取不超过一行宽度的前缀"""
+        width = 0
+        for i, ch in enumerate(text):
+            width += char_width(ch)
+            if width > self.cols:
+                return text[:i]
+        return text
+
+    def _blank(self) -> List[str]:
+        return [" "] * self.cols
+
+    def _write(self, text: str) -> None:
+        for ch in text:
+            width = char_width(ch)
+            if width == 0:
+                # 组合字符附加到前一个单元格
+                x = self.x if self._wrap_pending else self.x - 1
+                if x >= 0:
+                    self.buffer[self.y][x] += ch
+                continue
+            if self._wrap_pending or (width == 2 and self.x == self.cols - 1):
+                if not self._wrap_pending:
+                    self.buffer[self.y][self.x] = " "
+                self._wrap()
+            row = self.buffer[self.y]
+            # 覆盖宽字符的一半时，另一半变成空格
+            if row[self.x] == "" and self.x > 0:
+                row[self.x - 1] = " "
+            end = self.x + width
+            if end < self.cols and row[end] == "":
+                row[end] = " "
+            row[self.x] = ch
+            if width == 2 and self.x + 1 < self.cols:
+                row[self.x + 1] = ""
+            if end >= self.cols:
+                self.x = self.cols - 1
+                self._wrap_pending = True
+            else:
+                self.x = end
+
+    def _wrap(self) -> None:
+        """自动折行"""
+        self.wrapped[self.y] = True
+        self.x = 0
+        self._wrap_pending = False
+        self._linefeed()
+
+    def _linefeed(self) -> None:
+        self._wrap_pending = False
+        if self.y == self.bottom:
+            self._scroll_up(1)
+        elif self.y < self.rows - 1:
+            self.y += 1
+
+    def _scroll_up(self, n: int, to_history: bool = True) -> None:
+        """滚动区域上滚 n 行，主屏幕上滚出区域的行进入历史（与 tmux 一致）"""
+        n = min(n, self.bottom - self.top + 1)
+        save = to_history and self._main is None
+        for _ in range(n):
+            row = self.buffer.pop(self.top)
+            wrapped = self.wrapped.pop(self.top)
+            if save:
+                self.history.append(self._row_text(row, wrapped))
+                self.scrolled += 1
+            self.buffer.insert(self.bottom, self._blank())
+            self.wrapped.insert(self.bottom, False)
+
+    def _scroll_down(self, n: int) -> None:
+        n = min(n, self.bottom - self.top + 1)
+        for _ in range(n):
+            self.buffer.pop(self.bottom)
+            self.wrapped.pop(self.bottom)
+            self.buffer.insert(self.top, self._blank())
+            self.wrapped.insert(self.top, False)
+
+    def _control(self, ch: str) -> None:
+        if ch == "\r":
+            self.x = 0
+            self._wrap_pending = False
+        elif ch in "\n\x0b\x0c":
+            self._linefeed()
+        elif ch == "\b":
+            self.x = max(0, self.x - 1)
+            self._wrap_pending = False
+        elif ch == "\t":
+            self.x = min(self.cols - 1, (self.x // TAB_WIDTH + 1) * TAB_WIDTH)
+
+    def _esc(self, ch: str) -> None:
+        if ch == "7":
+            self._saved = (self.x, self.y)
+        elif ch == "8":
+            self._move(*self._saved)
+        elif ch == "D":
+            self._linefeed()
+        elif ch == "E":
+            self.x = 0
+            self._linefeed()
+        elif ch == "M":
+            # 反向换行
+            self._wrap_pending = False
+            if self.y == self.top:
+                self._scroll_down(1)
+            elif self.y > 0:
+                self.y -= 1
+        elif ch == "c":
+            self.reset()
+
+    def _move(self, x: int, y: int) -> None:
+        self.x = min(max(x, 0), self.cols - 1)
+        self.y = min(max(y, 0), self.rows - 1)
+        self._wrap_pending = False
+
+    def _csi(self, private: str, params: str, final: str) -> None:
+        args = [int(p) if p else 0 for p in params.replace(":", ";").split(";")]
+
+        def arg(i: int, default: int = 1) -> int:
+            return (args[i] if i < len(args) else 0) or default
+
+        if private == "?":
+            if final in "hl" and any(a in _ALT_SCREEN_MODES for a in args):
+                self._alt_screen(final == "h")
+            return
+        if private:
+            return
+
+        row = self.buffer[self.y]
+        if final == "A":
+            self._move(self.x, self.y - arg(0))
+        elif final in "Be":
+            self._move(self.x, self.y + arg(0))
+        elif final in "Ca":
+            self._move(self.x + arg(0), self.y)
+        elif final == "D":
+            self._move(self.x - arg(0), self.y)
+        elif final == "E":
+            self._move(0, self.y + arg(0))
+        elif final == "F":
+            self._move(0, self.y - arg(0))
+        elif final in "G`":
+            self._move(arg(0) - 1, self.y)
+        elif final == "d":
+            self._move(self.x, arg(0) - 1)
+        elif final in "Hf":
+            self._move(arg(1) - 1, arg(0) - 1)
+        elif final == "J":
+            self._erase_display(arg(0, 0))
+        elif final == "K":
+            mode = arg(0, 0)
+            start, end = {0: (self.x, self.cols), 1: (0, self.x + 1)}.get(
+                mode, (0, self.cols)
+            )
+            row[start:end] = [" "] * (end - start)
+            if mode != 1:
+                self.wrapped[self.y] = False
+        elif final == "X":
+            end = min(self.cols, self.x + arg(0))
+            row[self.x:end] = [" "] * (end - self.x)
+        elif final == "P":
+            n = min(arg(0), self.cols - self.x)
+            del row[self.x:self.x + n]
+            row.extend([" "] * n)
+        elif final == "@":
+            n = min(arg(0), self.cols - self.x)
+            row[self.x:self.x] = [" "] * n
+            del row[self.cols:]
+        elif final in "LM" and self.top <= self.y <= self.bottom:
+            top, self.top = self.top, self.y
+            if final == "L":
+                self._scroll_down(arg(0))
+            else:
+                self._scroll_up(arg(0), to_history=False)
+            self.top = top
+            self.x = 0
+        elif final == "S":
+            self._scroll_up(arg(0))
+        elif final == "T":
+            self._scroll_down(arg(0))
+        elif final == "r":
+            top, bottom = arg(0) - 1, arg(1, self.rows) - 1
+            if 0 <= top < bottom < self.rows:
+                self.top, self.bottom = top, bottom
+                self._move(0, 0)
+        elif final == "s":
+            self._saved = (self.x, self.y)
+        elif final == "u":
+            self._move(*self._saved)
+
+    def _erase_display(self, mode: int) -> None:
+        if mode == 0:
+            self.buffer[self.y][self.x:] = [" "] * (self.cols - self.x)
+            for y in range(self.y + 1, self.rows):
+                self.buffer[y] = self._blank()
+                self.wrapped[y] = False
+        elif mode == 1:
+            for y in range(self.y):
+                self.buffer[y] = self._blank()
+                self.wrapped[y] = False
+            self.buffer[self.y][: self.x + 1] = [" "] * (self.x + 1)
+        elif mode == 2:
+            # 和 tmux 的 scroll-on-clear 一样，清屏前把内容推入历史，绝对行号保持递增
+            used = max(
+                (y + 1 for y in range(self.rows) if "".join(self.buffer[y]).strip()),
+                default=0,
+            )
+            if used and self._main is None:
+                top, bottom = self.top, self.bottom
+                self.top, self.bottom = 0, self.rows - 1
+                self._scroll_up(used)
+                self.top, self.bottom = top, bottom
+            self.buffer = [self._blank() for _ in range(self.rows)]
+            self.wrapped = [False] * self.rows
+        elif mode == 3:
+            self.history.clear()
+
+    def _alt_screen(self, enter: bool) -> None:
+        if enter and self._main is None:
+            self._main = (self.buffer, self.wrapped, self.x, self.y)
+            self.buffer = [self._blank() for _ in range(self.rows)]
+            self.wrapped = [False] * self.rows
+        elif not enter and self._main is not None:
+            self.buffer, self.wrapped, x, y = self._main
+            self._main = None
+            self._move(x, y)
+
+    # ---------- 读取 ----------
+
+    @staticmethod
+    def _row_text(cells: List[str], wrapped: bool) -> Tuple[str, bool]:
+        text = "".join(cells)
+        # 折行的行末空格是真实内容
+        return (text if wrapped else text.rstrip()), wrapped
+
+    def _row(self, line: int) -> Tuple[str, bool]:
+        """绝对行号对应的行文本和折行标记"""
+        if line >= self.scrolled:
+            y = line - self.scrolled
+            return self._row_text(self.buffer[y], self.wrapped[y])
+        return self.history[line - (self.scrolled - len(self.history))]
+
+    def _join(self, start: int, end: int) -> Tuple[List[str], int]:
+        """把 [start, end) 的行合并为逻辑行，返回 (完整的逻辑行, 未完成部分的起始行号)"""
+        lines: List[str] = []
+        parts: List[str] = []
+        line_start = start
+        for line in range(start, end):
+            text, wrapped = self._row(line)
+            parts.append(text)
+            if not wrapped:
+                lines.append("".join(parts))
+                parts = []
+                line_start = line + 1
+        return lines, line_start
+
+    def take_committed(self) -> Tuple[List[str], int]:
+        """取出光标已离开的逻辑行，返回 (行, 第一行的绝对行号)
+
+        光标上移（重绘）时回退提交位置，重绘的行在光标再次离开后重新提交。
+        """
+        if self._main is not None:
+            return [], self.next_line
+        cursor = self.scrolled + self.y
+        start = max(self.next_line, self.scrolled - len(self.history))
+        if cursor < start:
+            self.next_line = cursor
+            return [], cursor
+        lines, self.next_line = self._join(start, cursor)
+        return lines, start
+
+    def tail(self) -> List[str]:
+        """尚未提交的逻辑行（到光标所在行为止）"""
+        if self._main is not None:
+            return []
+        start = max(self.next_line, self.scrolled - len(self.history))
+        end = self.scrolled + self.y + 1
+        lines, line_start = self._join(start, end)
+        if line_start < end:
+            lines.append("".join(self._row(n)[0] for n in range(line_start, end)))
+        return lines
+
+    def changed(self) -> bool:
+        """与上次调用相比内容是否有变化
+
+        比较光标所在的绝对行号和未提交行（去掉 spinner 字符），
+        所以 Thinking 等动画在原地重绘不算变化。
+        """
+        signature = (
+            self.scrolled + self.y,
+            [_SPINNER.sub("", line).rstrip() for line in self.tail()],
+        )
+        if signature == self._signature:
+            return False
+        self._signature = signature
+        return True
+
+    def text(self, max_rows: Optional[int] = None) -> str:
+        """当前屏幕的文本，与 capture-pane -p 一致；max_rows 截取最后几行"""
+        lines = "\n".join(
+            "".join(row).rstrip() for row in self.buffer
+        ).rstrip().split("\n")
+        if max_rows and len(lines) > max_rows:
+            lines = lines[-max_rows:]
+        return "\n".join(lines)